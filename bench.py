@@ -0,0 +1,480 @@
+import sys
+import getopt
+import os
+import io
+import json
+import time
+import socket
+import shutil
+import platform
+import tempfile
+import subprocess
+import contextlib
+import utils
+import session
+import client
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: bench.py - transfer benchmark for GET/SEND/GETALL over loopback
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+FUNCTIONS:
+    void main (void)
+    int parseSize(string : text)
+    Popen startServer(string : root, int : bufferSize)
+    void stopServer(Popen : server)
+    float serverCpu(Popen : server)
+    void makeFiles(string : filesDir, int : size, int : count, string : prefix)
+    void stampFile(string : path)
+    socket connect(bool : useSession)
+    dict runCell(socket : channel, string : op, int : size, int : count, int : repeat, dict : options, Popen : server)
+    dict percentiles(list : samples)
+
+GLOBAL CONSTANTS:
+    string DEFAULT_SIZES='1K,1M,64M' : file sizes benchmarked when -S isn't given
+    string DEFAULT_COUNTS='1,100' : files per command batch when -c isn't given
+    string DEFAULT_BUFFERS='8K,256K' : buffer sizes benchmarked when -b isn't given
+    int SPARSE_SIZE=268435456 : files bigger than this (256mb) are made sparse instead of filled with random bytes
+    int MAX_CELL_BYTES=1073741824 : a cell stops repeating once it has moved this much (1gb), so 10G runs once
+    float SERVER_START_TIMEOUT=10 : seconds to wait for the server to listen
+
+NOTES:
+    Starts server.py as a subprocess in a temp dir, drives it with the client's own handleGet/handleSend/handleList
+    from this process over loopback, and prints 1 json line per benchmark cell to stdout, eg
+        {"op": "GET", "size": 1048576, "count": 100, "buffer": 8192, "mbps": ..., "latency_ms": {"p50": ...},
+         "cpu_s_per_gb": {"client": ..., "server": ...}, ...}
+    so runs can be saved & diffed for regressions. Progress goes to stderr.
+
+    The matrix is every buffer size x file size x file count, for each of GET, SEND and GETALL. The server
+    is restarted for each buffer size (see server -b). Each cell runs the batch -r times: a GET or SEND batch
+    is count commands of 1 file each, a GETALL batch lists count files. Latency is per command.
+    CPU time is read from /proc for the server, so the server column is null on platforms without it.
+
+    Every SEND file gets a fresh 16 byte stamp first, so the server's dedup store can't skip the upload.
+    A command that doesn't save or send its file doesn't count towards the bytes moved, it's counted in the
+    cell's "failed" by status instead, so a broken run shows up as failures rather than as fast transfers.
+    The temp dir is removed at the end. Ports 7005/7006 must be free.
+
+    usage: python bench.py [-S 1K,1M,10G] [-c 1,100] [-b 8K,256K] [-r 3] [-s] [-n <streams>] [-z <zlib|lzma>] [-p]
+-------------------------------------------------------------------------------------------------------
+"""
+
+DEFAULT_SIZES='1K,1M,64M'
+DEFAULT_COUNTS='1,100'
+DEFAULT_BUFFERS='8K,256K'
+SPARSE_SIZE=268435456
+MAX_CELL_BYTES=1073741824
+SERVER_START_TIMEOUT=10
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION main
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def main():
+
+ARGUMENTS: void
+
+RETURNS: void
+
+NOTES:
+Entry point of the benchmark. Reads the matrix from the commandline, runs every cell and prints its result.
+-s, -n and -z are passed on to the client like in client.py, and -p like the client's -S (sparse transfers,
+-S here is the sizes).
+----------------------------------------------------------------------------------------------
+"""
+def main():
+    help_msg=sys.argv[0] + ' [-S <sizes>] [-c <counts>] [-b <buffers>] [-r <repeat>] [-s] [-n <streams>] [-z <zlib|lzma>] [-p]'
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],'S:c:b:r:sn:z:p',['sizes=','counts=','buffers=','repeat=','session','streams=','compress=','sparse'])
+        sizes = [parseSize(size) for size in DEFAULT_SIZES.split(',')]
+        counts = [int(count) for count in DEFAULT_COUNTS.split(',')]
+        buffers = [parseSize(size) for size in DEFAULT_BUFFERS.split(',')]
+        repeat = 3
+        useSession = False
+        options = {}
+        for opt, arg in opts:
+            if opt in ('-S', '--sizes'):
+                sizes = [parseSize(size) for size in arg.split(',')]
+            elif opt in ('-c', '--counts'):
+                counts = [int(count) for count in arg.split(',')]
+            elif opt in ('-b', '--buffers'):
+                buffers = [parseSize(size) for size in arg.split(',')]
+            elif opt in ('-r', '--repeat'):
+                repeat = int(arg)
+            elif opt in ('-s', '--session'):
+                useSession = True
+            elif opt in ('-n', '--streams'):
+                options['streams'] = int(arg)
+            elif opt in ('-z', '--compress'):
+                options['compress'] = arg
+            elif opt in ('-p', '--sparse'):
+                options['sparse'] = True
+    except (getopt.GetoptError, ValueError):
+        print(help_msg)
+        sys.exit(2)
+
+    root = tempfile.mkdtemp(prefix='tcpbench')
+    serverRoot = os.path.join(root, 'server')
+    clientRoot = os.path.join(root, 'client')
+    os.makedirs(os.path.join(serverRoot, 'files'))
+    os.makedirs(os.path.join(clientRoot, 'files'))
+    startDir = os.getcwd()
+    os.chdir(clientRoot)
+    env = {'python': platform.python_version(), 'platform': platform.platform(), 'time': int(time.time()),
+           'session': useSession, 'options': options}
+    try:
+        for bufferSize in buffers:
+            utils.setBufferSize(bufferSize)
+            server = startServer(serverRoot, bufferSize)
+            channel = None
+            try:
+                channel = connect(useSession)
+                for size in sizes:
+                    for count in counts:
+                        makeFiles(os.path.join(serverRoot, 'files'), size, count, 'get')
+                        makeFiles('./files', size, count, 'send')
+                        for op in ('GET', 'SEND', 'GETALL'):
+                            print('bench', op, size, 'bytes x', count, 'buffer', bufferSize, file=sys.stderr)
+                            result = runCell(channel, op, size, count, repeat, options, server)
+                            result.update({'buffer': bufferSize, 'env': env})
+                            print(json.dumps(result), flush=True)
+                        for filesDir in (os.path.join(serverRoot, 'files'), './files'):
+                            shutil.rmtree(filesDir)
+                            os.makedirs(filesDir)
+            finally:
+                if isinstance(channel, session.Session):
+                    channel.shutdown()
+                    channel = channel.controlSocket
+                if channel:
+                    channel.close()
+                stopServer(server)
+    except KeyboardInterrupt:
+        print('\nexit called.', file=sys.stderr)
+    finally:
+        os.chdir(startDir)
+        shutil.rmtree(root, ignore_errors=True)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION parseSize
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def parseSize(text):
+
+ARGUMENTS:
+    string text : size like 512, 1K, 64M or 10G (powers of 1024)
+
+RETURNS: int - size in bytes
+----------------------------------------------------------------------------------------------
+"""
+def parseSize(text):
+    text = text.strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION startServer
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def startServer(root, bufferSize):
+
+ARGUMENTS:
+    string root : dir to run the server in, its ./files is what gets served
+    int bufferSize : passed to the server as -b
+
+RETURNS: Popen - the running server
+
+THROWS
+    RuntimeError if the server isn't listening within SERVER_START_TIMEOUT seconds
+
+NOTES:
+    Runs server.py from this checkout with its output thrown away, and waits until it accepts connections.
+----------------------------------------------------------------------------------------------
+"""
+def startServer(root, bufferSize):
+    serverPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    server = subprocess.Popen([sys.executable, serverPath, '-b', str(bufferSize)], cwd=root,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', utils.SERVER_COMM_PORT), timeout=1).close()
+            return server
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.05)
+    stopServer(server)
+    raise RuntimeError('bench server did not start, is port %d free?' % utils.SERVER_COMM_PORT)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION stopServer
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def stopServer(server):
+
+ARGUMENTS:
+    Popen server : server started by startServer
+
+RETURNS: void
+----------------------------------------------------------------------------------------------
+"""
+def stopServer(server):
+    server.terminate()
+    try:
+        server.wait(5)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION serverCpu
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def serverCpu(server):
+
+ARGUMENTS:
+    Popen server : running server
+
+RETURNS: float - user + system cpu seconds the server has used, None where /proc isn't available
+----------------------------------------------------------------------------------------------
+"""
+def serverCpu(server):
+    try:
+        with open('/proc/%d/stat' % server.pid) as file:
+            fields = file.read().rpartition(')')[2].split()
+    except OSError:
+        return None
+    # utime & stime are fields 14 & 15 of the stat line, counted from after the command name
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION makeFiles
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def makeFiles(filesDir, size, count, prefix):
+
+ARGUMENTS:
+    string filesDir : dir to create the files in
+    int size : bytes per file
+    int count : number of files
+    string prefix : names are <prefix><i>.bin
+
+RETURNS: void
+
+NOTES:
+    Files up to SPARSE_SIZE are random bytes, so compression & dedup behave like on real data.
+    Bigger files are sparse (a stamp then a hole), so a 10G file costs no disk or time to make.
+----------------------------------------------------------------------------------------------
+"""
+def makeFiles(filesDir, size, count, prefix):
+    for i in range(count):
+        path = os.path.join(filesDir, '%s%d.bin' % (prefix, i))
+        with open(path, 'wb') as file:
+            if size > SPARSE_SIZE:
+                file.truncate(size)
+            else:
+                file.write(os.urandom(size))
+        stampFile(path)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION stampFile
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def stampFile(path):
+
+ARGUMENTS:
+    string path : file to change
+
+RETURNS: void
+
+NOTES:
+    Overwrites the first 16 bytes (fewer for a smaller file) with random ones, giving the file new content.
+----------------------------------------------------------------------------------------------
+"""
+def stampFile(path):
+    with open(path, 'r+b') as file:
+        file.write(os.urandom(min(16, os.path.getsize(path))))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION connect
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def connect(useSession):
+
+ARGUMENTS:
+    bool useSession : switch the connection to a multiplexed session
+
+RETURNS: socket - control socket, or a session.ClientSession, to pass to the client's handlers
+----------------------------------------------------------------------------------------------
+"""
+def connect(useSession):
+    controlSocket = utils.createTcpSocket(role=utils.CONTROL)
+    controlSocket.connect(('127.0.0.1', utils.SERVER_COMM_PORT))
+    if useSession:
+        return session.ClientSession(controlSocket)
+    return controlSocket
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runCell
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def runCell(channel, op, size, count, repeat, options, server):
+
+ARGUMENTS:
+    socket channel : connected control socket or session
+    string op : GET, SEND or GETALL
+    int size : bytes per file
+    int count : files per batch
+    int repeat : batches to run, fewer once MAX_CELL_BYTES have been moved
+    dict options : client transfer options
+    Popen server : running server, for its cpu time
+
+RETURNS: dict - results of the cell
+
+NOTES:
+    Times every command on its own for the latency percentiles, and the whole cell for throughput &
+    cpu. The client's prints are swallowed so they don't skew the timings or the output.
+    Only files the client saved or sent count as moved. Any other status is counted under 'failed'.
+----------------------------------------------------------------------------------------------
+"""
+def runCell(channel, op, size, count, repeat, options, server):
+    latencies = []
+    failed = {}
+    moved = 0
+    batches = 0
+    serverStart = serverCpu(server)
+    cpuStart = time.process_time()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) as swallowed:
+        while batches < repeat and (batches == 0 or moved < MAX_CELL_BYTES):
+            if op == 'GETALL':
+                began = time.perf_counter()
+                client.handleList(channel)
+                latencies.append(time.perf_counter() - began)
+            for i in range(count if op != 'GETALL' else 0):
+                if op == 'SEND':
+                    stampFile('./files/send%d.bin' % i)
+                began = time.perf_counter()
+                if op == 'GET':
+                    status = client.handleGet(channel, 'get%d.bin' % i, options)['status']
+                else:
+                    status = client.handleSend(channel, 'send%d.bin' % i, options)['status']
+                latencies.append(time.perf_counter() - began)
+                if status in ('saved', 'sent'):
+                    moved += size
+                else:
+                    failed[status] = failed.get(status, 0) + 1
+            batches += 1
+            swallowed.seek(0)
+            swallowed.truncate()
+    elapsed = time.perf_counter() - start
+    clientCpu = time.process_time() - cpuStart
+    serverEnd = serverCpu(server)
+
+    gigabytes = moved / (1 << 30)
+    result = {'op': op, 'size': size, 'count': count, 'repeat': batches, 'bytes': moved,
+              'seconds': round(elapsed, 6), 'commands': len(latencies), 'failed': failed,
+              'latency_ms': percentiles(latencies),
+              'cpu_s': {'client': round(clientCpu, 6),
+                        'server': None if serverStart is None else round(serverEnd - serverStart, 6)}}
+    if moved:
+        result['mbps'] = round(moved / elapsed / 1e6, 3)
+        result['cpu_s_per_gb'] = {side: None if cpu is None else round(cpu / gigabytes, 6)
+                                  for side, cpu in result['cpu_s'].items()}
+    else:
+        result['commands_per_s'] = round(len(latencies) / elapsed, 3)
+    return result
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION percentiles
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def percentiles(samples):
+
+ARGUMENTS:
+    list samples : command latencies in seconds
+
+RETURNS: dict - p50, p90, p99 & max in milliseconds (nearest rank)
+----------------------------------------------------------------------------------------------
+"""
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+    return {'p50': round(pick(50) * 1000, 3), 'p90': round(pick(90) * 1000, 3),
+            'p99': round(pick(99) * 1000, 3), 'max': round(ordered[-1] * 1000, 3)}
+
+# start benchmark
+if __name__ == '__main__':
+    main()
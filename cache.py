@@ -0,0 +1,207 @@
+import collections
+import os
+import stat
+import threading
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: cache.py - in memory cache of the files the server sends most
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+CLASSES:
+    FileCache(string : filesDir, int : maxBytes, int : maxFileSize)
+
+GLOBAL CONSTANTS:
+    int CACHE_BYTES=268435456 : default memory the cache can hold (256mb)
+    int MAX_FILE_SIZE=67108864 : biggest file that's cached (64mb), a bigger 1 would push out too much
+    int ADMIT_AFTER=2 : a file is cached on its 2nd GET, so a file fetched once never pushes out a hot 1
+    int MAX_SEEN=4096 : number of missed names remembered for ADMIT_AFTER
+
+NOTES:
+    Many clients pulling the same few files would each make the server check, open, stat & read the same file.
+    A cached file is a plain buffer read once, and sent straight from memory on every GET after that.
+    Buffers rather than mmap: a mapped file that another program truncates kills the server with SIGBUS
+    on the next send, a buffer can't go bad under it.
+
+    Entries are checked against the file's size, mtime & inode on every lookup (1 stat), so a file replaced
+    by an upload (a new inode) or edited in place is never served stale. The least recently used entries
+    are evicted once the cache holds more than maxBytes.
+-------------------------------------------------------------------------------------------------------
+"""
+
+CACHE_BYTES=268435456
+MAX_FILE_SIZE=67108864
+ADMIT_AFTER=2
+MAX_SEEN=4096
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS FileCache
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class FileCache(filesDir='./files', maxBytes=CACHE_BYTES, maxFileSize=MAX_FILE_SIZE):
+
+ARGUMENTS:
+    string filesDir : dir the cached files are in
+    int maxBytes : most bytes of file data kept in memory
+    int maxFileSize : files bigger than this are never cached
+
+NOTES:
+    Each entry is (stat key, bytes). Safe to use from several threads, a file is read without the lock
+    held so a big read doesn't hold up hits on other files.
+----------------------------------------------------------------------------------------------
+"""
+class FileCache:
+    def __init__(self, filesDir='./files', maxBytes=CACHE_BYTES, maxFileSize=MAX_FILE_SIZE):
+        self.filesDir = filesDir
+        self.maxBytes = maxBytes
+        self.maxFileSize = min(maxFileSize, maxBytes)
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.seen = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION lookup
+
+    INTERFACE: def lookup(self, name):
+
+    ARGUMENTS:
+        string name : file in filesDir a client asked for
+
+    RETURNS: memoryview - the whole file, None if it isn't cached (or doesn't exist), the caller reads it from disk
+
+    NOTES:
+        A miss counts towards admitting the file, and the file is read into the cache on its
+        ADMIT_AFTER-th miss, that request is served from the new entry.
+    ----------------------------------------------------------------------------------------------
+    """
+    def lookup(self, name):
+        path = os.path.join(self.filesDir, name)
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        key = (info.st_size, info.st_mtime_ns, info.st_ino)
+
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry[0] == key:
+                self.entries.move_to_end(name)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                self._remove(name)
+            if info.st_size > self.maxFileSize or not stat.S_ISREG(info.st_mode):
+                return None
+            seen = self.seen.pop(name, (None, 0))
+            count = seen[1] + 1 if seen[0] == key else 1
+            if count < ADMIT_AFTER:
+                self.seen[name] = (key, count)
+                if len(self.seen) > MAX_SEEN:
+                    self.seen.popitem(last=False)
+                return None
+
+        data = self._read(path, key)
+        if data is None:
+            return None
+        with self.lock:
+            if name in self.entries:
+                self._remove(name)
+            self.entries[name] = (key, data)
+            self.size += len(data)
+            while self.size > self.maxBytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+        return data
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION _read
+
+    INTERFACE: def _read(self, path, key):
+
+    ARGUMENTS:
+        string path : file to read
+        tuple key : (size, mtime, inode) the file had when it was looked up
+
+    RETURNS: memoryview - the file's bytes, None if the file changed while it was being read
+    ----------------------------------------------------------------------------------------------
+    """
+    def _read(self, path, key):
+        try:
+            with open(path, 'rb') as file:
+                buffer = bytearray(key[0])
+                view = memoryview(buffer)
+                filled = 0
+                while filled < key[0]:
+                    count = file.readinto(view[filled:])
+                    if not count:
+                        return None
+                    filled += count
+                info = os.fstat(file.fileno())
+        except OSError:
+            return None
+        if (info.st_size, info.st_mtime_ns, info.st_ino) != key:
+            return None
+        return view.toreadonly()
+
+    def _remove(self, name):
+        key, data = self.entries.pop(name)
+        self.size -= len(data)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION invalidate
+
+    INTERFACE: def invalidate(self, name):
+
+    ARGUMENTS:
+        string name : file that was just written, replaced or removed
+
+    RETURNS: void
+
+    NOTES:
+        Frees the entry right away. Not needed to stay correct (lookup checks the stat), only to
+        give the memory back without waiting for the entry to be evicted.
+    ----------------------------------------------------------------------------------------------
+    """
+    def invalidate(self, name):
+        with self.lock:
+            if name in self.entries:
+                self._remove(name)
+            self.seen.pop(name, None)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION stats
+
+    INTERFACE: def stats(self):
+
+    RETURNS: dict - hit & miss counts, hit ratio, evictions, entries & bytes held, for the metrics
+                    (see metrics.Metrics.addSource)
+    ----------------------------------------------------------------------------------------------
+    """
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits_total': self.hits, 'misses_total': self.misses, 'evictions_total': self.evictions,
+                    'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                    'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.maxBytes}
@@ -2,7 +2,16 @@ import sys
 import getopt
 import os
 import traceback
+import shlex
+import time
+import json
+import hashlib
+import threading
+import concurrent.futures
 import utils
+import session
+import delta
+import index
 
 """
 ------------------------------------------------------------------------------------------------------
@@ -18,9 +27,35 @@ PROGRAMMER: Junyin Xia
 
 FUNCTIONS:
     void main (void)
-    void userInputLoop(string : ip)
-    void handleGet(socket : controlSocket, string : filename)
-    void handleSend(socket : controlSocket, string : filename)
+    void userInputLoop(string : ip, bool : useSession, dict : options)
+    bool runUserCommand(socket : channel, string : userInput, dict : options)
+    int runBatch(string : ip, iterable : lines, bool : useSession, dict : options)
+    bool canOverlap(socket : channel)
+    list runTransfers(socket : channel, function : handler, list : names, dict : options)
+    tuple connect(string : ip, bool : useSession)
+    void disconnect(socket : controlSocket, ClientSession : activeSession)
+    socket listenDataChannel(void)
+    string withDataPort(string : msg, socket : listenSocket)
+    socket openDataChannel(socket : controlSocket, string : flag, string : msg, socket : listenSocket)
+    list acceptDataChannels(socket : listenSocket, int : count)
+    dict handleGet(socket : controlSocket, string : filename, dict : options)
+    generator fetchList(socket : controlSocket, string : prefix, bool : meta, bool : hashes, int : pageSize)
+    void handleList(socket : controlSocket, string : prefix, bool : meta, bool : hashes)
+    dict handleSend(socket : controlSocket, string : filename, dict : options)
+    list splitNames(string : arg)
+    list handleMultiGet(socket : controlSocket, list : patterns, dict : options)
+    list handleMultiSend(socket : controlSocket, list : patterns, dict : options)
+    dict fetchStats(socket : controlSocket)
+    void handleStats(socket : controlSocket)
+    FileIndex openLocalIndex(void)
+    tuple planSync(dict : local, dict : remote, string : direction, bool : delete, function : hashOf)
+    dict handleSync(socket : controlSocket, string : direction, list : patterns, bool : delete, dict : options)
+    list handleDelete(socket : controlSocket, list : names)
+
+GLOBAL CONSTANTS:
+    int LIST_PAGE=1000 : names fetched per GETALL page
+    int STATS_CLIENTS=10 : number of clients STATS prints, slowest first
+    int SYNC_WORKERS=4 : transfers a SYNC runs at the same time when -j isn't given
 
 NOTES:
     This is a terminal client for a fileshare application to transfer files of all sizes bothways across a local 
@@ -30,15 +65,70 @@ NOTES:
     Two channels are used:
         control channel - created on client starts after it connects to server, client sends commands thru this channel.
             Runs between clientIp:OS port <-> serverIp:7005
-        
+
         data channel - created after client issues command through the control channel, and server establishes a new connection
-            to transfer file data. Runs between clientIp:8888 <-> serverIp:7006
+            to transfer file data. Runs between clientIp:OS port <-> serverIp:7006, the client sends the port it
+            listens on with each command. -p <port> listens on a fixed port instead (-p 8888 for older servers).
+
+    With -s (session mode), the control connection is switched to a multiplexed session instead, and every 
+    command's data runs on a stream inside that connection (see session.py). No data port is opened.
+
+    A GET or SEND that breaks part way leaves a partial file behind on the receiving side, and the next GET/SEND
+    of the same file resumes from where it stopped.
+
+    With -d (delta mode), a GET of a file that's already here, or any SEND, only moves the parts of the file
+    that changed (see delta.py).
+
+    With -z <zlib|lzma>, plain GET and SEND transfers are compressed on the fly, unless a sample of the file shows
+    it won't shrink.
+
+    With -S (sparse mode), plain GET and SEND transfers only move the data regions of a file, and the holes
+    are recreated on the other side, so a mostly empty disk image moves & lands as its data, not its size.
+
+    GET and SEND also take several names and/or glob patterns (get *.log "my file.txt"), and move every matching
+    file in 1 stream over 1 data channel, instead of paying a command + connect-back per file.
+
+    With -n <streams>, GET and SEND split each file across that many parallel data connections (0 lets the
+    sender pick a count from the file size). Not used in session mode, where everything shares 1 connection.
+
+    Packets use the binary v2 format (see utils.sendCmdPacket), -l switches back to the 3 digit v1 format
+    and the original plain GET/SEND exchanges, for older servers. Those only know get & send.
+
+    Every GET and SEND is verified end to end: the sender follows the file with its sha256, computed while the
+    bytes go out, and the receiver checks it against what arrived. A file that doesn't match is thrown away
+    and reported as corrupt. -u turns this off, for servers from before verification, and so does -l.
+
+    With -f <file> (- for stdin), the commands are read from the file and run 1 after another over 1 connection,
+    with no prompt, and the exit status is 1 if any failed. For use from scripts & pipelines.
+
+    With -j <workers>, up to that many transfers run at the same time: the files of a GET/SEND with several
+    names & patterns each get their own command instead of 1 batch, and the commands of a -f file run side by side.
+    A line is printed as each finishes. It needs a data port per command (or -s), with a fixed -p port
+    everything runs 1 at a time.
+    Scripts can also import the client as a library instead (see transferclient.py).
+
+    SYNC mirrors ./files with the server's: the server's listing with hashes is compared with an index of
+    the local files (see index.py), and only the files that are new or changed are moved, in parallel.
+    SYNC GET makes ./files match the server, SYNC SEND makes the server match ./files, and plain SYNC goes
+    both ways, the newer copy of a changed file wins. With --delete, a 1 way SYNC also removes the files
+    the other side doesn't have.
 
     At any time, the user can leave by entering 'exit' or hitting 'ctrl+c' in the terminal.
     This will disconnect any existing connections, and exit the program. 
 -------------------------------------------------------------------------------------------------------
 """
 
+LIST_PAGE=1000
+STATS_CLIENTS=10
+SYNC_WORKERS=4
+
+# cmd packets from concurrent transfers share the control connection, 1 is written at a time
+sendLock = threading.Lock()
+
+# index of ./files, opened by the first SYNC (see openLocalIndex)
+localIndex = None
+indexLock = threading.Lock()
+
 """
 ----------------------------------------------------------------------------------------------
 FUNCTION main
@@ -61,13 +151,29 @@ into python is right. If commandline args are invalid or an exception is thrown
 msg is printed and the program exits. 
 
 After a server ip is extracted from commandline args, a loop is started that reads and executes commands. 
+Pass -s to run all commands over 1 multiplexed session connection.
+Pass -n <streams> to split GET/SEND transfers across parallel data connections, 0 to auto-tune.
+Pass -d to only transfer the changed blocks of files the other side already has.
+Pass -z <zlib|lzma> to compress transfers on the fly.
+Pass -S to only move the data regions of sparse files, and leave holes for the rest.
+Pass -l to speak the original v1 packet format & plain GET/SEND exchanges, for servers that don't know v2.
+Pass -u to skip the end to end sha256 check of GET/SEND transfers (-l also skips it).
+Pass -f <file> to run the commands in a file (- for stdin) without prompting, see runBatch.
+Pass -j <workers> to run up to that many transfers at the same time, see runTransfers & runBatch.
+Pass -p <port> to take the server's connect-backs on a fixed port instead of a new OS assigned 1 per command
+(-l also uses the fixed 8888).
+Pass -b <bytes> to read & receive file data in fixed size chunks, -w <bytes> to set the socket buffers,
+and -c <file> to read these from a config file other than utils.CONFIG_FILE (see utils.loadConfig).
 ----------------------------------------------------------------------------------------------
 """
 def main():
-    help_msg=sys.argv[0] + ' -i <server ip>'
+    help_msg=sys.argv[0] + ' -i <server ip> [-s] [-n <streams>] [-d] [-z <zlib|lzma>] [-S] [-l] [-u] [-b <chunk bytes>] [-w <socket buffer bytes>] [-c <config file>] [-f <command file>] [-j <workers>] [-p <data port>]'
     try:
-        opts, args = getopt.getopt(sys.argv[1:],'i:',['ip='])
-    except getopt.GetoptError:
+        opts, args = getopt.getopt(sys.argv[1:],'i:sn:dz:Slub:w:c:f:j:p:',['ip=','session','streams=','delta','compress=','sparse','legacy','unverified','buffer=','window=','config=','file=','jobs=','port='])
+        configs = [arg for opt, arg in opts if opt in ('-c', '--config')]
+        utils.loadConfig(configs[-1] if configs else utils.CONFIG_FILE, bool(configs))
+    except (getopt.GetoptError, OSError, ValueError) as e:
+        print(e)
         print(help_msg)
         sys.exit(2)
     if len(opts) == 0:
@@ -75,12 +181,68 @@ def main():
         sys.exit()
     
     ip=''
+    useSession=False
+    batchFile=None
+    options={}
     for opt, arg in opts:
         if opt in ('-i', '--ip'):
             ip = arg
+        elif opt in ('-s', '--session'):
+            useSession=True
+        elif opt in ('-n', '--streams'):
+            if not arg.isdigit():
+                print(help_msg)
+                sys.exit(2)
+            options['streams'] = int(arg)
+        elif opt in ('-d', '--delta'):
+            options['delta'] = True
+        elif opt in ('-S', '--sparse'):
+            options['sparse'] = True
+        elif opt in ('-z', '--compress'):
+            if arg not in utils.CODECS:
+                print(help_msg)
+                sys.exit(2)
+            options['compress'] = arg
+        elif opt in ('-f', '--file'):
+            batchFile = arg
+        elif opt in ('-l', '--legacy'):
+            utils.DEFAULT_PROTOCOL = utils.PROTOCOL_V1
+            utils.DATA_PORT = utils.PORT_X
+            options['verify'] = False
+            options['legacy'] = True
+        elif opt in ('-u', '--unverified'):
+            options['verify'] = False
+        elif opt in ('-j', '--jobs', '-p', '--port'):
+            if not arg.isdigit() or int(arg) < 1:
+                print(help_msg)
+                sys.exit(2)
+            if opt in ('-j', '--jobs'):
+                options['workers'] = int(arg)
+            else:
+                utils.DATA_PORT = int(arg)
+        elif opt in ('-b', '--buffer', '-w', '--window'):
+            if not arg.isdigit():
+                print(help_msg)
+                sys.exit(2)
+            if opt in ('-b', '--buffer'):
+                utils.setBufferSize(int(arg))
+            else:
+                utils.SOCKET_BUFFER = int(arg)
 
-    if ip != '':
-        userInputLoop(ip)
+    if ip != '' and batchFile is not None:
+        try:
+            if batchFile == '-':
+                failures = runBatch(ip, sys.stdin, useSession, options)
+            else:
+                with open(batchFile) as lines:
+                    failures = runBatch(ip, lines, useSession, options)
+        except OSError as e:
+            print(e)
+            sys.exit(2)
+        print(failures, 'commands failed' if failures != 1 else 'command failed')
+        sys.exit(1 if failures else 0)
+    elif ip != '':
+        userInputLoop(ip, useSession, options)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -92,9 +254,12 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def userInputLoop(ip):
+INTERFACE: def userInputLoop(ip, useSession=False, options=None):
 
-ARGUMENTS: string ip : ipv4 address of server
+ARGUMENTS: 
+    string ip : ipv4 address of server
+    bool useSession : run commands over a multiplexed session instead of a data channel per command
+    dict options : transfer options from the commandline, passed on to handleGet/handleSend
     
 RETURNS: void
 
@@ -107,42 +272,417 @@ The accepted commands a user can enter are (cmds aren't case-sensitive but filen
     GET filename - request a specific file from server to be saved locally
     SEND - lists the files stored locally that can send to server
     SEND filename -  send a local file to server to be saved
+    GET/SEND name1 name2 *.txt ... - get or send every file matching the names & glob patterns in 1 batch,
+                                     quote names that have spaces in them. With -j, as separate transfers
+                                     running side by side
+    LS [-s] [prefix] - list files on server starting with prefix, with size & modified time (-s adds sha256)
+    SYNC [GET|SEND] [--delete] [names & patterns] - move only the new & changed files, to make ./files
+                                                    match the server (GET), the server match ./files (SEND),
+                                                    or both ways (see handleSync)
+    STATS - print the server's transfer metrics
     EXIT - disconnect and exit the program 
 
     GET and SEND commands are handled by their own functions.
-This function opens a socket on the control channel with the server.
+Each line is run by runUserCommand.
+This function opens a socket on the control channel with the server (see connect). In session mode the handlers get the
+session in place of the control socket.
 ----------------------------------------------------------------------------------------------
 """
-def userInputLoop(ip):
-    controlSocket = utils.createTcpSocket()
+def userInputLoop(ip, useSession=False, options=None):
+    controlSocket, activeSession = None, None
     try:
-        controlSocket.connect((ip, utils.SERVER_COMM_PORT))
-        print('Enter a command: get / get <file> / send / send <file> / exit')
+        controlSocket, activeSession = connect(ip, useSession)
+        channel = activeSession or controlSocket
+        print('Enter a command: get / get <file> / send / send <file> / ls [-s] [prefix] / sync [get|send] [--delete] / stats / exit')
         while True:
             userInput = input('>>> ')
-            validInput=True
-            cmd = userInput.upper()
-            if cmd[0:3] == 'GET':
-                filename=userInput[3:].strip()
-                handleGet(controlSocket, filename)
-            elif cmd[0:4] == 'SEND':
-                filename=userInput[4:].strip()
-                handleSend(controlSocket, filename)
-            elif cmd == 'EXIT':
+            if userInput.upper() == 'EXIT':
                 print('exit called.')
                 break
-            else:
-                validInput=False
-
-            if not validInput:
-                print('>>> Invalid input, please enter valid cmd')
+            runUserCommand(channel, userInput, options)
     except KeyboardInterrupt:
         print('\nexit called.')
     except Exception as e: 
         traceback.print_exc()
     finally:
+        disconnect(controlSocket, activeSession)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runUserCommand
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def runUserCommand(channel, userInput, options=None):
+
+ARGUMENTS: 
+    socket channel : tcp socket opened on control channel, or a session.ClientSession
+    string userInput : 1 command as the user typed it, see userInputLoop for the list
+    dict options : transfer options from the commandline, passed on to handleGet/handleSend
+    
+RETURNS: bool - False if the command was invalid or didn't do what it asked for (file not found, broken transfer,
+                no files matched), True otherwise
+
+NOTES:
+    Runs 1 interactive or batch command. EXIT is up to the caller.
+    With options workers > 1, a GET/SEND of several names & patterns is expanded here (against the server's
+    listing for GET) and each file is moved by its own command, up to workers at a time (see runTransfers).
+----------------------------------------------------------------------------------------------
+"""
+def runUserCommand(channel, userInput, options=None):
+    cmd = userInput.upper()
+    concurrent = bool(options) and options.get('workers', 1) > 1
+    if cmd[0:3] == 'GET':
+        names=splitNames(userInput[3:].strip())
+        if len(names) == 1 and not utils.isPattern(names[0]):
+            result = handleGet(channel, names[0], options)
+            return result is None or result['status'] == 'saved'
+        if concurrent:
+            available = [entry['name'] for entries in fetchList(channel) for entry in entries]
+            results = runTransfers(channel, handleGet, utils.matchFiles(names, available), options)
+            return bool(results) and all(result['status'] == 'saved' for result in results)
+        return bool(handleMultiGet(channel, names, options))
+    elif cmd[0:4] == 'SEND':
+        names=splitNames(userInput[4:].strip())
+        if len(names) == 1 and not utils.isPattern(names[0]):
+            result = handleSend(channel, names[0], options)
+            return result is None or result['status'] in ('sent', 'skipped')
+        if concurrent:
+            results = runTransfers(channel, handleSend, utils.matchFiles(names), options)
+            return bool(results) and all(result['status'] in ('sent', 'skipped') for result in results)
+        return bool(handleMultiSend(channel, names, options))
+    elif cmd == 'LS' or cmd[0:3] == 'LS ':
+        args=userInput[2:].split()
+        hashes = bool(args) and args[0] == '-s'
+        handleList(channel, ' '.join(args[1:] if hashes else args), True, hashes)
+        return True
+    elif cmd == 'SYNC' or cmd[0:5] == 'SYNC ':
+        args = [arg for arg in splitNames(userInput[4:].strip()) if arg]
+        delete = '--delete' in args
+        args = [arg for arg in args if arg != '--delete']
+        direction = args.pop(0).lower() if args and args[0].upper() in ('GET', 'SEND') else 'both'
+        if delete and direction == 'both':
+            print('>>> sync --delete needs a direction: sync get --delete / sync send --delete')
+            return False
+        return not handleSync(channel, direction, args, delete, options)['failed']
+    elif cmd == 'STATS':
+        handleStats(channel)
+        return True
+    print('>>> Invalid input, please enter valid cmd')
+    return False
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runBatch
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def runBatch(ip, lines, useSession=False, options=None):
+
+ARGUMENTS: 
+    string ip : ipv4 address of server
+    iterable lines : commands, 1 per line, eg an open file or sys.stdin
+    bool useSession : run commands over a multiplexed session instead of a data channel per command
+    dict options : transfer options from the commandline, passed on to handleGet/handleSend
+    
+RETURNS: int - number of commands that failed
+
+NOTES:
+    Non interactive version of userInputLoop: runs every line over 1 connection, with no prompt.
+    Blank lines & lines starting with # are skipped, EXIT stops early. A command that fails, even with an error,
+    is counted and the batch goes on with the next line.
+
+    With options workers > 1 (and a channel that can overlap commands, see canOverlap), the lines run on a pool
+    of that many threads instead, in any order, and [done/total] is printed as each finishes. Each line then
+    counts as 1 worker, so a GET/SEND of several files in it runs as 1 batch command.
+    Lines that touch the same file shouldn't go in 1 concurrent batch.
+----------------------------------------------------------------------------------------------
+"""
+def runBatch(ip, lines, useSession=False, options=None):
+    options = options or {}
+    controlSocket, activeSession = connect(ip, useSession)
+
+    def runLine(line):
+        try:
+            return runUserCommand(channel, line, lineOptions)
+        except (OSError, RuntimeError, ValueError) as e:
+            print('Command failed:', line, '-', e)
+            return False
+
+    try:
+        channel = activeSession or controlSocket
+        workers = options.get('workers', 1) if canOverlap(channel) else 1
+        lineOptions = dict(options, workers=1)
+        results = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.upper() == 'EXIT':
+                    break
+                if workers == 1:
+                    print('>>>', line)
+                    results.append(runLine(line))
+                else:
+                    futures[pool.submit(runLine, line)] = line
+            for future in concurrent.futures.as_completed(futures):
+                results.append(future.result())
+                print('[%d/%d]' % (len(results), len(futures)), 'done' if results[-1] else 'FAILED:', futures[future])
+    finally:
+        disconnect(controlSocket, activeSession)
+    return results.count(False)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION canOverlap
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def canOverlap(channel):
+
+ARGUMENTS: 
+    socket channel : tcp socket opened on control channel, or a session.ClientSession
+    
+RETURNS: bool - True if commands on channel can run at the same time
+
+NOTES:
+    A session runs each command on its own stream, and without 1 every command listens on its own OS assigned
+    data port. Only a fixed data port (-p, -l) can take just 1 connect-back at a time.
+----------------------------------------------------------------------------------------------
+"""
+def canOverlap(channel):
+    return isinstance(channel, session.Session) or not utils.DATA_PORT
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runTransfers
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def runTransfers(channel, handler, names, options):
+
+ARGUMENTS: 
+    socket channel : tcp socket opened on control channel, or a session.ClientSession
+    function handler : handleGet or handleSend
+    list names : files to move, no patterns
+    dict options : transfer options, workers is how many run at the same time
+    
+RETURNS: list - handler's result dict for each file, in the order they finished. A transfer that failed
+                with an error gets status 'failed' and the error
+
+NOTES:
+    Moves every file with its own command, on a pool of worker threads, so the per file round trips
+    overlap instead of adding up. [done/total] is printed as each finishes, and the total rate at the end.
+    The workers share the channel (see canOverlap), each file is only in names once so no 2 workers
+    write the same partial file.
+----------------------------------------------------------------------------------------------
+"""
+def runTransfers(channel, handler, names, options):
+    if not names:
+        utils.log('No files match')
+        return []
+    workers = min(options.get('workers', 1), len(names)) if canOverlap(channel) else 1
+    fileOptions = dict(options, workers=1)
+    results = []
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(handler, channel, name, fileOptions): name for name in names}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except (OSError, RuntimeError, ValueError) as e:
+                result = {'name': futures[future], 'status': 'failed', 'size': 0, 'error': str(e)}
+            results.append(result)
+            utils.log('[%d/%d]' % (len(results), len(names)), result['status'], result['name'],
+                      result.get('error', '%d bytes' % result['size']))
+    elapsed = time.monotonic() - start
+    total = sum(result['size'] for result in results)
+    utils.log('%d files, %d bytes in %.2fs, %.2f MB/s with %d workers' % (
+        len(results), total, elapsed, total / max(elapsed, 1e-9) / 1e6, workers))
+    return results
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION connect
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def connect(ip, useSession=False):
+
+ARGUMENTS: 
+    string ip : ipv4 address of server
+    bool useSession : switch the connection to a multiplexed session
+    
+RETURNS: tuple - (control socket, session.ClientSession or None), pass the session in place of the socket when there is 1
+
+NOTES:
+    Connects to server ip port 7005. The socket is closed again if anything fails.
+----------------------------------------------------------------------------------------------
+"""
+def connect(ip, useSession=False):
+    controlSocket = utils.createTcpSocket(role=utils.CONTROL)
+    try:
+        controlSocket.connect((ip, utils.SERVER_COMM_PORT))
+        activeSession = session.ClientSession(controlSocket) if useSession else None
+    except:
+        controlSocket.close()
+        raise
+    return (controlSocket, activeSession)
+
+def disconnect(controlSocket, activeSession=None):
+    if activeSession:
+        activeSession.shutdown()
+    if controlSocket:
         controlSocket.close()
 
+"""
+----------------------------------------------------------------------------------------------
+
+FUNCTION listenDataChannel
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def listenDataChannel():
+
+ARGUMENTS: void
+    
+RETURNS: socket - socket listening on utils.DATA_PORT for the server's connect-backs, an OS assigned port if that's 0
+
+NOTES:
+    The backlog fits every connection of a parallel transfer, since the server opens them all before
+    the client gets to accept them. It's tuned as a data socket, and the connections it accepts inherit that.
+----------------------------------------------------------------------------------------------
+"""
+def listenDataChannel():
+    listenSocket = utils.createTcpSocket(utils.DATA_PORT, utils.DATA)
+    listenSocket.listen(utils.MAX_STREAMS)
+    return listenSocket
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION withDataPort
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def withDataPort(msg, listenSocket):
+
+ARGUMENTS: 
+    string msg : request msg of the command (see utils.encodeRequest)
+    socket listenSocket : socket the command's connect-back will be accepted on
+    
+RETURNS: string - msg with port=<listenSocket's port> added, or msg as it was if that's 8888
+
+NOTES:
+    The server connects back to 8888 when a command has no port, so those are sent exactly like before.
+----------------------------------------------------------------------------------------------
+"""
+def withDataPort(msg, listenSocket):
+    port = listenSocket.getsockname()[1]
+    if port == utils.PORT_X:
+        return msg
+    filename, opts = utils.decodeRequest(msg)
+    return utils.encodeRequest(filename, dict(opts, port=port))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION openDataChannel
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def openDataChannel(controlSocket, flag, msg='', listenSocket=None):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    string flag : one of the command flags, GET/GETALL/SEND
+    string msg : msg to send with the cmd packet, usually the filename
+    socket listenSocket : already listening socket to accept the connect-back on, it's left open 
+                          so more connections can be accepted. Leave empty to use a temporary one
+    
+RETURNS: socket - data channel for this command
+
+NOTES:
+    Sends a command and returns the channel its data will flow on.
+    Normally that means opening a data port, sending the cmd packet with that port in it (see withDataPort),
+    and accepting the server's connect-back. In session mode it opens a new stream on the session instead.
+----------------------------------------------------------------------------------------------
+"""
+def openDataChannel(controlSocket, flag, msg='', listenSocket=None):
+    if isinstance(controlSocket, session.Session):
+        return controlSocket.openStream(flag, msg)
+
+    if listenSocket is not None:
+        with sendLock:
+            utils.sendCmdPacket(controlSocket, flag, withDataPort(msg, listenSocket))
+        return listenSocket.accept()[0]
+
+    listenSocket = listenDataChannel()
+    try:
+        with sendLock:
+            utils.sendCmdPacket(controlSocket, flag, withDataPort(msg, listenSocket))
+        dataSocket, serverIpPort = listenSocket.accept()
+    finally:
+        listenSocket.close()
+    return dataSocket
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION acceptDataChannels
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def acceptDataChannels(listenSocket, count):
+
+ARGUMENTS: 
+    socket listenSocket : socket the command's first data channel was accepted on
+    int count : number of extra connections to accept
+    
+RETURNS: list - accepted data channel sockets
+
+NOTES:
+    Accepts the extra data connections the server opens for a parallel transfer.
+----------------------------------------------------------------------------------------------
+"""
+def acceptDataChannels(listenSocket, count):
+    return [listenSocket.accept()[0] for i in range(count)]
+
 """
 ----------------------------------------------------------------------------------------------
 FUNCTION handleGet
@@ -153,52 +693,222 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def handleGet(controlSocket, filename):
+INTERFACE: def handleGet(controlSocket, filename, options=None):
 
 ARGUMENTS: 
     socket controlSocket :  tcp socket opened on control channel
     string filename : file that client wants from server. Leave empty to receive server filenames list
+    dict options : transfer options, eg {'streams': 4, 'delta': True, 'compress': 'zlib', 'sparse': True, 'verify': False}
     
-RETURNS: void
+RETURNS: dict - {'name': filename, 'status': 'saved' / 'not found' / 'incomplete' / 'corrupt', 'size': bytes saved},
+                None when filename is empty
 
 NOTES:
     Handles the get file scenario on the client.
-    Open port 8888 and listen for server connection (to establish data channel)
-    If a file was specified, send GET packet with filename. Otherwise, send a request to GETALL filenames.
+    Open the data channel with openDataChannel.
+    If a file was specified, send GET packet with filename. Otherwise, list the server's filenames with handleList.
     
     Once the server connects, depending what cmd packet was sent, it will immediately send back either the filenames
     (which the client will print out), or a status indicating if the file was found on the server. If the file was
     found, the server will send the filesize then file bytes right after. So we pass off the socket + filename to a helper
     function to recv and save the file bytes locally.
+
+    For a parallel GET, the server answers FOUND with [stream count filesize], then connects back the extra
+    streams, which are accepted on the same listening socket.
+
+    If an earlier GET of the file broke part way, the request carries offset=<bytes already here> and the
+    server answers FOUND with the offset it's resuming from.
+
+    In delta mode, when the file already exists here, the request carries delta=1. After FOUND the client
+    sends the block signatures of its copy, and rebuilds the file from the delta the server sends back.
+
+    With options legacy=True (-l) the request is the bare filename, the file comes whole from byte 0,
+    and a listing is the 1 packet of names an older server sends.
+
+    With compression on, the request carries compress=<codec>, and the server says which codec it actually used
+    before the file bytes (see utils.sendFile).
+
+    Unless options has verify=False, a plain or parallel GET carries verify=1, and the server follows the file
+    (or each range) with its sha256. A file that doesn't match is deleted and reported as corrupt.
+
+    In sparse mode a plain GET carries sparse=1, and only the data regions of the file come back (see utils.recvFile).
 ----------------------------------------------------------------------------------------------
 """
-def handleGet(controlSocket, filename):
-    listenSocket = utils.createTcpSocket(utils.PORT_X)
-    listenSocket.listen(1)
-    packet=''
+def handleGet(controlSocket, filename, options=None):
+    options = options or {}
+    legacy = options.get('legacy')
+    if not filename and legacy:
+        # an older server sends every name in 1 packet, without paging
+        dataSocket = openDataChannel(controlSocket, utils.GETALL)
+        try:
+            print(utils.readDataPacket(dataSocket))
+        finally:
+            dataSocket.close()
+        return None
     if not filename:
-        utils.sendCmdPacket(controlSocket, utils.GETALL)
-    else:
-        utils.sendCmdPacket(controlSocket, utils.GET, filename)
+        handleList(controlSocket)
+        return None
 
-    dataSocket, serverIpPort = listenSocket.accept()
-    data = utils.readDataPacket(dataSocket)
+    if legacy:
+        # an older server takes the whole request as the filename, so none of the options can be sent
+        options = {'verify': False}
+    streams = options.get('streams', 1)
+    useDelta = options.get('delta') and os.path.isfile('./files/' + filename)
+    verify = options.get('verify', True) and not useDelta
+    listenSocket = None
+    if streams != 1 and not useDelta and not isinstance(controlSocket, session.Session):
+        listenSocket = listenDataChannel()
+    try:
+        offset = 0 if legacy else utils.partialSize(filename)
+        requestOpts = {}
+        if useDelta:
+            requestOpts['delta'] = 1
+        elif listenSocket:
+            requestOpts['streams'] = streams
+        else:
+            if offset:
+                requestOpts['offset'] = offset
+            if options.get('compress'):
+                requestOpts['compress'] = options['compress']
+            if options.get('sparse'):
+                requestOpts['sparse'] = 1
+        if verify:
+            requestOpts['verify'] = 1
+        request = utils.encodeRequest(filename, requestOpts)
+        dataSocket = openDataChannel(controlSocket, utils.GET, request, listenSocket)
 
-    if not filename:
-        # data is list of filenames
-        print(data)
-    else:
-        # data is filename or status
+        # data is status
+        data = utils.readDataPacket(dataSocket)
+        result = {'name': filename, 'status': 'not found', 'size': 0}
         if data == utils.NOT_FOUND:
-            print('File not found on server:', filename)
+            utils.log('File not found on server:', filename)
         if data == utils.FOUND:
-            print('Fetching', filename)
-            utils.recvFile(dataSocket, filename)
-    dataSocket.close()
-    listenSocket.close()
+            utils.log('Fetching', filename)
+            if useDelta:
+                blockSize = delta.sendSignatures(dataSocket, filename)
+                saved = delta.recvDelta(dataSocket, filename, blockSize)
+            elif listenSocket:
+                count, filesize = map(int, utils.readDataPacket(dataSocket).split())
+                dataSockets = [dataSocket] + acceptDataChannels(listenSocket, count - 1)
+                try:
+                    utils.recvFileParallel(dataSockets, filename, filesize, verify)
+                    saved = True
+                finally:
+                    for extraSocket in dataSockets[1:]:
+                        extraSocket.close()
+            else:
+                if offset:
+                    offset = int(utils.readDataPacket(dataSocket))
+                digest = hashlib.sha256() if verify else None
+                saved = utils.recvFile(dataSocket, filename, offset, 'compress' in requestOpts, digest, 'sparse' in requestOpts)
+            if saved:
+                result['status'] = 'saved'
+            else:
+                # recvFile keeps the partial file of a broken transfer for resuming, but not a corrupt 1
+                result['status'] = 'incomplete' if os.path.exists(utils.partPath(filename)) else 'corrupt'
+            if saved:
+                result['size'] = os.path.getsize('./files/' + filename)
+        dataSocket.close()
+    finally:
+        if listenSocket:
+            listenSocket.close()
+    return result
 
 """
 ----------------------------------------------------------------------------------------------
+FUNCTION fetchList
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def fetchList(controlSocket, prefix='', meta=False, hashes=False, pageSize=LIST_PAGE):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    string prefix : only list names starting with this
+    bool meta : get size & modified time of each file
+    bool hashes : also get sha256 of each file (the server computes any it doesn't know yet)
+    int pageSize : names per GETALL page
+    
+RETURNS: generator - yields 1 list per page, of dicts {'name'} or {'name', 'size', 'mtime' (ns), 'hash'}
+
+NOTES:
+    Fetches the server's file list 1 page at a time with GETALL, yielding each page as it arrives,
+    so a share with any number of files never has to fit in 1 packet or in memory.
+    Each page's cursor is sent back as after=<cursor> to get the next 1 (see server.handleGetAll).
+----------------------------------------------------------------------------------------------
+"""
+def fetchList(controlSocket, prefix='', meta=False, hashes=False, pageSize=LIST_PAGE):
+    requestOpts = {'limit': pageSize}
+    if prefix:
+        requestOpts['prefix'] = prefix
+    if hashes:
+        requestOpts['hash'] = 1
+    elif meta:
+        requestOpts['meta'] = 1
+    cursor = None
+    while cursor != '':
+        if cursor:
+            requestOpts['after'] = cursor
+        dataSocket = openDataChannel(controlSocket, utils.GETALL, utils.encodeRequest('', requestOpts))
+        try:
+            page = utils.readDataPacket(dataSocket)
+            cursor = utils.readDataPacket(dataSocket)
+        finally:
+            dataSocket.close()
+        if not page:
+            continue
+        entries = []
+        for line in page.split('\n'):
+            fields = line.split('\t')
+            entry = {'name': fields[0]}
+            if len(fields) > 2:
+                entry['size'] = int(fields[1])
+                entry['mtime'] = int(fields[2])
+            if len(fields) > 3:
+                entry['hash'] = fields[3]
+            entries.append(entry)
+        yield entries
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleList
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def handleList(controlSocket, prefix='', meta=False, hashes=False):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    string prefix : only list names starting with this
+    bool meta : print size & modified time of each file
+    bool hashes : also print sha256 of each file (the server computes any it doesn't know yet)
+    
+RETURNS: void
+
+NOTES:
+    Prints the server's file list 1 page at a time as fetchList gets them.
+----------------------------------------------------------------------------------------------
+"""
+def handleList(controlSocket, prefix='', meta=False, hashes=False):
+    for entries in fetchList(controlSocket, prefix, meta, hashes):
+        if not meta and not hashes:
+            print('  '.join(entry['name'] for entry in entries))
+            continue
+        for entry in entries:
+            modified = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['mtime'] / 1e9))
+            print('{:>14}  {}  {}'.format(entry['size'], modified, '  '.join([entry['name']] + ([entry['hash']] if hashes else []))))
+
+"""
+----------------------------------------------------------------------------------------------
+
 FUNCTION handleSend
 
 DATE: Oct 1 2020
@@ -207,39 +917,509 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: handleSend(controlSocket, filename):
+INTERFACE: handleSend(controlSocket, filename, options=None):
 
 ARGUMENTS: 
     socket controlSocket : tcp socket opened on control channel
     string filename : file that client wants to send to server. Leave empty to list out local filenames available for transfer
+    dict options : transfer options, eg {'streams': 4, 'delta': True, 'compress': 'zlib', 'sparse': True, 'verify': False}
     
-RETURNS: void
+RETURNS: dict - {'name': filename, 'status': 'sent' / 'skipped' (server already had it) / 'missing' (no such local file)
+                 / 'corrupt' (server got different bytes), 'size': filesize}, None when filename is empty
 
 NOTES:
     Handles the send file scenario on the client.
     If a file isn't specified, function just prints list of files in ./files dir and ends.
 
-    Otherwise, function will open port 8888 and listen for server connection (to establish data channel)
+    Otherwise, function will open the data channel with openDataChannel
     
-    Once the server connects, the client will immediately use a helper function to send the filesize + filebytes
+    Every SEND request carries hash=<sha256 of the file> & size=filesize. The server answers FOUND if it already
+    stores that content, and the upload is skipped, or NOT_FOUND to go ahead.
+
+    Otherwise the client will use a helper function to send the filesize + filebytes
     across the data channel for the server to read.
+
+    For a parallel SEND the client picks the stream count, and sends it with the filesize in the request.
+    The server then connects back that many times, and each connection carries 1 range of the file.
+
+    A normal SEND is always resumable: the request carries resume=1 & size=filesize, and the server replies
+    with how many bytes it already has from a broken SEND of this file. Only the rest is sent.
+
+    With options legacy=True (-l) the request is the bare filename and the file follows it, the original
+    exchange, since a server from before options would take the whole request as the name.
+
+    In delta mode the request carries delta=1, the server sends the block signatures of its copy, and
+    the client answers with a delta against them.
+
+    With compression on, the request also carries compress=<codec>.
+
+    Unless options has verify=False, a plain or parallel SEND carries verify=1. The client follows the file (or
+    each range) with its sha256, and the server replies FOUND once it has checked & stored it, or CORRUPT.
+    A whole file's digest is already known from the hash option, so that still goes out zero-copy.
+
+    In sparse mode a plain SEND carries sparse=1, and only the data regions of the file are sent (see utils.sendFile).
 ----------------------------------------------------------------------------------------------
 """
-def handleSend(controlSocket, filename):
+def handleSend(controlSocket, filename, options=None):
+    options = options or {}
     if not filename:
-        print('  '.join(os.listdir('./files')))
-    elif not os.path.isfile('./files/' + filename):
-        print('File not found, cannot send: ', filename)
+        print('  '.join(utils.listFiles()))
+        return None
+    if not os.path.isfile('./files/' + filename):
+        utils.log('File not found, cannot send: ', filename)
+        return {'name': filename, 'status': 'missing', 'size': 0}
+
+    filesize = os.path.getsize('./files/' + filename)
+    if options.get('legacy'):
+        # an older server takes the whole request as the filename, and answers nothing
+        dataSocket = openDataChannel(controlSocket, utils.SEND, filename)
+        try:
+            utils.sendFile(dataSocket, filename)
+        finally:
+            dataSocket.close()
+        utils.log('File sent to server')
+        return {'name': filename, 'status': 'sent', 'size': filesize}
+
+    requestOpts = {'hash': utils.fileDigest('./files/' + filename), 'size': filesize}
+    verify = options.get('verify', True) and not options.get('delta')
+    if verify:
+        requestOpts['verify'] = 1
+    listenSocket = None
+    if options.get('delta'):
+        requestOpts['delta'] = 1
+    elif options.get('streams', 1) != 1 and not isinstance(controlSocket, session.Session):
+        requestOpts['streams'] = utils.resolveStreamCount(options['streams'], filesize)
+        listenSocket = listenDataChannel()
     else:
-        listenSocket = utils.createTcpSocket(utils.PORT_X)
-        listenSocket.listen(1)
-        
-        utils.sendCmdPacket(controlSocket, utils.SEND, filename)
-        
-        dataSocket, serverIpPort = listenSocket.accept()
-        utils.sendFile(dataSocket, filename)
-        
-        print('File sent to server')
+        requestOpts['resume'] = 1
+        if options.get('compress'):
+            requestOpts['compress'] = options['compress']
+        if options.get('sparse'):
+            requestOpts['sparse'] = 1
+
+    status = 'sent'
+    try:
+        dataSocket = openDataChannel(controlSocket, utils.SEND, utils.encodeRequest(filename, requestOpts), listenSocket)
+        if utils.readDataPacket(dataSocket) == utils.FOUND:
+            utils.log('Server already has this file, upload skipped:', filename)
+            dataSocket.close()
+            return {'name': filename, 'status': 'skipped', 'size': filesize}
+
+        if 'delta' in requestOpts:
+            delta.sendDelta(dataSocket, filename, delta.recvSignatures(dataSocket))
+        elif listenSocket:
+            dataSockets = [dataSocket] + acceptDataChannels(listenSocket, requestOpts['streams'] - 1)
+            try:
+                utils.sendFileParallel(dataSockets, filename, verify)
+            finally:
+                for extraSocket in dataSockets[1:]:
+                    extraSocket.close()
+        else:
+            offset = int(utils.readDataPacket(dataSocket))
+            if offset:
+                utils.log('Resuming', filename, 'from byte', offset)
+            digest = None
+            if verify:
+                digest = requestOpts['hash'] if not offset else hashlib.sha256()
+            utils.sendFile(dataSocket, filename, offset, None, options.get('compress'), digest, 'sparse' in requestOpts)
+        if verify and utils.readDataPacket(dataSocket) != utils.FOUND:
+            status = 'corrupt'
+        dataSocket.close()
+    finally:
+        if listenSocket:
+            listenSocket.close()
+
+    if status == 'corrupt':
+        utils.log('Server rejected', filename, 'as corrupted on the way, send it again')
+    else:
+        utils.log('File sent to server')
+    return {'name': filename, 'status': status, 'size': filesize}
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION splitNames
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def splitNames(arg):
+
+ARGUMENTS: 
+    string arg : what the user typed after GET/SEND
+    
+RETURNS: list - names & patterns to transfer, [''] for an empty arg
+
+NOTES:
+    Splits on whitespace like a shell, quotes keep a name with spaces together.
+    A single name with no glob characters goes to the normal 1 file handlers, anything else is a batch.
+----------------------------------------------------------------------------------------------
+"""
+def splitNames(arg):
+    try:
+        names = shlex.split(arg)
+    except ValueError:
+        names = arg.split()
+    return names or ['']
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleMultiGet
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def handleMultiGet(controlSocket, patterns, options=None):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    list patterns : filenames and/or glob patterns to fetch
+    dict options : transfer options, only 'compress', 'sparse' & 'verify' apply to a batch
+    
+RETURNS: list - names of the files saved
+
+NOTES:
+    Sends 1 MGET command, then the patterns on the data channel, and saves every file the server
+    streams back on that channel (see utils.recvFiles). The server expands the patterns against its own files.
+    Unless options has verify=False, each file is checked against its sha256, and a corrupt 1 isn't saved.
+----------------------------------------------------------------------------------------------
+"""
+def handleMultiGet(controlSocket, patterns, options=None):
+    options = options or {}
+    requestOpts = {'compress': options['compress']} if options.get('compress') else {}
+    if options.get('verify', True):
+        requestOpts['verify'] = 1
+    if options.get('sparse'):
+        requestOpts['sparse'] = 1
+    dataSocket = openDataChannel(controlSocket, utils.MGET, utils.encodeRequest('', requestOpts))
+    try:
+        utils.sendNameList(dataSocket, patterns)
+        saved = utils.recvFiles(dataSocket, 'compress' in requestOpts, 'verify' in requestOpts, 'sparse' in requestOpts)
+    finally:
+        dataSocket.close()
+    if saved:
+        utils.log('Fetched', len(saved), 'files')
+    else:
+        utils.log('No files on server match:', ' '.join(patterns))
+    return saved
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleMultiSend
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def handleMultiSend(controlSocket, patterns, options=None):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    list patterns : filenames and/or glob patterns of local files to send
+    dict options : transfer options, only 'compress', 'sparse' & 'verify' apply to a batch
+    
+RETURNS: list - names of the files sent (the ones the server confirmed, when verifying)
+
+NOTES:
+    Expands the patterns against ./files, then sends 1 MSEND command and streams every matching
+    file on its data channel (see utils.sendFiles).
+    Unless options has verify=False, each file is followed by its sha256, and the server replies with the
+    names it saved. Any file missing from that list was corrupted on the way, and is reported.
+----------------------------------------------------------------------------------------------
+"""
+def handleMultiSend(controlSocket, patterns, options=None):
+    options = options or {}
+    names = utils.matchFiles(patterns)
+    if not names:
+        utils.log('No local files match:', ' '.join(patterns))
+        return []
+    requestOpts = {'compress': options['compress']} if options.get('compress') else {}
+    if options.get('verify', True):
+        requestOpts['verify'] = 1
+    if options.get('sparse'):
+        requestOpts['sparse'] = 1
+    dataSocket = openDataChannel(controlSocket, utils.MSEND, utils.encodeRequest('', requestOpts))
+    try:
+        utils.sendFiles(dataSocket, names, options.get('compress'), 'verify' in requestOpts, 'sparse' in requestOpts)
+        if 'verify' in requestOpts:
+            confirmed = set(utils.readNameList(dataSocket))
+            for name in names:
+                if name not in confirmed:
+                    utils.log('Server rejected', name, 'as corrupted on the way')
+            names = [name for name in names if name in confirmed]
+    finally:
+        dataSocket.close()
+    utils.log('Sent', len(names), 'files to server')
+    return names
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION fetchStats
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def fetchStats(controlSocket):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    
+RETURNS: dict - the server's metrics snapshot (see metrics.Metrics.snapshot)
+----------------------------------------------------------------------------------------------
+"""
+def fetchStats(controlSocket):
+    dataSocket = openDataChannel(controlSocket, utils.STATS)
+    try:
+        return json.loads(utils.readDataPacket(dataSocket))
+    finally:
+        dataSocket.close()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleStats
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def handleStats(controlSocket):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    
+RETURNS: void
+
+NOTES:
+    Gets the server's metrics with fetchStats, and prints 1 line per command:
+    count, errors, bytes moved, duration p50/p99, mean time to first byte & queue wait, and throughput p50.
+    Then any other sections the server reports (eg its file cache), the slowest clients, and the recent commands that failed.
+    Over v1 the server only sends count, errors, bytes & mean duration per command.
+----------------------------------------------------------------------------------------------
+"""
+def handleStats(controlSocket):
+    snapshot = fetchStats(controlSocket)
+
+    print('uptime %ds, %d commands running, %d blocking calls waiting, %d running' % (
+        snapshot['uptime'], snapshot['active'], snapshot['waiting'], snapshot['running']))
+    print('{:<8}{:>8}{:>8}{:>14}{:>14}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+        'cmd', 'count', 'errors', 'sent', 'received', 'p50 s', 'p99 s', 'ttfb s', 'wait s', 'p50 B/s'))
+    for cmd, stats in snapshot['commands'].items():
+        if isinstance(stats, list):
+            count, errors, sent, received, seconds = stats
+            print('{:<8}{:>8}{:>8}{:>14}{:>14}{:>10}  (mean s, v1 only gets these)'.format(cmd, count, errors, sent, received, seconds))
+            continue
+        print('{:<8}{:>8}{:>8}{:>14}{:>14}{:>10}{:>10}{:>10}{:>10}{:>12}'.format(
+            cmd, stats['count'], stats['errors'], stats['sent'], stats['received'],
+            str(stats['seconds'].get('p50')), str(stats['seconds'].get('p99')),
+            str(stats['firstByte'].get('mean')), str(stats['queueWait'].get('mean')),
+            str(stats['rate'].get('p50'))))
+
+    # sections the server added to its metrics, eg cache (see metrics.Metrics.addSource)
+    for name, section in snapshot.items():
+        if name not in ('commands', 'errors') and isinstance(section, dict):
+            print('%s: %s' % (name, ', '.join('%s %s' % (key.replace('_', ' '), value) for key, value in section.items())))
+    if snapshot.get('clients'):
+        print('slowest clients:')
+        for client in snapshot['clients'][:STATS_CLIENTS]:
+            print('  {:<16} {:>12} B/s  {} commands, {} errors, {} bytes in {:.3f}s'.format(
+                client['ip'], client['rate'], client['count'], client['errors'], client['bytes'], client['seconds']))
+    failed = [entry for entry in snapshot.get('recent', []) if entry['error']]
+    if failed:
+        print('recent failures:')
+        for entry in failed:
+            print('  {} {} {} after {}s'.format(entry['cmd'], entry['client'], entry['error'], entry['seconds']))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION openLocalIndex
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def openLocalIndex():
+
+ARGUMENTS: void
+    
+RETURNS: FileIndex - index of ./files, brought up to date
+
+NOTES:
+    Opened the first time it's needed, from ./files.index if an earlier run saved 1, and kept for the
+    rest of the run. Every call rescans ./files, which only stats the files, a file whose size & mtime
+    haven't changed keeps the hash it had.
+----------------------------------------------------------------------------------------------
+"""
+def openLocalIndex():
+    global localIndex
+    with indexLock:
+        if localIndex is None:
+            localIndex = index.FileIndex('./files')
+    localIndex.refresh(True)
+    return localIndex
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION planSync
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def planSync(local, remote, direction='both', delete=False, hashOf=None):
+
+ARGUMENTS: 
+    dict local : name -> [size, mtime in ns, sha256 or None] of the local files (see index.FileIndex.manifest)
+    dict remote : name -> {'size', 'mtime', 'hash'} of the server's files (see fetchList)
+    string direction : 'get' to make local match remote, 'send' to make remote match local, 'both' for both ways
+    bool delete : with a direction, remove the files that are only on the side being made to match
+    function hashOf : called with a name to get the local file's sha256 when it's not in local yet
+    
+RETURNS: tuple - (names to GET, names to SEND, names to delete on the side being made to match)
+
+NOTES:
+    Files are the same if their size & sha256 match, mtimes only decide which way a changed file goes in a
+    2 way sync, the newer 1 wins. Local hashes are only looked up for files whose sizes match.
+----------------------------------------------------------------------------------------------
+"""
+def planSync(local, remote, direction='both', delete=False, hashOf=None):
+    gets, sends, stale = [], [], []
+    for name in sorted(local.keys() | remote.keys()):
+        mine, theirs = local.get(name), remote.get(name)
+        if mine is None:
+            if direction != 'send':
+                gets.append(name)
+            elif delete:
+                stale.append(name)
+        elif theirs is None:
+            if direction != 'get':
+                sends.append(name)
+            elif delete:
+                stale.append(name)
+        elif mine[0] != theirs['size'] or (mine[2] or hashOf(name)) != theirs.get('hash'):
+            if direction == 'get' or (direction == 'both' and theirs['mtime'] > mine[1]):
+                gets.append(name)
+            else:
+                sends.append(name)
+    return gets, sends, stale
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleSync
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def handleSync(controlSocket, direction='both', patterns=None, delete=False, options=None):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    string direction : 'get', 'send' or 'both' (see planSync)
+    list patterns : names and/or glob patterns to sync, everything if empty
+    bool delete : with a direction, remove the files the other side doesn't have
+    dict options : transfer options, workers is how many files move at the same time (SYNC_WORKERS if not set)
+    
+RETURNS: dict - {'fetched', 'sent', 'deleted', 'failed': lists of names, 'unchanged': number of files left alone}
+
+NOTES:
+    The manifests are the server's listing with hashes (see fetchList), which the server answers from its
+    index, and the local index (see openLocalIndex), so only files changed since the last SYNC are rehashed
+    on either side. The files that differ go thru runTransfers, GETs first then SENDs, each with its own
+    command, so every transfer option applies (eg -d moves only the changed blocks of a changed file).
+
+    A fetched file gets the server's mtime, so a mirror's mtimes match its source.
+    Deletes on the server go in 1 DELETE command (see handleDelete).
+----------------------------------------------------------------------------------------------
+"""
+def handleSync(controlSocket, direction='both', patterns=None, delete=False, options=None):
+    options = dict(options or {})
+    options.setdefault('workers', SYNC_WORKERS)
+    localFiles = openLocalIndex()
+    local = localFiles.manifest()
+    remote = {entry['name']: entry for entries in fetchList(controlSocket, hashes=True) for entry in entries}
+    if patterns:
+        local = {name: local[name] for name in utils.matchFiles(patterns, sorted(local))}
+        remote = {name: remote[name] for name in utils.matchFiles(patterns, sorted(remote))}
+    gets, sends, stale = planSync(local, remote, direction, delete, localFiles.hashOf)
+    result = {'fetched': [], 'sent': [], 'deleted': [], 'failed': [],
+              'unchanged': len(local.keys() | remote.keys()) - len(gets) - len(sends) - len(stale)}
+
+    for transfer in runTransfers(controlSocket, handleGet, gets, options) if gets else []:
+        if transfer['status'] != 'saved':
+            result['failed'].append(transfer['name'])
+            continue
+        mtime = remote[transfer['name']]['mtime']
+        os.utime('./files/' + transfer['name'], ns=(mtime, mtime))
+        localFiles.update(transfer['name'])
+        result['fetched'].append(transfer['name'])
+    for transfer in runTransfers(controlSocket, handleSend, sends, options) if sends else []:
+        result['sent' if transfer['status'] in ('sent', 'skipped') else 'failed'].append(transfer['name'])
+
+    if stale and direction == 'get':
+        for name in stale:
+            try:
+                os.remove('./files/' + name)
+            except FileNotFoundError:
+                pass
+            localFiles.update(name)
+        result['deleted'] = stale
+    elif stale:
+        result['deleted'] = handleDelete(controlSocket, stale)
+    localFiles.save()
+    utils.log('Sync: %d fetched, %d sent, %d deleted, %d unchanged, %d failed' % (len(result['fetched']),
+              len(result['sent']), len(result['deleted']), result['unchanged'], len(result['failed'])))
+    return result
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleDelete
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def handleDelete(controlSocket, names):
+
+ARGUMENTS: 
+    socket controlSocket : tcp socket opened on control channel, or a session.ClientSession
+    list names : files to remove from the server, no patterns
+    
+RETURNS: list - names the server removed
+
+NOTES:
+    Sends 1 DELETE command, then the names on the data channel (see server.handleDelete).
+----------------------------------------------------------------------------------------------
+"""
+def handleDelete(controlSocket, names):
+    dataSocket = openDataChannel(controlSocket, utils.DELETE)
+    try:
+        utils.sendNameList(dataSocket, names)
+        deleted = utils.readNameList(dataSocket)
+    finally:
+        dataSocket.close()
+    utils.log('Deleted', len(deleted), 'files on server')
+    return deleted
 
 # start program
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
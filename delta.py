@@ -0,0 +1,444 @@
+import hashlib
+import mmap
+import os
+import struct
+import zlib
+import utils
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: delta.py - rsync style delta transfer shared between server & client application
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+FUNCTIONS:
+    int blockSizeFor(int : filesize)
+    list computeSignatures(string : path, int : blockSize)
+    int sendSignatures(socket : sendSocket, string : filename)
+    tuple recvSignatures(socket : recvSocket)
+    void sendDelta(socket : sendSocket, string : filename, tuple : signatures)
+    bool recvDelta(socket : recvSocket, string : filename, int : blockSize)
+
+GLOBAL CONSTANTS:
+    ops
+        bytes LITERAL=b'L' : [op][length] followed by length raw bytes the receiver doesn't have
+        bytes BLOCK=b'B' : [op][block index] copy that block from the receiver's own copy
+        bytes END=b'E' : [op][filesize] end of the delta, filesize is the size of the rebuilt file
+
+    misc
+        Struct OP : [op][number]
+                    1 byte 8 bytes
+        Struct SIGNATURE : [weak checksum][strong hash] of 1 block
+                              4 bytes       16 bytes
+        int MOD_ADLER=65521 : modulus of the adler-32 weak checksum
+        int MIN_BLOCK=2048, MAX_BLOCK=65536 : range of block sizes picked by blockSizeFor
+        int MAX_LITERAL=1048576 : literal runs are flushed once they get this long, so memory stays bounded
+        int MISS_BLOCKS=4 : blocks in a row without a match before the sender stops rolling byte by byte
+        int PROBE_EVERY=16 : after that, 1 block in this many is still rolled, to find shifted data again
+
+NOTES:
+    Delta mode moves only what changed when the receiver already has an older copy of a file.
+    1. The receiver splits its copy into blocks and sends a weak (adler-32) + strong (blake2b) checksum of each.
+    2. The sender slides a window over its copy 1 byte at a time. The weak checksum is rolled in O(1) per byte,
+       and only when it hits a known block is the strong hash computed to confirm the match.
+    3. The sender streams ops: literal bytes for unmatched data, and block references for matched data.
+    4. The receiver rebuilds the file from its old copy + the ops into a partial file, then renames it into place.
+
+    Matching blocks skip a whole block at a time at C speed (zlib/hashlib), the byte by byte roll only runs
+    over regions that changed, so mostly unchanged files go fast.
+
+    The roll is pure python, about 1mb/s, so a file that changed all over would go far slower than a plain
+    transfer. Once MISS_BLOCKS blocks in a row had no match, the sender only checks the window at each block
+    boundary (at C speed) and sends the rest as literals, rolling byte by byte over 1 block in PROBE_EVERY.
+    Worst case, a fully changed file costs 1/PROBE_EVERY of the roll, and unchanged data that was shifted by
+    an insert after a big change is matched again within PROBE_EVERY blocks (sent as literals till then).
+-------------------------------------------------------------------------------------------------------
+"""
+
+LITERAL=b'L'
+BLOCK=b'B'
+END=b'E'
+
+OP=struct.Struct('!cQ')
+SIGNATURE=struct.Struct('!I16s')
+MOD_ADLER=65521
+MIN_BLOCK=2048
+MAX_BLOCK=65536
+MAX_LITERAL=1048576
+MISS_BLOCKS=4
+PROBE_EVERY=16
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION blockSizeFor
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def blockSizeFor(filesize):
+
+ARGUMENTS:
+    int filesize : size of the receiver's copy
+
+RETURNS: int - block size to use for the signatures
+
+NOTES:
+    Square root of the filesize (like rsync), rounded to a multiple of 1kb and kept between MIN_BLOCK
+    and MAX_BLOCK. Keeps the signature list small for big files while still finding small changes.
+----------------------------------------------------------------------------------------------
+"""
+def blockSizeFor(filesize):
+    return max(MIN_BLOCK, min(MAX_BLOCK, int(filesize ** 0.5) // 1024 * 1024))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION computeSignatures
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def computeSignatures(path, blockSize):
+
+ARGUMENTS:
+    string path : file to checksum
+    int blockSize : size of each block, the last block may be shorter
+
+RETURNS: list - (weak, strong) checksums of each block, in file order
+
+NOTES:
+    Reads the file 1 block at a time into a reused buffer.
+----------------------------------------------------------------------------------------------
+"""
+def computeSignatures(path, blockSize):
+    signatures = []
+    buffer = bytearray(blockSize)
+    view = memoryview(buffer)
+    with open(path, 'rb') as file:
+        while True:
+            bytes_read = file.readinto(buffer)
+            if not bytes_read:
+                break
+            block = view[:bytes_read]
+            signatures.append((zlib.adler32(block), _strongHash(block)))
+    return signatures
+
+def _strongHash(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendSignatures
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendSignatures(sendSocket, filename):
+
+ARGUMENTS:
+    socket sendSocket : socket to send signatures to
+    string filename : receiver's copy of the file in ./files, may not exist
+
+RETURNS: int - block size used, recvDelta needs it to find blocks in the local copy
+
+NOTES:
+    Sends the block signatures of the local copy in this format
+        packet1 - [size of header str][blockSize count filesize as str]
+                    3 bytes             N bytes
+        then count SIGNATURE structs
+    A missing file is sent as 0 blocks, so the sender falls back to sending everything as literals.
+----------------------------------------------------------------------------------------------
+"""
+def sendSignatures(sendSocket, filename):
+    path = './files/' + filename
+    signatures = []
+    blockSize = MIN_BLOCK
+    filesize = 0
+    if os.path.isfile(path):
+        filesize = os.path.getsize(path)
+        blockSize = blockSizeFor(filesize)
+        signatures = computeSignatures(path, blockSize)
+
+    utils.sendDataPacket(sendSocket, '%d %d %d' % (blockSize, len(signatures), filesize))
+    sendSocket.sendall(b''.join(SIGNATURE.pack(weak, strong) for weak, strong in signatures))
+    return blockSize
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvSignatures
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvSignatures(recvSocket):
+
+ARGUMENTS:
+    socket recvSocket : socket to read signatures from
+
+RETURNS: tuple - (blockSize, filesize, signatures)
+    int blockSize : block size the signatures were computed with
+    int filesize : size of the receiver's copy
+    list signatures : (weak, strong) checksums of each block
+
+NOTES:
+    Counterpart to sendSignatures.
+----------------------------------------------------------------------------------------------
+"""
+def recvSignatures(recvSocket):
+    blockSize, count, filesize = map(int, utils.readDataPacket(recvSocket).split())
+    data = utils.recvBytes(recvSocket, count * SIGNATURE.size)
+    return (blockSize, filesize, list(SIGNATURE.iter_unpack(data)))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendDelta
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendDelta(sendSocket, filename, signatures):
+
+ARGUMENTS:
+    socket sendSocket : socket to send the delta to
+    string filename : sender's copy of the file in ./files
+    tuple signatures : (blockSize, filesize, signatures) of the receiver's copy, from recvSignatures
+
+RETURNS: void
+
+NOTES:
+    Sends the ops that turn the receiver's copy into the sender's copy, ending with an END op.
+    The file is mmapped, so multi gb files are scanned without reading them into memory.
+----------------------------------------------------------------------------------------------
+"""
+def sendDelta(sendSocket, filename, signatures):
+    path = './files/' + filename
+    filesize = os.path.getsize(path)
+    literalBytes = 0
+    with open(path, 'rb') as file:
+        if filesize:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                view = memoryview(data)
+                literalBytes = _sendOps(sendSocket, view, signatures)
+                view.release()
+            finally:
+                data.close()
+    sendSocket.sendall(OP.pack(END, filesize))
+    utils.log('Delta sent, bytes', filesize, 'literal bytes', literalBytes)
+
+def _sendOps(sendSocket, view, signatures):
+    literalBytes = 0
+    for op, value in _generateOps(view, *signatures):
+        if op == LITERAL:
+            sendSocket.sendall(OP.pack(LITERAL, len(value)))
+            sendSocket.sendall(value)
+            literalBytes += len(value)
+            value.release()
+        else:
+            sendSocket.sendall(OP.pack(BLOCK, value))
+    return literalBytes
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _generateOps
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _generateOps(data, blockSize, baseSize, signatures):
+
+ARGUMENTS:
+    memoryview data : sender's copy of the file
+    int blockSize : block size the receiver used
+    int baseSize : size of the receiver's copy
+    list signatures : receiver's block checksums
+
+RETURNS: generator - (LITERAL, memoryview) and (BLOCK, block index) ops, in file order
+
+NOTES:
+    The rolling update of adler-32 when byte out leaves and byte in enters a window of n bytes:
+        a' = a - out + in
+        b' = b - n * out + a' - 1
+    (mod 65521), which gives the same value zlib.adler32 would for the new window.
+    The receiver's last block can be shorter than blockSize, it's only checked against the tail of the file.
+    The windows are checked in spans of 1 block: every window in a rolled span, only the 1st in a skipped
+    span (see the file NOTES for which spans are skipped).
+----------------------------------------------------------------------------------------------
+"""
+def _generateOps(data, blockSize, baseSize, signatures):
+    filesize = len(data)
+    table = {}
+    for index, (weak, strong) in enumerate(signatures):
+        table.setdefault(weak, []).append((index, strong))
+
+    i = 0
+    literalStart = 0
+    # spans in a row without a match, whether this span is skipped, & where the next span or literal flush is due
+    missed = 0
+    skipping = False
+    boundary = blockSize
+    if filesize >= blockSize and table:
+        weak = zlib.adler32(data[:blockSize])
+        a = weak & 0xffff
+        b = weak >> 16
+        while i + blockSize <= filesize:
+            match = _findBlock(table, (b << 16) | a, data[i:i + blockSize])
+            if match is not None:
+                if literalStart < i:
+                    yield (LITERAL, data[literalStart:i])
+                yield (BLOCK, match)
+                i += blockSize
+                literalStart = i
+                missed = 0
+                skipping = False
+                boundary = i + blockSize
+                if i + blockSize <= filesize:
+                    weak = zlib.adler32(data[i:i + blockSize])
+                    a = weak & 0xffff
+                    b = weak >> 16
+                continue
+
+            if skipping:
+                # far from any match, jump to the next span instead of rolling to it
+                i += blockSize
+                if i + blockSize <= filesize:
+                    weak = zlib.adler32(data[i:i + blockSize])
+                    a = weak & 0xffff
+                    b = weak >> 16
+            else:
+                if i + blockSize < filesize:
+                    out = data[i]
+                    a = (a - out + data[i + blockSize]) % MOD_ADLER
+                    b = (b - blockSize * out + a - 1) % MOD_ADLER
+                i += 1
+            if i >= boundary:
+                if i - literalStart >= MAX_LITERAL:
+                    yield (LITERAL, data[literalStart:literalStart + MAX_LITERAL])
+                    literalStart += MAX_LITERAL
+                else:
+                    missed += 1
+                    skipping = missed >= MISS_BLOCKS and (missed - MISS_BLOCKS + 1) % PROBE_EVERY != 0
+                boundary = min(i + blockSize, literalStart + MAX_LITERAL)
+
+    # the receiver's last block, if short, can only match the very end of the file
+    end = filesize
+    lastSize = baseSize - (len(signatures) - 1) * blockSize
+    if signatures and lastSize < blockSize and filesize - lastSize >= literalStart:
+        weak, strong = signatures[-1]
+        tail = data[filesize - lastSize:]
+        if zlib.adler32(tail) == weak and _strongHash(tail) == strong:
+            end = filesize - lastSize
+    for start in range(literalStart, end, MAX_LITERAL):
+        yield (LITERAL, data[start:min(start + MAX_LITERAL, end)])
+    if end < filesize:
+        yield (BLOCK, len(signatures) - 1)
+
+def _findBlock(table, weak, block):
+    candidates = table.get(weak)
+    if not candidates:
+        return None
+    strong = _strongHash(block)
+    for index, candidateStrong in candidates:
+        if candidateStrong == strong:
+            return index
+    return None
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvDelta
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvDelta(recvSocket, filename, blockSize):
+
+ARGUMENTS:
+    socket recvSocket : socket to read the delta from
+    string filename : receiver's copy of the file in ./files, the one the signatures were made from
+    int blockSize : block size the signatures were made with
+
+RETURNS: bool - True if the file was rebuilt, False if the sender disconnected part way
+
+THROWS
+    RuntimeError if the rebuilt file isn't the size the sender said it is
+    OSError if the socket or the disk fails, once the partial file is removed
+
+NOTES:
+    Counterpart to sendDelta. Rebuilds the file into its partial file (see utils.partPath) from
+    the local copy + the ops, then renames it over the local copy, synced around the rename like utils.recvFile's.
+    A broken delta transfer can't be resumed, so its partial file is removed.
+----------------------------------------------------------------------------------------------
+"""
+def recvDelta(recvSocket, filename, blockSize):
+    path = './files/' + filename
+    partName = utils.partPath(filename)
+    literalBytes = 0
+    reusedBytes = 0
+    base = open(path, 'rb') if os.path.isfile(path) else None
+    try:
+        with open(partName, 'wb') as file:
+            while True:
+                op, value = OP.unpack(utils.recvBytes(recvSocket, OP.size))
+                if op == END:
+                    break
+                if op == LITERAL:
+                    file.flush()
+                    position = file.tell()
+                    if utils.recvToFile(recvSocket, file.fileno(), position, value) < value:
+                        raise RuntimeError('recvDelta socket disconnected while reading!')
+                    file.seek(position + value)
+                    literalBytes += value
+                elif op == BLOCK:
+                    base.seek(value * blockSize)
+                    block = base.read(blockSize)
+                    file.write(block)
+                    reusedBytes += len(block)
+            if file.tell() != value:
+                raise RuntimeError('recvDelta rebuilt file is %d bytes, expected %d' % (file.tell(), value))
+            if utils.WRITE_BEHIND is not None:
+                file.flush()
+                utils.WRITE_BEHIND.commit(file.fileno())
+    except RuntimeError as e:
+        utils.log(e)
+        os.remove(partName)
+        return False
+    except BaseException:
+        # a reset connection or a full disk ends the transfer just the same, its partial file is no use either
+        if os.path.lexists(partName):
+            os.remove(partName)
+        raise
+    finally:
+        if base:
+            base.close()
+
+    os.replace(partName, path)
+    if utils.WRITE_BEHIND is not None:
+        utils.WRITE_BEHIND.placed(path)
+    utils.log('File saved: /files/' + filename, 'literal bytes', literalBytes, 'reused bytes', reusedBytes)
+    return True
@@ -0,0 +1,312 @@
+import bisect
+import json
+import os
+import threading
+import utils
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: index.py - index of the files in ./files, the server's & the client's for SYNC
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+CLASSES:
+    FileIndex(string : filesDir, function : hashLookup)
+
+GLOBAL CONSTANTS:
+    string INDEX_SUFFIX='.index' : the index of ./files is saved as ./files.index
+    int POLL_INTERVAL=5 : seconds between checks of ./files for changes made outside the server
+    int FULL_SCAN_EVERY=12 : every 12th check rescans every file even if the dir looks unchanged
+    int GETALL_PAGE=1000 : entries in 1 GETALL page when the client doesn't ask for a size
+    int GETALL_MAX_PAGE=10000 : most entries a client can ask for in 1 page
+
+NOTES:
+    Keeps name, size, mtime and sha256 of every file in ./files, with the names in sorted order, so
+    GETALL can answer pages & prefix filters without listing the dir. Hashes are only computed when
+    someone asks for them, and kept until the file's size or mtime changes.
+
+    The index is saved to ./files.index and loaded on startup, so a restart doesn't rehash anything, and
+    doesn't rescan the dir if it hasn't changed. It's kept outside ./files, so saving it doesn't change the dir.
+    It's kept current 2 ways: the server updates a name right after it writes it, and a poll rescans
+    the dir when the dir's mtime changes (a file was added, removed or renamed over). Edits made in place
+    by other programs don't touch the dir's mtime, the periodic full scan picks those up.
+
+    The client keeps 1 of its own ./files the same way, so a SYNC only rehashes the files that changed
+    since the last 1 (see client.handleSync).
+-------------------------------------------------------------------------------------------------------
+"""
+
+INDEX_SUFFIX='.index'
+POLL_INTERVAL=5
+FULL_SCAN_EVERY=12
+GETALL_PAGE=1000
+GETALL_MAX_PAGE=10000
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS FileIndex
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class FileIndex(filesDir='./files', hashLookup=None):
+
+ARGUMENTS:
+    string filesDir : dir to index
+    function hashLookup : called as hashLookup(name) to get a hash without reading the file
+                          (eg BlobStore.lookup), returns None if it doesn't know it
+
+NOTES:
+    Each entry is [size, mtime in ns, hex sha256 or None]. Safe to use from several threads.
+----------------------------------------------------------------------------------------------
+"""
+class FileIndex:
+    def __init__(self, filesDir='./files', hashLookup=None):
+        self.filesDir = filesDir
+        self.indexPath = os.path.normpath(filesDir) + INDEX_SUFFIX
+        self.hashLookup = hashLookup
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.sortedNames = []
+        self.dirMtime = None
+        self.dirty = False
+        self.load()
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION load
+
+    INTERFACE: def load(self):
+
+    RETURNS: void
+
+    NOTES:
+        Loads the saved index if there is one. A missing or unreadable index just means starting
+        empty, the next refresh fills it in.
+    ----------------------------------------------------------------------------------------------
+    """
+    def load(self):
+        try:
+            with open(self.indexPath) as file:
+                saved = json.load(file)
+            self.entries = saved['entries']
+            self.dirMtime = saved['dirMtime']
+        except (OSError, ValueError, KeyError):
+            self.entries = {}
+            self.dirMtime = None
+        self.sortedNames = sorted(self.entries)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION save
+
+    INTERFACE: def save(self):
+
+    RETURNS: void
+
+    NOTES:
+        Writes the index to a temp file and renames it over the old one, only if something changed.
+    ----------------------------------------------------------------------------------------------
+    """
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            saved = json.dumps({'dirMtime': self.dirMtime, 'entries': self.entries}, separators=(',', ':'))
+            self.dirty = False
+        tempPath = self.indexPath + '.tmp'
+        with open(tempPath, 'w') as file:
+            file.write(saved)
+        os.replace(tempPath, self.indexPath)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION refresh
+
+    INTERFACE: def refresh(self, full=False):
+
+    ARGUMENTS:
+        bool full : rescan even if the dir's mtime hasn't changed
+
+    RETURNS: bool - True if the dir was scanned
+
+    NOTES:
+        Scans the dir with scandir, which gets sizes & mtimes without a stat call per file on most
+        systems. Entries whose size & mtime match keep their hash. The dir's mtime is read before the
+        scan, so a change made during the scan is picked up by the next refresh.
+    ----------------------------------------------------------------------------------------------
+    """
+    def refresh(self, full=False):
+        dirMtime = os.stat(self.filesDir).st_mtime_ns
+        if not full and dirMtime == self.dirMtime:
+            return False
+
+        with self.lock:
+            oldEntries = self.entries
+        entries = {}
+        for entry in os.scandir(self.filesDir):
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            old = oldEntries.get(entry.name)
+            if old and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                entries[entry.name] = old
+            else:
+                entries[entry.name] = [stat.st_size, stat.st_mtime_ns, None]
+
+        with self.lock:
+            changed = entries != self.entries
+            if changed:
+                if entries.keys() != self.entries.keys():
+                    self.sortedNames = sorted(entries)
+                self.entries = entries
+            self.dirty = self.dirty or changed or dirMtime != self.dirMtime
+            self.dirMtime = dirMtime
+        return True
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION update
+
+    INTERFACE: def update(self, name):
+
+    ARGUMENTS:
+        string name : file in ./files that was just written, replaced or removed
+
+    RETURNS: void
+
+    NOTES:
+        Brings 1 entry up to date without a rescan.
+    ----------------------------------------------------------------------------------------------
+    """
+    def update(self, name):
+        try:
+            stat = os.stat(os.path.join(self.filesDir, name))
+        except FileNotFoundError:
+            stat = None
+        with self.lock:
+            old = self.entries.get(name)
+            if stat is None:
+                if old is not None:
+                    del self.entries[name]
+                    self.sortedNames.pop(bisect.bisect_left(self.sortedNames, name))
+            elif not old or old[0] != stat.st_size or old[1] != stat.st_mtime_ns:
+                self.entries[name] = [stat.st_size, stat.st_mtime_ns, None]
+                if old is None:
+                    bisect.insort(self.sortedNames, name)
+            self.dirty = True
+
+    def names(self):
+        with self.lock:
+            return list(self.sortedNames)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION manifest
+
+    INTERFACE: def manifest(self):
+
+    RETURNS: dict - name -> [size, mtime in ns, hex sha256 or None] of every indexed file, a copy
+
+    NOTES:
+        Hashes that aren't known yet stay None, hashOf computes the ones that are needed.
+    ----------------------------------------------------------------------------------------------
+    """
+    def manifest(self):
+        with self.lock:
+            return {name: list(entry) for name, entry in self.entries.items()}
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION hashOf
+
+    INTERFACE: def hashOf(self, name):
+
+    ARGUMENTS:
+        string name : indexed file
+
+    RETURNS: string - hex sha256 of the file, None if it isn't indexed
+
+    NOTES:
+        Computed the first time it's asked for, from hashLookup if that knows it, by reading the file
+        otherwise. It's only kept if the file didn't change while it was being read.
+    ----------------------------------------------------------------------------------------------
+    """
+    def hashOf(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is None or entry[2]:
+            return entry and entry[2]
+
+        path = os.path.join(self.filesDir, name)
+        hashValue = self.hashLookup(name) if self.hashLookup else None
+        try:
+            hashValue = hashValue or utils.fileDigest(path)
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            if entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                entry[2] = hashValue
+                self.dirty = True
+        return hashValue
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION listing
+
+    INTERFACE: def listing(self, prefix='', after='', limit=GETALL_PAGE, meta=False, hashes=False, maxLength=None):
+
+    ARGUMENTS:
+        string prefix : only names starting with this
+        string after : only names sorting after this, the cursor returned with the previous page
+        int limit : max number of names in the page
+        bool meta : add size & mtime to each name
+        bool hashes : add the sha256 to each name, computing any that aren't known yet
+        int maxLength : max bytes of the page text, None for no limit (v1 packets are capped)
+
+    RETURNS: tuple - (page text, cursor of the next page or '' if this was the last)
+
+    NOTES:
+        Page text is 1 line per file, either just the name or
+            [name]\\t[size]\\t[mtime in ns]\\t[sha256 if asked for]
+        Finds the start of the page with a binary search over the sorted names, so a page costs
+        the same no matter how many files there are.
+    ----------------------------------------------------------------------------------------------
+    """
+    def listing(self, prefix='', after='', limit=GETALL_PAGE, meta=False, hashes=False, maxLength=None):
+        with self.lock:
+            if after >= prefix:
+                start = bisect.bisect_right(self.sortedNames, after)
+            else:
+                start = bisect.bisect_left(self.sortedNames, prefix)
+            page = [(name, list(self.entries[name])) for name in self.sortedNames[start:start + limit + 1]
+                    if name.startswith(prefix)]
+
+        lines = []
+        length = 0
+        cursor = ''
+        for name, entry in page:
+            if len(lines) == limit:
+                cursor = page[len(lines) - 1][0]
+                break
+            line = name
+            if meta or hashes:
+                line += '\t%d\t%d' % (entry[0], entry[1])
+            if hashes:
+                line += '\t' + (self.hashOf(name) or '')
+            length += len(line.encode()) + 1
+            if maxLength is not None and length - 1 > maxLength:
+                cursor = page[len(lines) - 1][0] if lines else ''
+                break
+            lines.append(line)
+        return ('\n'.join(lines), cursor)
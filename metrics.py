@@ -0,0 +1,562 @@
+import bisect
+import collections
+import contextvars
+import threading
+import time
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: metrics.py - per command transfer metrics kept by the server
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+FUNCTIONS:
+    whatever timedCall(Transfer : transfer, float : queued, function : func, args...)
+    socket meterLike(socket : dataSocket, socket : newSocket)
+    void markError(string : error)
+
+CLASSES:
+    Histogram(tuple : buckets)
+    Transfer(string : cmd, string : client, float : started)
+    MeteredSocket(socket : sock, Transfer : transfer)
+    Metrics(void)
+
+GLOBAL CONSTANTS:
+    tuple SECONDS_BUCKETS : histogram bucket upper bounds for durations, in seconds
+    tuple RATE_BUCKETS : histogram bucket upper bounds for throughput, in bytes per second
+    int RECENT_SIZE=100 : number of finished commands kept for STATS
+    int MAX_CLIENTS=256 : number of client ips STATS keeps totals for, the least recently seen are dropped
+    string PREFIX='tcpft_' : prefix of every prometheus metric name
+    ContextVar currentTransfer : Transfer of the command the running coroutine belongs to
+    Metrics registry : the server's metrics
+
+NOTES:
+    Every command the server runs gets a Transfer, which records
+        bytes sent & received on all of its data channels (the data channel is wrapped in a MeteredSocket)
+        duration, from the cmd packet arriving to the data channel closing
+        time to first byte, from the cmd packet arriving to the first byte moving on the data channel
+        queue wait, time its blocking calls spent waiting for a free executor thread
+        throughput, bytes moved / duration
+        the error it failed with, if any
+    When it finishes, it's added to per command counters & histograms, to per client totals, and to the
+    list of recent commands. registry.snapshot() gives all of that for the STATS command, and
+    registry.render() gives the counters & histograms in prometheus text format.
+    Client ips are only kept in the snapshot, so the prometheus series stay few.
+-------------------------------------------------------------------------------------------------------
+"""
+
+SECONDS_BUCKETS=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+RATE_BUCKETS=(10**4, 10**5, 10**6, 10**7, 5 * 10**7, 10**8, 25 * 10**7, 5 * 10**8, 10**9, 25 * 10**8, 10**10)
+RECENT_SIZE=100
+MAX_CLIENTS=256
+PREFIX='tcpft_'
+
+currentTransfer = contextvars.ContextVar('currentTransfer', default=None)
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS Histogram
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class Histogram(buckets):
+
+ARGUMENTS:
+    tuple buckets : sorted upper bounds of the buckets, a last +Inf bucket is always added
+
+NOTES:
+    Counts observations per bucket, not cumulative, the cumulative counts are built when rendered.
+    Not locked, Metrics only touches it under its own lock.
+----------------------------------------------------------------------------------------------
+"""
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION quantile
+
+    INTERFACE: def quantile(self, q):
+
+    ARGUMENTS:
+        float q : quantile to estimate, 0 to 1
+
+    RETURNS: float - upper bound of the bucket the quantile falls in, None if nothing was observed
+    ----------------------------------------------------------------------------------------------
+    """
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        return {'count': self.count, 'mean': round(self.sum / self.count, 6),
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99)}
+
+    def render(self, name, labels):
+        lines = []
+        seen = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            seen += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, seen))
+        lines.append('%s_sum{%s} %s' % (name, labels, repr(self.sum)))
+        lines.append('%s_count{%s} %d' % (name, labels, self.count))
+        return lines
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS Transfer
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class Transfer(cmd, client, started):
+
+ARGUMENTS:
+    string cmd : name of the command, eg 'GET'
+    string client : ip of the client that sent it
+    float started : time.monotonic() when the cmd packet arrived
+
+NOTES:
+    What's been measured so far for 1 running command. Each of its data channels counts its own
+    bytes (see MeteredSocket), they're added up when the command finishes.
+----------------------------------------------------------------------------------------------
+"""
+class Transfer:
+    def __init__(self, cmd, client, started):
+        self.cmd = cmd
+        self.client = client
+        self.started = started
+        self.sockets = []
+        self.queueWait = 0.0
+        self.error = None
+
+    def firstByte(self):
+        times = [sock.firstByte for sock in self.sockets if sock.firstByte is not None]
+        return min(times) - self.started if times else None
+
+    def bytesSent(self):
+        return sum(sock.sent for sock in self.sockets)
+
+    def bytesReceived(self):
+        return sum(sock.received for sock in self.sockets)
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS MeteredSocket
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class MeteredSocket(sock, transfer):
+
+ARGUMENTS:
+    socket sock : data channel socket or session stream to count the bytes of
+    Transfer transfer : command the bytes belong to
+
+NOTES:
+    Stands in for sock, counting what goes thru send/sendall/recv/recv_into, and when the first byte
+    moved. Anything else is passed on to sock, so the utils helpers can't tell the difference.
+    Bytes os.sendfile sends never pass thru send, utils.sendFileRange reports them with countSent.
+    Only 1 thread uses a socket at a time, so the counts aren't locked.
+----------------------------------------------------------------------------------------------
+"""
+class MeteredSocket:
+    def __init__(self, sock, transfer):
+        self.sock = sock
+        self.transfer = transfer
+        self.sent = 0
+        self.received = 0
+        self.firstByte = None
+        transfer.sockets.append(self)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def countSent(self, count):
+        if count and self.firstByte is None:
+            self.firstByte = time.monotonic()
+        self.sent += count
+
+    def countReceived(self, count):
+        if count and self.firstByte is None:
+            self.firstByte = time.monotonic()
+        self.received += count
+
+    def send(self, data):
+        count = self.sock.send(data)
+        self.countSent(count)
+        return count
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+        self.countSent(memoryview(data).nbytes)
+
+    def recv(self, bufsize):
+        data = self.sock.recv(bufsize)
+        self.countReceived(len(data))
+        return data
+
+    def recv_into(self, buffer, nbytes=0):
+        count = self.sock.recv_into(buffer, nbytes)
+        self.countReceived(count)
+        return count
+
+    def close(self):
+        self.sock.close()
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS Metrics
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class Metrics():
+
+NOTES:
+    Counters & histograms per command name, totals per client ip, the most recent commands, and
+    gauges of what's running right now. Safe to use from several threads.
+----------------------------------------------------------------------------------------------
+"""
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.startTime = time.time()
+        self.active = 0
+        self.waiting = 0
+        self.running = 0
+        self.commands = {}
+        self.errors = collections.Counter()
+        self.clients = collections.OrderedDict()
+        self.recent = collections.deque(maxlen=RECENT_SIZE)
+        self.sources = {}
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION addSource
+
+    INTERFACE: def addSource(self, name, func):
+
+    ARGUMENTS:
+        string name : section name in the snapshot, and prefix of its prometheus metrics
+        function func : called with no arguments, returns a dict of numbers
+
+    RETURNS: void
+
+    NOTES:
+        Adds another part of the server's stats (eg cache hits) to STATS & prometheus. Keys ending in
+        _total are rendered as counters, everything else as gauges.
+    ----------------------------------------------------------------------------------------------
+    """
+    def addSource(self, name, func):
+        self.sources[name] = func
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION begin
+
+    INTERFACE: def begin(self, cmd, client, started=None):
+
+    ARGUMENTS:
+        string cmd : name of the command
+        string client : ip of the client
+        float started : time.monotonic() when the cmd packet arrived, now if not given
+
+    RETURNS: Transfer - to wrap the command's data channels with and pass to finish
+    ----------------------------------------------------------------------------------------------
+    """
+    def begin(self, cmd, client, started=None):
+        with self.lock:
+            self.active += 1
+        return Transfer(cmd, client, started or time.monotonic())
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION finish
+
+    INTERFACE: def finish(self, transfer):
+
+    ARGUMENTS:
+        Transfer transfer : command that just ended, set transfer.error first if it failed
+
+    RETURNS: dict - what was recorded for the command
+    ----------------------------------------------------------------------------------------------
+    """
+    def finish(self, transfer):
+        duration = time.monotonic() - transfer.started
+        sent = transfer.bytesSent()
+        received = transfer.bytesReceived()
+        firstByte = transfer.firstByte()
+        rate = (sent + received) / duration if duration > 0 and sent + received else None
+        entry = {'cmd': transfer.cmd, 'client': transfer.client, 'sent': sent, 'received': received,
+                 'seconds': round(duration, 6), 'firstByte': firstByte and round(firstByte, 6),
+                 'queueWait': round(transfer.queueWait, 6), 'rate': rate and int(rate), 'error': transfer.error}
+
+        with self.lock:
+            self.active -= 1
+            stats = self.commands.get(transfer.cmd)
+            if stats is None:
+                stats = self.commands[transfer.cmd] = {
+                    'count': 0, 'errors': 0, 'sent': 0, 'received': 0,
+                    'seconds': Histogram(SECONDS_BUCKETS), 'firstByte': Histogram(SECONDS_BUCKETS),
+                    'queueWait': Histogram(SECONDS_BUCKETS), 'rate': Histogram(RATE_BUCKETS)}
+            stats['count'] += 1
+            stats['sent'] += sent
+            stats['received'] += received
+            stats['seconds'].observe(duration)
+            stats['queueWait'].observe(transfer.queueWait)
+            if firstByte is not None:
+                stats['firstByte'].observe(firstByte)
+            if rate is not None:
+                stats['rate'].observe(rate)
+            if transfer.error:
+                stats['errors'] += 1
+                self.errors[(transfer.cmd, transfer.error)] += 1
+
+            client = self.clients.pop(transfer.client, None) or {'count': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0}
+            client['count'] += 1
+            client['errors'] += 1 if transfer.error else 0
+            client['bytes'] += sent + received
+            client['seconds'] += duration
+            self.clients[transfer.client] = client
+            if len(self.clients) > MAX_CLIENTS:
+                self.clients.popitem(last=False)
+            self.recent.append(entry)
+        return entry
+
+    # gauges of blocking calls waiting for & running on executor threads, see timedCall
+    def queued(self, future):
+        with self.lock:
+            self.waiting += 1
+        future.add_done_callback(self._dropped)
+
+    # a call cancelled before a thread picked it up never gets to started()
+    def _dropped(self, future):
+        if future.cancelled():
+            with self.lock:
+                self.waiting -= 1
+
+    def started(self):
+        with self.lock:
+            self.waiting -= 1
+            self.running += 1
+
+    def done(self):
+        with self.lock:
+            self.running -= 1
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION snapshot
+
+    INTERFACE: def snapshot(self, brief=False):
+
+    ARGUMENTS:
+        bool brief : only the per command counts & mean duration, small enough for a v1 packet
+
+    RETURNS: dict - everything recorded so far, ready to be sent as json
+
+    NOTES:
+        Clients are listed slowest first (lowest bytes per second), so a slow client is at the top.
+        Each source added with addSource gets its own section.
+    ----------------------------------------------------------------------------------------------
+    """
+    def snapshot(self, brief=False):
+        with self.lock:
+            snapshot = {'uptime': int(time.time() - self.startTime), 'active': self.active,
+                        'waiting': self.waiting, 'running': self.running, 'commands': {}}
+            for cmd, stats in self.commands.items():
+                if brief:
+                    snapshot['commands'][cmd] = [stats['count'], stats['errors'], stats['sent'], stats['received'],
+                                                 round(stats['seconds'].sum / stats['count'], 3)]
+                    continue
+                snapshot['commands'][cmd] = {
+                    'count': stats['count'], 'errors': stats['errors'], 'sent': stats['sent'],
+                    'received': stats['received'], 'seconds': stats['seconds'].summary(),
+                    'firstByte': stats['firstByte'].summary(), 'queueWait': stats['queueWait'].summary(),
+                    'rate': stats['rate'].summary()}
+            if brief:
+                return snapshot
+            for name, func in self.sources.items():
+                snapshot[name] = func()
+            snapshot['errors'] = {'%s %s' % key: count for key, count in self.errors.items()}
+            clients = [dict(client, ip=ip, rate=int(client['bytes'] / client['seconds']) if client['seconds'] else 0)
+                       for ip, client in self.clients.items()]
+            snapshot['clients'] = sorted(clients, key=lambda client: client['rate'])
+            snapshot['recent'] = list(self.recent)
+        return snapshot
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION render
+
+    INTERFACE: def render(self):
+
+    RETURNS: string - counters, histograms & gauges in prometheus text exposition format 0.0.4
+    ----------------------------------------------------------------------------------------------
+    """
+    def render(self):
+        lines = []
+        def family(name, kind, text):
+            lines.append('# HELP %s%s %s' % (PREFIX, name, text))
+            lines.append('# TYPE %s%s %s' % (PREFIX, name, kind))
+
+        with self.lock:
+            family('start_time_seconds', 'gauge', 'Unix time the server started.')
+            lines.append('%sstart_time_seconds %d' % (PREFIX, self.startTime))
+            for name, value, text in (('active_commands', self.active, 'Commands running now.'),
+                                      ('blocking_calls_waiting', self.waiting, 'Blocking calls waiting for an executor thread.'),
+                                      ('blocking_calls_running', self.running, 'Blocking calls running on executor threads.')):
+                family(name, 'gauge', text)
+                lines.append('%s%s %d' % (PREFIX, name, value))
+
+            for key, name, text in (('count', 'commands_total', 'Commands finished.'),
+                                    ('errors', 'command_failures_total', 'Commands that failed.'),
+                                    ('sent', 'bytes_sent_total', 'Bytes sent on data channels.'),
+                                    ('received', 'bytes_received_total', 'Bytes received on data channels.')):
+                family(name, 'counter', text)
+                for cmd, stats in self.commands.items():
+                    lines.append('%s%s{cmd="%s"} %d' % (PREFIX, name, cmd, stats[key]))
+
+            family('command_errors_total', 'counter', 'Failed commands by error type.')
+            for (cmd, error), count in self.errors.items():
+                lines.append('%scommand_errors_total{cmd="%s",error="%s"} %d' % (PREFIX, cmd, error, count))
+
+            for key, name, text in (('seconds', 'command_duration_seconds', 'Time from cmd packet to data channel closed.'),
+                                    ('firstByte', 'time_to_first_byte_seconds', 'Time from cmd packet to the first data channel byte.'),
+                                    ('queueWait', 'queue_wait_seconds', 'Time a command spent waiting for executor threads.'),
+                                    ('rate', 'throughput_bytes_per_second', 'Bytes moved per second of command duration.')):
+                family(name, 'histogram', text)
+                for cmd, stats in self.commands.items():
+                    lines.extend(stats[key].render(PREFIX + name, 'cmd="%s"' % cmd))
+
+            for source, func in self.sources.items():
+                for key, value in func().items():
+                    name = '%s_%s' % (source, key)
+                    family(name, 'counter' if key.endswith('_total') else 'gauge', '%s %s.' % (source, key.replace('_', ' ')))
+                    lines.append('%s%s %s' % (PREFIX, name, value))
+        return '\n'.join(lines) + '\n'
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION timedCall
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def timedCall(transfer, queued, func, *args):
+
+ARGUMENTS:
+    Transfer transfer : command the call belongs to, None if it isn't part of a command
+    float queued : time.monotonic() when the call was handed to the executor
+    function func : blocking function to call
+    args : arguments to pass to func
+
+RETURNS: whatever func returns
+
+NOTES:
+    Runs on the executor thread. The time between queued and now is how long the call waited
+    for a free thread, and is added to the command's queue wait.
+----------------------------------------------------------------------------------------------
+"""
+def timedCall(transfer, queued, func, *args):
+    registry.started()
+    if transfer is not None:
+        transfer.queueWait += time.monotonic() - queued
+    try:
+        return func(*args)
+    finally:
+        registry.done()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION meterLike
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def meterLike(dataSocket, newSocket):
+
+ARGUMENTS:
+    socket dataSocket : a command's data channel, metered or not
+    socket newSocket : another data connection for the same command
+
+RETURNS: socket - newSocket, wrapped in a MeteredSocket counting for the same command if dataSocket is metered
+----------------------------------------------------------------------------------------------
+"""
+def meterLike(dataSocket, newSocket):
+    if isinstance(dataSocket, MeteredSocket):
+        return MeteredSocket(newSocket, dataSocket.transfer)
+    return newSocket
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION markError
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def markError(error):
+
+ARGUMENTS:
+    string error : what went wrong, used as the error label
+
+RETURNS: void
+
+NOTES:
+    Marks the running command as failed when it ends without an exception, eg a client that
+    disconnected part way thru a SEND.
+----------------------------------------------------------------------------------------------
+"""
+def markError(error):
+    transfer = currentTransfer.get()
+    if transfer is not None:
+        transfer.error = error
+
+registry = Metrics()
@@ -0,0 +1,213 @@
+import queue
+import threading
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: pipeline.py - staged pipelines that overlap the disk, cpu & network work of 1 transfer
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+FUNCTIONS:
+    bool shouldThread(int : count)
+    list bufferRing(int : size, int : stageCount, bool : threaded)
+    int runPipeline(iterable : source, list : stages, function : sink, bool : threaded)
+
+GLOBAL CONSTANTS:
+    int PIPELINE_DEPTH=2 : chunks each stage can get ahead of the next 1, 0 runs every transfer on 1 thread
+                           (config: [pipeline] depth)
+    int MIN_PIPELINE_BYTES=1048576 : transfers smaller than this run on 1 thread, starting threads costs more
+                                     than they'd save (config: [pipeline] min_bytes)
+    float POLL_SECONDS=0.1 : how often a stage blocked on a full/empty queue checks if the transfer was abandoned
+
+NOTES:
+    A plain transfer loop does 1 thing at a time: read a chunk, hash it, compress it, send it, then read the
+    next 1. The disk sits idle while the socket drains and the socket sits idle while the disk seeks, so
+    the transfer runs at the sum of the stage times instead of the slowest 1.
+
+    A pipeline runs the source (eg reading the file) and each stage (eg hashing, compressing) on a thread of
+    its own, joined by bounded queues, and the sink (eg sendall) on the calling thread. Every stage works on
+    a different chunk at the same time. A queue holds at most PIPELINE_DEPTH chunks, so a fast reader blocks
+    once it's that far ahead of a slow socket and memory stays bounded however big the file is.
+
+    Threads, not processes: file io, socket io, hashlib, zlib & lzma all release the GIL on chunks this big,
+    and a process pool would have to copy every chunk across. Each stage is 1 thread so the chunks stay
+    in order, which a streaming compressor & a running digest need.
+
+    An error in the source or a stage travels down the queues behind the chunks before it & is raised in
+    the caller once the sink has handled them, so a receive that breaks part way still writes what arrived.
+    An error in the sink stops the other threads at their next queue operation.
+-------------------------------------------------------------------------------------------------------
+"""
+
+PIPELINE_DEPTH=2
+MIN_PIPELINE_BYTES=1048576
+POLL_SECONDS=0.1
+
+# marks the end of the source's items
+_END = object()
+
+# carries an error from the source or a stage down to the caller, in order
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION shouldThread
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def shouldThread(count):
+
+ARGUMENTS:
+    int count : bytes the transfer will move
+
+RETURNS: bool - True if the transfer should run its stages on threads
+
+NOTES:
+    A small file is done before the threads would be, so it runs on the caller's thread as before.
+----------------------------------------------------------------------------------------------
+"""
+def shouldThread(count):
+    return PIPELINE_DEPTH > 0 and count >= MIN_PIPELINE_BYTES
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION bufferRing
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def bufferRing(size, stageCount, threaded=True):
+
+ARGUMENTS:
+    int size : bytes per buffer
+    int stageCount : number of stages between the source & the sink
+    bool threaded : False if the pipeline will run on 1 thread
+
+RETURNS: list - memoryviews of size byte buffers for a source to fill in turn (eg with itertools.cycle)
+
+NOTES:
+    There's 1 more buffer than the pipeline can hold at once, every queue full plus 1 in the hands of the
+    source, each stage & the sink. So by the time the source comes back around to a buffer, whatever was
+    done with it last time is finished, and nothing needs to hand buffers back. On 1 thread every chunk is
+    done with before the next is read, so 1 buffer is enough.
+----------------------------------------------------------------------------------------------
+"""
+def bufferRing(size, stageCount, threaded=True):
+    count = (stageCount + 1) * PIPELINE_DEPTH + stageCount + 2 if threaded else 1
+    return [memoryview(bytearray(size)) for i in range(count)]
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runPipeline
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def runPipeline(source, stages, sink, threaded=True):
+
+ARGUMENTS:
+    iterable source : yields the chunks, eg a generator reading a file or a socket
+    list stages : functions each chunk goes thru in order, each returns the chunk for the next 1
+    function sink : called with each chunk that comes out of the last stage
+    bool threaded : False to run everything on the calling thread, 1 chunk at a time
+
+RETURNS: int - number of chunks that reached the sink
+
+THROWS
+    the first error raised by the source, a stage or the sink
+
+NOTES:
+    See the file NOTES. Every thread has finished by the time this returns or raises, so the caller can
+    go on using the socket & file right after.
+----------------------------------------------------------------------------------------------
+"""
+def runPipeline(source, stages, sink, threaded=True):
+    count = 0
+    if not threaded:
+        for item in source:
+            for stage in stages:
+                item = stage(item)
+            sink(item)
+            count += 1
+        return count
+
+    abandoned = threading.Event()
+    queues = [queue.Queue(PIPELINE_DEPTH) for i in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_produce, args=(source, queues[0], abandoned), daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(target=_transform, args=(stage, queues[i], queues[i + 1], abandoned), daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = _get(queues[-1], abandoned)
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            sink(item)
+            count += 1
+    finally:
+        abandoned.set()
+        for thread in threads:
+            thread.join()
+    return count
+
+# runs the source on its own thread, ending its items with _END or the error it raised
+def _produce(source, outbox, abandoned):
+    try:
+        for item in source:
+            if not _put(outbox, item, abandoned):
+                return
+        _put(outbox, _END, abandoned)
+    except BaseException as e:
+        _put(outbox, _Failure(e), abandoned)
+
+# runs 1 stage on its own thread, passing _END & errors on after the items before them
+def _transform(stage, inbox, outbox, abandoned):
+    while True:
+        item = _get(inbox, abandoned)
+        if item is not _END and not isinstance(item, _Failure):
+            try:
+                item = stage(item)
+            except BaseException as e:
+                item = _Failure(e)
+        if not _put(outbox, item, abandoned) or item is _END or isinstance(item, _Failure):
+            return
+
+# blocking put that gives up if the pipeline was abandoned, False if it did
+def _put(q, item, abandoned):
+    while not abandoned.is_set():
+        try:
+            q.put(item, timeout=POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+# blocking get that returns _END if the pipeline was abandoned
+def _get(q, abandoned):
+    while not abandoned.is_set():
+        try:
+            return q.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return _END
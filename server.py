@@ -1,5 +1,22 @@
+import sys
+import getopt
 import os
+import asyncio
+import concurrent.futures
 import utils
+import session
+import delta
+import store
+import index
+import metrics
+import cache
+import shaper
+import writebehind
+import configparser
+import signal
+import json
+import time
+import hashlib
 import traceback
 """
 ------------------------------------------------------------------------------------------------------
@@ -15,14 +32,40 @@ PROGRAMMER: Junyin Xia
 
 FUNCTIONS:
     void main (void)
-    void handleGetAll(socket : dataSocket)
-    void handleGet(socket : dataSocket, string : filename)
-    void handleSend(socket : dataSocket, string : filename)
+    coroutine serve(socket : listenSocket, int : metricsPort)
+    coroutine serveMetrics(StreamReader : reader, StreamWriter : writer)
+    void reloadShaping(void)
+    coroutine handleClient(StreamReader : reader, StreamWriter : writer)
+    coroutine serveSession(StreamReader : reader, StreamWriter : writer, string : clientIp, int : version)
+    coroutine runCommand(string : cmd, socket : dataSocket, string : msg, string : clientIp, string : peer, float : started)
+    coroutine openDataChannel(string : clientIp, int : bindPort, int : port)
+    coroutine openExtraChannels(socket : dataSocket, string : clientIp, int : count, int : port)
+    coroutine runBlocking(function : func, args..., Executor : pool)
+    coroutine runTransfer(int : size, function : func, args...)
+    coroutine pollIndex(void)
+    coroutine handleGetAll(socket : dataSocket, dict : opts)
+    coroutine handleGet(socket : dataSocket, string : filename, dict : opts, string : clientIp)
+    coroutine handleSend(socket : dataSocket, string : filename, dict : opts, string : clientIp)
+    coroutine handleMultiGet(socket : dataSocket, dict : opts)
+    coroutine handleMultiSend(socket : dataSocket, dict : opts)
+    coroutine handleStats(socket : dataSocket)
+    coroutine handleDelete(socket : dataSocket)
+
+GLOBAL CONSTANTS:
+    int MAX_WORKERS=64 : max number of threads doing blocking disk/socket work for commands at the same time
+    int MAX_TRANSFERS=64 : max number of threads moving the bytes of big transfers at the same time, a pool
+                           apart from MAX_WORKERS' (see runTransfer)
+    int SMALL_TRANSFER=1048576 : transfers of up to this many bytes move on the MAX_WORKERS pool, with listings
+    string METRICS_HOST='127.0.0.1' : the prometheus endpoint only listens locally
+    float NAME_POLL=0.05 : how often a SEND waiting on another upload of the same name checks if it's done
 
 NOTES:
     This is a terminal-based fileshare server that handle client requests to transfer files of all sizes 
     both ways across a local network using TCP. On start, the server program will listen on port 7005 for clients
     Once a client connects, it continuously read and execute commands from the client.
+    The server runs on an asyncio event loop, so any number of clients can be connected and transferring at once.
+    Each control connection gets its own coroutine, and the blocking file & data socket work of a command
+    is handed off to a thread pool so it never stalls the event loop.
     
     Two channels are used:
         control channel - created when a client connection is accepted, client sends commands thru this channel
@@ -30,11 +73,47 @@ NOTES:
 
         data channel - created after client issues command through control channel. the server establishes a new connection on port 7006
             on this channel to transfer file data. Runs between clientIp:8888 <-> serverIp:7006
+            A client that sent port=N with the command listens on clientIp:N instead, usually a port the OS
+            picked for it, so several commands (or client programs on 1 host) don't fight over 8888.
+
+    If a client sends a SESSION cmd instead, its control connection becomes a multiplexed session (see session.py)
+    and every command after that runs on its own stream inside that 1 connection, no connect-back needed.
+
+    MGET/MSEND move a whole batch of files (names & glob patterns) back to back on 1 data channel.
+    DELETE removes a list of files, for clients mirroring a dir onto the server (see client.handleSync).
+
+    File listings are served from an index of ./files kept in memory & on disk (see index.py).
+
+    Uploaded files are deduplicated by content in a hard-linked blob store under ./files/.store (see store.py).
+
+    Files that keep getting fetched are served from an in memory cache (see cache.py).
+
+    Every command's bytes, duration, time to first byte, throughput, queue wait & errors are recorded (see metrics.py).
+    A client gets them with a STATS cmd, and -m <port> serves them to prometheus on http://127.0.0.1:<port>/metrics.
+
+    Data channels can be held to bandwidth limits for the whole server & per client, shared out fairly between
+    the running commands (see shaper.py). The limits are in the config file, and kill -HUP re-reads them.
+
+    Uploads are written to disk by writer threads behind a bounded queue, so a slow disk doesn't stall the
+    socket reads, and received files are synced to disk per the configured durability (see writebehind.py).
 
     At any time, the user can terminate the server by hitting 'ctrl+c' (This also cleans up any sockets)
 -------------------------------------------------------------------------------------------------------
 """
 
+MAX_WORKERS=64
+MAX_TRANSFERS=64
+SMALL_TRANSFER=1048576
+METRICS_HOST='127.0.0.1'
+NAME_POLL=0.05
+
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+transferExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_TRANSFERS)
+blobStore = None
+fileIndex = None
+fileCache = None
+configFile = utils.CONFIG_FILE
+
 """
 ----------------------------------------------------------------------------------------------
 FUNCTION main
@@ -52,51 +131,547 @@ ARGUMENTS: void
 RETURNS: void
 
 NOTES:
-Entry point of the server application. Main function creates the listening socket, and runs a foreverloop to 
-handle client requests. It also prints client statuses.
-As this is simple server, only 1 client will be handled at a time. The first client needs to disconnect before server loop
-will accept any new connections. 
+Entry point of the server application. Main function opens the blob store, loads the file index, creates the 
+listening socket, and runs the asyncio event loop that serves clients until ctrl+c is hit.
+Pass -b <bytes> to read & receive file data in fixed size chunks (see utils.setBufferSize), eg when benchmarking.
+Pass -w <bytes> to set the socket send & receive buffers instead of leaving them to the OS (see utils.tuneSocket).
+Pass -c <file> to read socket tuning, bandwidth limits & write-behind settings from a config file other than
+utils.CONFIG_FILE (see utils.loadConfig, shaper.Scheduler.loadConfig & writebehind.WriteBehind.loadConfig).
+The config file is read first, so -b & -w override it.
+Pass -m <port> to serve metrics in prometheus format on that local port.
+Pass -k <bytes> to change how much memory the hot file cache can use (cache.CACHE_BYTES by default), 0 turns it off.
 ----------------------------------------------------------------------------------------------
 """
 def main():
-    listenSocket = utils.createTcpSocket(utils.SERVER_COMM_PORT)
+    try:
+        opts, args = getopt.getopt(sys.argv[1:],'b:w:c:m:k:',['buffer=','window=','config=','metrics=','cache='])
+        configs = [arg for opt, arg in opts if opt in ('-c', '--config')]
+        global configFile
+        configFile = configs[-1] if configs else utils.CONFIG_FILE
+        utils.loadConfig(configFile, bool(configs))
+        shaper.scheduler.loadConfig(configFile)
+        writebehind.writeBehind.loadConfig(configFile)
+    except (getopt.GetoptError, OSError, ValueError, configparser.Error) as e:
+        print(e)
+        print(sys.argv[0] + ' [-b <chunk bytes>] [-w <socket buffer bytes>] [-c <config file>] [-m <metrics port>] [-k <cache bytes>]')
+        sys.exit(2)
+    metricsPort = None
+    cacheBytes = cache.CACHE_BYTES
+    for opt, arg in opts:
+        if opt in ('-b', '--buffer'):
+            utils.setBufferSize(int(arg))
+        elif opt in ('-w', '--window'):
+            utils.SOCKET_BUFFER = int(arg)
+        elif opt in ('-m', '--metrics'):
+            metricsPort = int(arg)
+        elif opt in ('-k', '--cache'):
+            cacheBytes = int(arg)
+
+    global blobStore, fileIndex, fileCache
+    blobStore = store.BlobStore()
+    blobStore.collectGarbage()
+    fileIndex = index.FileIndex(hashLookup=blobStore.lookup)
+    fileIndex.refresh()
+    fileIndex.save()
+    if cacheBytes > 0:
+        fileCache = cache.FileCache(maxBytes=cacheBytes)
+        metrics.registry.addSource('cache', fileCache.stats)
+    metrics.registry.addSource('shaping', shaper.scheduler.stats)
+    utils.WRITE_BEHIND = writebehind.writeBehind
+    metrics.registry.addSource('writes', writebehind.writeBehind.stats)
+    if shaper.scheduler.limited():
+        print('Shaping data channels:', shaper.scheduler.describe())
+    listenSocket = utils.createTcpSocket(utils.SERVER_COMM_PORT, utils.CONTROL)
     listenSocket.listen(5)                           
     print('Server started listening on port', utils.SERVER_COMM_PORT,'ctrl+c to exit');
     try:
-        while True:
-            controlSocket, clientIpPort = listenSocket.accept()
-            isConnected=True
-            clientIp = clientIpPort[0]
-            print('New client:', clientIpPort)
-            while isConnected:
-                data = controlSocket.recv(1)
-                if not data:
-                    print ('client disconnected:', clientIpPort)
-                    isConnected=False
-                    continue
-                cmd = data.decode()
-                print('Client', clientIp, 'request', utils.CMDS[int(cmd)])
-
-                dataSocket = utils.createTcpSocket(utils.SERVER_TX_PORT)
-                dataSocket.connect((clientIp, utils.PORT_X))
-
-                # cant use utils.readCmdPacket(controlSocket), already got 1 byte to test client connection
-                msgLen=int(utils.recvStr(controlSocket,3))
-                filename=utils.recvStr(controlSocket, msgLen)
-
-                if cmd == utils.GETALL:
-                    handleGetAll(dataSocket)
-                elif cmd == utils.GET:
-                    handleGet(dataSocket, filename)                
-                elif cmd == utils.SEND:
-                    handleSend(dataSocket, filename)
-                dataSocket.close()
+        asyncio.run(serve(listenSocket, metricsPort))
     except KeyboardInterrupt:
         print('\nexit called.')
     except Exception as e: 
         traceback.print_exc()
     finally:
         listenSocket.close()
+        executor.shutdown(wait=False)
+        transferExecutor.shutdown(wait=False)
+        fileIndex.save()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION serve
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def serve(listenSocket, metricsPort=None):
+
+ARGUMENTS: 
+    socket listenSocket : bound & listening socket on the control channel port
+    int metricsPort : local port to serve prometheus metrics on, None for no endpoint
+    
+RETURNS: void
+
+NOTES:
+    Hands the listening socket to asyncio, which accepts clients forever and starts a
+    handleClient coroutine for each one. Also starts polling the file index, and the metrics endpoint if asked for.
+    SIGHUP re-reads the bandwidth limits (see reloadShaping), where the platform has it.
+----------------------------------------------------------------------------------------------
+"""
+async def serve(listenSocket, metricsPort=None):
+    server = await asyncio.start_server(handleClient, sock=listenSocket)
+    asyncio.create_task(pollIndex())
+    if hasattr(signal, 'SIGHUP'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reloadShaping)
+    if metricsPort:
+        await asyncio.start_server(serveMetrics, METRICS_HOST, metricsPort)
+        print('Serving metrics on http://%s:%d/metrics' % (METRICS_HOST, metricsPort))
+    async with server:
+        await server.serve_forever()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION serveMetrics
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def serveMetrics(reader, writer):
+
+ARGUMENTS: 
+    StreamReader reader : read side of an http connection to the metrics port
+    StreamWriter writer : write side of the connection
+    
+RETURNS: void
+
+NOTES:
+    Answers 1 http GET with metrics.registry.render(), the prometheus text format, and closes the connection.
+    Only /metrics (and /) are served, anything else gets a 404.
+----------------------------------------------------------------------------------------------
+"""
+async def serveMetrics(reader, writer):
+    try:
+        request = (await reader.readline()).split()
+        while (await reader.readline()).strip():
+            pass
+        if len(request) > 1 and request[1].split(b'?')[0] in (b'/metrics', b'/'):
+            status, body = '200 OK', metrics.registry.render().encode()
+        else:
+            status, body = '404 Not Found', b'not found\n'
+        writer.write(('HTTP/1.0 %s\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\n'
+                      'Connection: close\r\n\r\n' % (status, len(body))).encode() + body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION reloadShaping
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def reloadShaping():
+
+ARGUMENTS: void
+    
+RETURNS: void
+
+NOTES:
+    Re-reads the [shaping] & [weights] sections of the config file and applies them to running transfers too,
+    eg after editing the limits: kill -HUP <server pid>. A file with a bad setting is reported and the
+    limits stay as they were.
+----------------------------------------------------------------------------------------------
+"""
+def reloadShaping():
+    try:
+        shaper.scheduler.loadConfig(configFile)
+    except (OSError, ValueError, configparser.Error) as e:
+        print('Config reload failed, keeping the old limits:', e)
+        return
+    print('Reloaded', configFile + ', shaping data channels:', shaper.scheduler.describe())
+
+"""
+----------------------------------------------------------------------------------------------
+
+FUNCTION handleClient
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def handleClient(reader, writer):
+
+ARGUMENTS: 
+    StreamReader reader : read side of the client's control connection
+    StreamWriter writer : write side of the client's control connection
+    
+RETURNS: void
+
+NOTES:
+    Serves 1 control session. Reads cmd packets until the client disconnects, and for each
+    one opens a data channel back to the client and runs the matching handler.
+    A SESSION cmd hands the rest of the connection over to serveSession.
+    Each cmd packet's first byte says whether the client speaks packet format v1 or v2 (see utils.readCmdPacket),
+    and the command's data channel is set to the same format.
+    A command that carries port=N has a data port of its own to be connected back to, so it's run as a task
+    and the next cmd packet is read right away. The client can have any number of them running at once.
+    Commands without it all go to port 8888, so they're run 1 at a time like before.
+    An error in one command or session is printed and only ends that command or client, other clients carry on.
+    A cmd packet longer than utils.MAX_PACKET ends the client before its msg is read.
+----------------------------------------------------------------------------------------------
+"""
+async def handleClient(reader, writer):
+    clientIpPort = writer.get_extra_info('peername')
+    clientIp = clientIpPort[0]
+    print('New client:', clientIpPort)
+    tasks = set()
+
+    async def runConcurrent(cmd, port, msg, version, started):
+        try:
+            dataSocket = await openDataChannel(clientIp, utils.SERVER_TX_PORT, port)
+            utils.setProtocol(dataSocket, version)
+            await runCommand(cmd, dataSocket, msg, clientIp, started=started)
+        except Exception as e:
+            traceback.print_exc()
+
+    try:
+        while True:
+            data = await reader.read(1)
+            if not data:
+                break
+            started = time.monotonic()
+            # same layout as utils.readCmdPacket, but read thru the asyncio stream
+            if data[0] == utils.V2_MARKER:
+                version = utils.PROTOCOL_V2
+                header = data + await reader.readexactly(utils.CMD_HEADER.size - 1)
+                marker, flag, msgLen = utils.CMD_HEADER.unpack(header)
+                cmd = flag.decode()
+            else:
+                version = utils.PROTOCOL_V1
+                cmd = data.decode()
+                msgLen=int((await reader.readexactly(3)).decode())
+            if msgLen > utils.MAX_PACKET:
+                print('Client', clientIp, 'sent a packet of', msgLen, 'bytes, disconnecting')
+                break
+            msg=(await reader.readexactly(msgLen)).decode()
+            print('Client', clientIp, 'request', utils.CMDS[int(cmd)])
+
+            if cmd == utils.SESSION:
+                await serveSession(reader, writer, clientIp, version)
+                break
+
+            port = utils.decodeRequest(msg)[1].get('port')
+            if port is not None:
+                task = asyncio.create_task(runConcurrent(cmd, int(port), msg, version, started))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                continue
+
+            dataSocket = await openDataChannel(clientIp)
+            utils.setProtocol(dataSocket, version)
+            await runCommand(cmd, dataSocket, msg, clientIp, started=started)
+    except asyncio.IncompleteReadError:
+        pass
+    except Exception as e: 
+        traceback.print_exc()
+    finally:
+        # commands already running have their own data channels, let them finish
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        print ('client disconnected:', clientIpPort)
+        writer.close()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION serveSession
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def serveSession(reader, writer, clientIp, version=utils.PROTOCOL_V2):
+
+ARGUMENTS: 
+    StreamReader reader : read side of the client's control connection
+    StreamWriter writer : write side of the client's control connection
+    string clientIp : ip of the client, for logging
+    int version : packet format the client spoke in its SESSION cmd, used on all its streams
+    
+RETURNS: void
+
+NOTES:
+    Runs a multiplexed session on the control connection until the client disconnects.
+    Each stream the client opens carries 1 command, and is run as its own task so 
+    transfers on the same connection overlap.
+----------------------------------------------------------------------------------------------
+"""
+async def serveSession(reader, writer, clientIp, version=utils.PROTOCOL_V2):
+    tasks = set()
+
+    async def runStream(cmd, stream, msg, started):
+        try:
+            # no connect-backs in a session, so no clientIp for extra streams
+            await runCommand(cmd, stream, msg, None, clientIp, started)
+        except Exception as e:
+            traceback.print_exc()
+
+    def onOpen(stream, cmd, msg):
+        print('Client', clientIp, 'session request', utils.CMDS[int(cmd)])
+        utils.setProtocol(stream, version)
+        task = asyncio.create_task(runStream(cmd, stream, msg, time.monotonic()))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    print('Client', clientIp, 'started a session')
+    await session.AsyncSession(reader, writer, onOpen).run()
+    for task in list(tasks):
+        task.cancel()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runCommand
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def runCommand(cmd, dataSocket, msg, clientIp, peer=None, started=None):
+
+ARGUMENTS: 
+    string cmd : one of the command flags, GETALL/GET/SEND/MGET/MSEND/STATS/DELETE
+    socket dataSocket : data channel socket or session stream for this command
+    string msg : msg sent with the cmd packet, filename + options (see utils.encodeRequest)
+    string clientIp : ip to open extra data connections to, None if the client can't take any
+    string peer : ip of the client for the metrics, clientIp if not given
+    float started : time.monotonic() when the cmd packet arrived, now if not given
+    
+RETURNS: void
+
+NOTES:
+    Runs the handler matching cmd, then closes the data channel.
+    The command is recorded in metrics.registry: the data channel is wrapped in a MeteredSocket to count its
+    bytes, and the Transfer is set as metrics.currentTransfer so runBlocking can add to its queue wait.
+    Inside that, the data channel is wrapped in a ShapedSocket, so its bytes are held to the bandwidth limits
+    as 1 flow of the client's (see shaper.py).
+----------------------------------------------------------------------------------------------
+"""
+async def runCommand(cmd, dataSocket, msg, clientIp, peer=None, started=None):
+    filename, opts = utils.decodeRequest(msg)
+    transfer = metrics.registry.begin(utils.CMDS[int(cmd)], peer or clientIp, started)
+    flow = shaper.scheduler.open(peer or clientIp)
+    meteredSocket = metrics.MeteredSocket(shaper.ShapedSocket(dataSocket, flow), transfer)
+    utils.setProtocol(meteredSocket, utils.protocolOf(dataSocket))
+    dataSocket = meteredSocket
+    token = metrics.currentTransfer.set(transfer)
+    try:
+        if cmd == utils.GETALL:
+            await handleGetAll(dataSocket, opts)
+        elif cmd == utils.GET:
+            await handleGet(dataSocket, filename, opts, clientIp)
+        elif cmd == utils.SEND:
+            await handleSend(dataSocket, filename, opts, clientIp)
+        elif cmd == utils.MGET:
+            await handleMultiGet(dataSocket, opts)
+        elif cmd == utils.MSEND:
+            await handleMultiSend(dataSocket, opts)
+        elif cmd == utils.STATS:
+            await handleStats(dataSocket)
+        elif cmd == utils.DELETE:
+            await handleDelete(dataSocket)
+    except BaseException as e:
+        transfer.error = transfer.error or type(e).__name__
+        raise
+    finally:
+        dataSocket.close()
+        metrics.currentTransfer.reset(token)
+        metrics.registry.finish(transfer)
+        shaper.scheduler.close(flow)
+
+"""
+----------------------------------------------------------------------------------------------
+
+FUNCTION openDataChannel
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def openDataChannel(clientIp, bindPort=utils.SERVER_TX_PORT, port=utils.PORT_X):
+
+ARGUMENTS: 
+    string clientIp : ip of the client to connect back to
+    int bindPort : local port to connect from, None for an OS assigned port
+    int port : client port to connect to, the port=N the client sent with the command if it did
+    
+RETURNS: socket - connected, blocking tcp socket on the data channel
+
+NOTES:
+    Connects from port 7006 to the client's listening data port without blocking the event loop.
+    Several connections can come from port 7006 at once, as long as each goes to a different client port.
+    The socket is switched back to blocking mode afterwards, since the transfer itself runs on 
+    an executor thread using the blocking helpers in utils.
+----------------------------------------------------------------------------------------------
+"""
+async def openDataChannel(clientIp, bindPort=utils.SERVER_TX_PORT, port=utils.PORT_X):
+    dataSocket = utils.createTcpSocket(bindPort, utils.DATA)
+    try:
+        dataSocket.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(dataSocket, (clientIp, port))
+        dataSocket.setblocking(True)
+    except:
+        dataSocket.close()
+        raise
+    return dataSocket
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION openExtraChannels
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def openExtraChannels(dataSocket, clientIp, count, port=utils.PORT_X):
+
+ARGUMENTS: 
+    socket dataSocket : data channel already opened for the command
+    string clientIp : ip of the client to connect back to
+    int count : total number of data connections wanted, dataSocket included
+    int port : client port the command's data channel went to
+    
+RETURNS: list - dataSocket followed by count-1 new data connections
+
+NOTES:
+    Opens the extra connections of a parallel transfer. They connect from OS assigned ports, since
+    every connection to the same client port needs a different local port.
+    If dataSocket is metered & shaped, the new connections count their bytes for the same command, in its flow.
+----------------------------------------------------------------------------------------------
+"""
+async def openExtraChannels(dataSocket, clientIp, count, port=utils.PORT_X):
+    dataSockets = [dataSocket]
+    try:
+        for i in range(count - 1):
+            newSocket = shaper.shapeLike(dataSocket, await openDataChannel(clientIp, None, port))
+            dataSockets.append(metrics.meterLike(dataSocket, newSocket))
+            utils.setProtocol(dataSockets[-1], utils.protocolOf(dataSocket))
+    except:
+        for extraSocket in dataSockets[1:]:
+            extraSocket.close()
+        raise
+    return dataSockets
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runBlocking
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def runBlocking(func, *args, pool=None):
+
+ARGUMENTS: 
+    function func : blocking function to call
+    args : arguments to pass to func
+    Executor pool : thread pool to run it on, None for the server's shared executor
+    
+RETURNS: whatever func returns
+
+NOTES:
+    Runs a blocking call (disk I/O, blocking socket I/O) on the server's thread pool and waits for it.
+    How long it waits for a free thread is added to the running command's queue wait (see metrics.timedCall).
+----------------------------------------------------------------------------------------------
+"""
+async def runBlocking(func, *args, pool=None):
+    future = (pool or executor).submit(metrics.timedCall, metrics.currentTransfer.get(), time.monotonic(), func, *args)
+    metrics.registry.queued(future)
+    return await asyncio.wrap_future(future)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION runTransfer
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def runTransfer(size, func, *args):
+
+ARGUMENTS:
+    int size : bytes the call will move, None if it isn't known (a batch, a delta)
+    function func : blocking function that moves a file's bytes over a data channel
+    args : arguments to pass to func
+
+RETURNS: whatever func returns
+
+NOTES:
+    A transfer held to a bandwidth limit waits for its tokens on the thread it runs on (see shaper.Scheduler.reserve).
+    On the shared executor, enough bulk transfers waiting like that would take every thread, and listings, STATS
+    & small GETs would queue behind them. So the big ones run on transferExecutor, a pool of their own, and the
+    shared executor stays free for quick work. Transfers of up to SMALL_TRANSFER bytes stay on the shared 1,
+    they're done in a few slices and shouldn't wait for a bulk transfer's thread.
+----------------------------------------------------------------------------------------------
+"""
+async def runTransfer(size, func, *args):
+    small = size is not None and size <= SMALL_TRANSFER
+    return await runBlocking(func, *args, pool=None if small else transferExecutor)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION pollIndex
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def pollIndex():
+
+ARGUMENTS: void
+    
+RETURNS: void
+
+NOTES:
+    Every index.POLL_INTERVAL seconds, refreshes the file index if ./files changed (a full rescan every 
+    index.FULL_SCAN_EVERY polls) and saves it if anything changed. Runs until the server stops.
+----------------------------------------------------------------------------------------------
+"""
+async def pollIndex():
+    polls = 0
+    while True:
+        await asyncio.sleep(index.POLL_INTERVAL)
+        polls += 1
+        try:
+            await runBlocking(fileIndex.refresh, polls % index.FULL_SCAN_EVERY == 0)
+            await runBlocking(fileIndex.save)
+        except OSError as e:
+            print('File index poll failed:', e)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -108,21 +683,42 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def handleGetAll(dataSocket):
+INTERFACE: async def handleGetAll(dataSocket, opts):
 
 ARGUMENTS: 
     socket dataSocket : tcp socket opened on data channel
+    dict opts : options sent with the request
     
 RETURNS: void
 
 NOTES:
     Handles getall requests sent from clients.
-    Function reads the list of files in files dir, and sends it back to client.
+    Function reads the list of files from the file index, and sends it back to client.
+    A v1 client only gets as many names as fit in 1 v1 packet.
+
+    A client that sends options gets 1 page of the sorted list instead, as 2 data packets: the page
+    (see index.FileIndex.listing) and the cursor to send as after=<cursor> for the next page, empty on the last.
+        prefix=<str> : only names starting with it
+        after=<name> : start after this name
+        limit=N : names per page, up to index.GETALL_MAX_PAGE
+        meta=1 : add size & mtime, hash=1 : add size, mtime & sha256
 ----------------------------------------------------------------------------------------------
 """
-def handleGetAll(dataSocket):
-    filenames = '  '.join(os.listdir('./files'))
-    utils.sendDataPacket(dataSocket,filenames)
+async def handleGetAll(dataSocket, opts):
+    maxLength = utils.V1_MAX_LENGTH if utils.protocolOf(dataSocket) == utils.PROTOCOL_V1 else None
+    if not opts:
+        filenames = '  '.join(fileIndex.names())
+        if maxLength and len(filenames.encode()) > maxLength:
+            # a v1 packet can't hold the whole list, send as many whole names as fit
+            filenames = filenames.encode()[:maxLength].decode(errors='ignore').rpartition('  ')[0]
+        await runBlocking(utils.sendDataPacket, dataSocket, filenames)
+        return
+
+    limit = min(max(int(opts.get('limit', index.GETALL_PAGE)), 1), index.GETALL_MAX_PAGE)
+    page, cursor = await runBlocking(fileIndex.listing, opts.get('prefix', ''), opts.get('after', ''),
+                                     limit, 'meta' in opts, 'hash' in opts, maxLength)
+    await runBlocking(utils.sendDataPacket, dataSocket, page)
+    await runBlocking(utils.sendDataPacket, dataSocket, cursor)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -134,11 +730,13 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def handleGet(dataSocket, filename):
+INTERFACE: async def handleGet(dataSocket, filename, opts, clientIp):
 
 ARGUMENTS: 
     socket dataSocket : tcp socket opened on data channel
     string filename : file that client wants server to send back
+    dict opts : options sent with the request
+    string clientIp : ip to open extra data connections to, None if the client can't take any
     
 RETURNS: void
 
@@ -146,14 +744,71 @@ NOTES:
     Handles get file requests sent from clients.
     If a requested file isnt found on server, a NOT_FOUND message is returned to the client
     Otherwise, a FOUND message + the file bytes are returned.
+
+    If the client asked for streams=N (0 to auto-tune), the file goes out in parallel. After FOUND the 
+    server sends [stream count filesize] as a data packet, opens the extra data connections and 
+    sends 1 range of the file on each (see utils.sendFileParallel).
+
+    If the client sent offset=N (resuming a broken GET), FOUND is followed by the offset the server
+    will actually start from as a data packet, 0 if N is past the end of the file. An optional length=N
+    limits how many bytes are sent. If it sent compress=<codec>, the file is compressed on the fly (see utils.sendFile).
+
+    If the client sent delta=1 (it has an older copy), FOUND is followed by the client's block signatures,
+    and the server answers with a delta against them instead of the whole file (see delta.py).
+
+    A plain GET (no delta, streams, compress or sparse) of a file that's in the hot file cache is sent from memory.
+
+    If the client sent verify=1, the file (or each parallel range) is followed by its sha256 (see utils.sendFile).
+    A whole file that's a blob in the store already has a known digest, so it still goes out zero-copy.
+
+    If the client sent sparse=1, a plain GET only sends the file's data regions, and the client recreates
+    the holes (see utils.sendFile).
 ----------------------------------------------------------------------------------------------
 """
-def handleGet(dataSocket, filename):
-    if not os.path.isfile('./files/' + filename):
-        utils.sendDataPacket(dataSocket, utils.NOT_FOUND)
+async def handleGet(dataSocket, filename, opts, clientIp):
+    cached = None
+    if fileCache and not ('delta' in opts or 'streams' in opts or 'compress' in opts or 'sparse' in opts):
+        cached = await runBlocking(fileCache.lookup, filename)
+    if cached is None and not await runBlocking(os.path.isfile, './files/' + filename):
+        await runBlocking(utils.sendDataPacket, dataSocket, utils.NOT_FOUND)
+    elif 'delta' in opts:
+        await runBlocking(utils.sendDataPacket, dataSocket, utils.FOUND)
+        signatures = await runBlocking(delta.recvSignatures, dataSocket)
+        await runTransfer(None, delta.sendDelta, dataSocket, filename, signatures)
+    elif 'streams' in opts:
+        await runBlocking(utils.sendDataPacket, dataSocket, utils.FOUND)
+        filesize = await runBlocking(os.path.getsize, './files/' + filename)
+        count = utils.resolveStreamCount(int(opts['streams']), filesize) if clientIp else 1
+        await runBlocking(utils.sendDataPacket, dataSocket, '%d %d' % (count, filesize))
+        dataSockets = await openExtraChannels(dataSocket, clientIp, count, int(opts.get('port', utils.PORT_X)))
+        try:
+            await runTransfer(filesize, utils.sendFileParallel, dataSockets, filename, 'verify' in opts)
+        finally:
+            for extraSocket in dataSockets[1:]:
+                extraSocket.close()
     else:
-        utils.sendDataPacket(dataSocket, utils.FOUND)
-        utils.sendFile(dataSocket, filename)
+        await runBlocking(utils.sendDataPacket, dataSocket, utils.FOUND)
+        offset = 0
+        if cached is not None:
+            filesize = len(cached)
+        else:
+            filesize = await runBlocking(os.path.getsize, './files/' + filename)
+        if 'offset' in opts:
+            offset = int(opts['offset'])
+            if offset > filesize:
+                offset = 0
+            await runBlocking(utils.sendDataPacket, dataSocket, offset)
+        length = int(opts['length']) if 'length' in opts else None
+        digest = None
+        if 'verify' in opts:
+            known = offset == 0 and length is None and await runBlocking(blobStore.lookup, filename)
+            digest = known or hashlib.sha256()
+        size = filesize - offset if length is None else length
+        if cached is not None:
+            await runTransfer(size, utils.sendFileBytes, dataSocket, cached, offset, length, digest)
+        else:
+            await runTransfer(size, utils.sendFile, dataSocket, filename, offset, length, opts.get('compress'), digest,
+                              'sparse' in opts)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -165,11 +820,13 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def handleSend(dataSocket, filename):
+INTERFACE: async def handleSend(dataSocket, filename, opts, clientIp):
 
 ARGUMENTS: 
     socket dataSocket : tcp socket opened on data channel
     string filename : file that client wants to send to server.
+    dict opts : options sent with the request
+    string clientIp : ip to open extra data connections to, None if the client can't take any
     
 RETURNS: void
 
@@ -177,10 +834,268 @@ NOTES:
     Handles send file requests sent from clients.
     Reads file bytes with helper function and saves it locally, similar to what happens on client
     for GET requests
+
+    If the client sent streams=N & size=filesize, the client already split the file into N ranges.
+    The server opens the extra data connections and receives all ranges at once (see utils.recvFileParallel).
+
+    If the client sent resume=1 & size=filesize, the server first replies with the number of bytes it
+    already has from an earlier broken SEND of the file, and the client only sends the rest. 
+    A partial file bigger than the client's file can't be a prefix of it, so that restarts from 0.
+    If the client sent compress=<codec>, it says which codec it used before the file bytes (see utils.recvFile).
+
+    If the client sent delta=1, the server sends the block signatures of its own copy first, and
+    rebuilds the file from the delta the client sends back (see delta.py).
+
+    If the client sent hash=<sha256>, before any of that the server replies FOUND when it already stores that
+    content, links filename to it and is done, or NOT_FOUND to go ahead with the upload. A hash that isn't
+    a sha256 is never looked up, it gets NOT_FOUND (see store.isDigest).
+    Every complete upload is added to the blob store (see store.py), so identical uploads share 1 copy on disk.
+    An upload the client stopped part way thru is recorded as failed in the metrics.
+
+    If the client sent verify=1, the file (or each parallel range) is followed by its sha256, and the server checks
+    it against what arrived (see utils.recvFile). An upload that doesn't match is discarded & recorded as Corrupt.
+    That only covers the bytes of 1 run, so a resumed upload is also checked whole against the client's hash=,
+    and discarded if it doesn't match, since the bytes kept from the broken run may be bad.
+    The server replies FOUND once the file is verified & stored, or CORRUPT, so the client knows how it went.
+    The digest of a whole file is handed to the blob store, which then doesn't need to read the file to hash it.
+
+    If the client sent sparse=1, a plain or resumed SEND only carries the file's data regions, and the holes
+    between them are left as holes here (see utils.recvFile).
+
+    Every receive of filename writes the same partial file, so the whole SEND runs under filename's lock
+    (see utils.lockName). A 2nd SEND of a name that's being uploaded waits for the 1st, polling every
+    NAME_POLL seconds rather than holding an executor thread while it waits.
+    The blob filename pointed at before is released after, so replaced content doesn't stay on disk
+    until the next restart (see store.BlobStore.release).
+----------------------------------------------------------------------------------------------
+"""
+async def handleSend(dataSocket, filename, opts, clientIp):
+    while not utils.lockName(filename, False):
+        await asyncio.sleep(NAME_POLL)
+    try:
+        previous = await runBlocking(blobStore.lookup, filename)
+        try:
+            await _receiveSend(dataSocket, filename, opts, clientIp)
+        finally:
+            if previous:
+                await runBlocking(blobStore.release, previous)
+    finally:
+        utils.unlockName(filename)
+
+# the body of handleSend, run under filename's lock
+async def _receiveSend(dataSocket, filename, opts, clientIp):
+    if 'hash' in opts:
+        if await runBlocking(blobStore.linkExisting, filename, opts['hash']):
+            print('Upload skipped, content already stored:', filename)
+            await runBlocking(fileIndex.update, filename)
+            if fileCache:
+                fileCache.invalidate(filename)
+            await runBlocking(utils.sendDataPacket, dataSocket, utils.FOUND)
+            return
+        await runBlocking(utils.sendDataPacket, dataSocket, utils.NOT_FOUND)
+
+    verify = 'verify' in opts and 'delta' not in opts
+    digest = hashlib.sha256() if verify else None
+    offset = 0
+    if 'delta' in opts:
+        blockSize = await runBlocking(delta.sendSignatures, dataSocket, filename)
+        received = await runTransfer(None, delta.recvDelta, dataSocket, filename, blockSize)
+    elif 'streams' in opts and clientIp:
+        # each range is checked against its own digest, there's none for the whole file
+        digest = None
+        count = utils.resolveStreamCount(int(opts['streams']), int(opts['size']))
+        dataSockets = await openExtraChannels(dataSocket, clientIp, count, int(opts.get('port', utils.PORT_X)))
+        try:
+            await runTransfer(int(opts['size']), utils.recvFileParallel, dataSockets, filename, int(opts['size']), verify)
+            received = True
+        finally:
+            for extraSocket in dataSockets[1:]:
+                extraSocket.close()
+    elif 'resume' in opts:
+        offset = await runBlocking(utils.partialSize, filename)
+        if offset > int(opts['size']):
+            offset = 0
+        await runBlocking(utils.sendDataPacket, dataSocket, offset)
+        received = await runTransfer(int(opts['size']) - offset, utils.recvFile, dataSocket, filename, offset,
+                                     'compress' in opts, digest, 'sparse' in opts)
+    else:
+        size = int(opts['size']) if 'size' in opts else None
+        received = await runTransfer(size, utils.recvFile, dataSocket, filename, 0, 'compress' in opts, digest,
+                                     'sparse' in opts)
+
+    if received and verify and offset and 'hash' in opts:
+        # this run's digest only covered the bytes after offset, the client's hash covers the whole file
+        known = await runBlocking(utils.fileDigest, './files/' + filename)
+        if known != opts['hash']:
+            print('Resumed upload doesn\'t match its hash, discarded:', filename)
+            await runBlocking(os.remove, './files/' + filename)
+            received = False
+            await runBlocking(fileIndex.update, filename)
+            if fileCache:
+                fileCache.invalidate(filename)
+    else:
+        # a digest of the whole file saves the store a pass over it
+        known = digest.hexdigest() if digest and not offset else None
+
+    if received:
+        await runBlocking(blobStore.ingest, filename, known)
+        await runBlocking(fileIndex.update, filename)
+        if fileCache:
+            fileCache.invalidate(filename)
+        if verify:
+            await runBlocking(utils.sendDataPacket, dataSocket, utils.FOUND)
+    elif verify and not await runBlocking(os.path.exists, utils.partPath(filename)):
+        # the whole file arrived but didn't match its digest, recvFile threw it away
+        metrics.markError('Corrupt')
+        await runBlocking(utils.sendDataPacket, dataSocket, utils.CORRUPT)
+    else:
+        metrics.markError('Incomplete')
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleMultiGet
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def handleMultiGet(dataSocket, opts):
+
+ARGUMENTS: 
+    socket dataSocket : tcp socket opened on data channel
+    dict opts : options sent with the request
+    
+RETURNS: void
+
+NOTES:
+    Handles multi-file get requests. The client sends its names & glob patterns on the data channel
+    (see utils.readNameList), and every matching file is streamed back on that same channel
+    (see utils.sendFiles). Patterns that match nothing are skipped, the client sees what arrived.
+    If the client sent compress=<codec>, each file is compressed on the fly like a plain GET.
+    If the client sent verify=1, each file is followed by its sha256, and with sparse=1 only its data regions are sent.
+----------------------------------------------------------------------------------------------
+"""
+async def handleMultiGet(dataSocket, opts):
+    patterns = await runBlocking(utils.readNameList, dataSocket)
+    names = await runBlocking(utils.matchFiles, patterns, fileIndex.names())
+    print('Sending', len(names), 'files matching', ' '.join(patterns))
+    await runTransfer(None, utils.sendFiles, dataSocket, names, opts.get('compress'), 'verify' in opts, 'sparse' in opts)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleMultiSend
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def handleMultiSend(dataSocket, opts):
+
+ARGUMENTS: 
+    socket dataSocket : tcp socket opened on data channel
+    dict opts : options sent with the request
+    
+RETURNS: void
+
+NOTES:
+    Handles multi-file send requests. Saves every file the client streams on the data channel
+    (see utils.recvFiles), and adds each 1 to the blob store.
+    If the client sent verify=1, every file is checked against the sha256 that follows it, and the server
+    replies with the names it actually saved, so the client can tell which files were corrupted on the way.
+    Blobs left with no names by the batch are collected after it.
+    If the client sent sparse=1, each file comes as its data regions, and is saved with holes.
+----------------------------------------------------------------------------------------------
+"""
+async def handleMultiSend(dataSocket, opts):
+    saved = await runTransfer(None, utils.recvFiles, dataSocket, 'compress' in opts, 'verify' in opts, 'sparse' in opts)
+    for filename in saved:
+        await runBlocking(blobStore.ingest, filename)
+        await runBlocking(fileIndex.update, filename)
+        if fileCache:
+            fileCache.invalidate(filename)
+    if saved:
+        # the names a batch replaced aren't known up front, so their old blobs are found by a collection
+        await runBlocking(blobStore.collectGarbage)
+    print('Received', len(saved), 'files')
+    if 'verify' in opts:
+        await runBlocking(utils.sendNameList, dataSocket, saved)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleStats
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def handleStats(dataSocket):
+
+ARGUMENTS: 
+    socket dataSocket : tcp socket opened on data channel
+    
+RETURNS: void
+
+NOTES:
+    Handles stats requests. Sends metrics.registry.snapshot() as 1 json data packet: uptime, what's running,
+    counters & histogram summaries per command, errors, per client totals (slowest first) and the recent commands.
+    A v1 client only gets the brief per command counts, the rest doesn't fit in a v1 packet.
+----------------------------------------------------------------------------------------------
+"""
+async def handleStats(dataSocket):
+    brief = utils.protocolOf(dataSocket) == utils.PROTOCOL_V1
+    snapshot = metrics.registry.snapshot(brief)
+    await runBlocking(utils.sendDataPacket, dataSocket, json.dumps(snapshot, separators=(',', ':')))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION handleDelete
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: async def handleDelete(dataSocket):
+
+ARGUMENTS: 
+    socket dataSocket : tcp socket opened on data channel
+    
+RETURNS: void
+
+NOTES:
+    Handles delete requests. The client sends the names on the data channel (see utils.readNameList), and
+    each 1 that's in the file index is removed, so nothing outside ./files, no dot file & no partial file
+    can be named. Patterns aren't expanded, a name is only ever 1 file. The server replies with the names
+    it removed. Blobs no longer linked from any name are removed after (see store.BlobStore.collectGarbage).
 ----------------------------------------------------------------------------------------------
 """
-def handleSend(dataSocket, filename):
-    utils.recvFile(dataSocket, filename)
+async def handleDelete(dataSocket):
+    names = await runBlocking(utils.readNameList, dataSocket)
+    indexed = set(fileIndex.names())
+    deleted = []
+    for filename in names:
+        if filename not in indexed:
+            continue
+        try:
+            await runBlocking(os.remove, './files/' + filename)
+        except FileNotFoundError:
+            pass
+        await runBlocking(fileIndex.update, filename)
+        if fileCache:
+            fileCache.invalidate(filename)
+        deleted.append(filename)
+    if deleted:
+        await runBlocking(blobStore.collectGarbage)
+    print('Deleted', len(deleted), 'files')
+    await runBlocking(utils.sendNameList, dataSocket, deleted)
 
 # run main
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+import asyncio
+import collections
+import struct
+import threading
+import traceback
+import utils
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: session.py - multiplexed session mode shared between server & client application
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+CLASSES:
+    SessionStream(Session : session, int : streamId)
+    Session(int : firstStreamId)
+    ClientSession(socket : controlSocket)
+    AsyncSession(StreamReader : reader, StreamWriter : writer, function : onOpen)
+
+GLOBAL CONSTANTS:
+    frame types
+        int OPEN=1 : opens a stream, payload is [flag][msg] just like a cmd packet without the length
+        int DATA=2 : stream bytes
+        int END=3 : sender is done writing on the stream (like a socket shutdown)
+        int WINDOW=4 : flow control credit, payload is 4 byte count of bytes the receiver has consumed
+
+    misc
+        Struct FRAME_HEADER : [stream id][frame type][payload length]
+                                 4 bytes    1 byte      4 bytes
+        Struct CREDIT : payload of a WINDOW frame
+        int MAX_FRAME=65536 : max payload bytes of 1 DATA frame, keeps streams interleaved fairly
+        int WINDOW_SIZE=4194304 : bytes a sender may have in flight on 1 stream before it waits for credit
+
+NOTES:
+    Session mode is an optional replacement for the connect-back data channel. The client sends a SESSION
+    cmd packet on the control connection, and from then on that 1 connection carries framed, interleaved
+    streams in both directions. Every command (GET/SEND/GETALL) opens its own stream, so many transfers
+    share 1 warmed up TCP connection instead of paying a handshake + slow start each.
+
+    A SessionStream looks like a socket (send/sendall/recv/recv_into/close), so the helpers in utils
+    and the server handlers work on it unchanged. Each stream has its own flow control window, so
+    a slow reader on 1 stream never blocks the others or lets memory grow without bound.
+    A frame that says it's longer than utils.MAX_PACKET ends the session before its payload is read.
+-------------------------------------------------------------------------------------------------------
+"""
+
+OPEN=1
+DATA=2
+END=3
+WINDOW=4
+
+FRAME_HEADER=struct.Struct('!IBI')
+CREDIT=struct.Struct('!I')
+MAX_FRAME=65536
+WINDOW_SIZE=4194304
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS SessionStream
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class SessionStream(session, streamId):
+
+ARGUMENTS:
+    Session session : session the stream is carried on
+    int streamId : id of the stream within the session
+
+NOTES:
+    Socket-like end of 1 stream. The session's reader feeds incoming frames in with feed/feedEnd/addCredit,
+    and the code using the stream calls the usual socket methods from its own thread.
+    recv returns b'' once the other side has ended the stream, same as a disconnected socket.
+----------------------------------------------------------------------------------------------
+"""
+class SessionStream:
+    def __init__(self, session, streamId):
+        self.session = session
+        self.streamId = streamId
+        self.cond = threading.Condition()
+        self.inbound = collections.deque()
+        self.remoteEnded = False
+        self.localEnded = False
+        self.broken = False
+        self.sendCredit = WINDOW_SIZE
+        self.consumed = 0
+
+    def feed(self, payload):
+        with self.cond:
+            self.inbound.append(payload)
+            self.cond.notify_all()
+
+    def feedEnd(self):
+        with self.cond:
+            self.remoteEnded = True
+            self.cond.notify_all()
+
+    def addCredit(self, credit):
+        with self.cond:
+            self.sendCredit += credit
+            self.cond.notify_all()
+
+    def abort(self):
+        with self.cond:
+            self.broken = True
+            self.remoteEnded = True
+            self.cond.notify_all()
+
+    def recv(self, bufsize):
+        with self.cond:
+            while not self.inbound and not self.remoteEnded:
+                self.cond.wait()
+            if not self.inbound:
+                return b''
+            chunk = self.inbound.popleft()
+            if len(chunk) > bufsize:
+                self.inbound.appendleft(chunk[bufsize:])
+                chunk = chunk[:bufsize]
+        self._consumed(len(chunk))
+        return chunk
+
+    def recv_into(self, buffer, nbytes=0):
+        view = memoryview(buffer).cast('B')
+        chunk = self.recv(nbytes or len(view))
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+    def sendall(self, data):
+        view = memoryview(data).cast('B')
+        sent = 0
+        while sent < len(view):
+            with self.cond:
+                while self.sendCredit == 0 and not self.broken:
+                    self.cond.wait()
+                if self.broken:
+                    raise RuntimeError('session stream disconnected while sending')
+                count = min(self.sendCredit, MAX_FRAME, len(view) - sent)
+                self.sendCredit -= count
+            self.session.writeFrame(self.streamId, DATA, view[sent:sent + count])
+            sent += count
+
+    def send(self, data):
+        self.sendall(data)
+        return memoryview(data).nbytes
+
+    def close(self):
+        if not self.localEnded:
+            self.localEnded = True
+            if not self.broken:
+                try:
+                    self.session.writeFrame(self.streamId, END)
+                except Exception:
+                    pass
+        self.session.release(self)
+
+    # give the sender credit back once half the window has been read, so it never stalls on a steady stream
+    def _consumed(self, count):
+        self.consumed += count
+        if self.consumed >= WINDOW_SIZE // 2 and not self.broken:
+            credit = self.consumed
+            self.consumed = 0
+            self.session.writeFrame(self.streamId, WINDOW, CREDIT.pack(credit))
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS Session
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class Session(firstStreamId):
+
+ARGUMENTS:
+    int firstStreamId : id of the first stream this side opens, ids then go up by 2 so both
+                        sides could open streams without clashing (client odd, server even)
+
+NOTES:
+    Holds the stream table and routes incoming frames to streams. Subclasses supply writeFrame
+    (how a frame gets onto the connection) and onOpen (what to do when the other side opens a stream).
+----------------------------------------------------------------------------------------------
+"""
+class Session:
+    def __init__(self, firstStreamId):
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.nextStreamId = firstStreamId
+        self.closed = False
+
+    def writeFrame(self, streamId, frameType, payload=b''):
+        raise NotImplementedError
+
+    def onOpen(self, stream, flag, msg):
+        raise NotImplementedError
+
+    def openStream(self, flag, msg=''):
+        with self.lock:
+            if self.closed:
+                raise RuntimeError('session disconnected')
+            streamId = self.nextStreamId
+            self.nextStreamId += 2
+            stream = SessionStream(self, streamId)
+            self.streams[streamId] = stream
+        self.writeFrame(streamId, OPEN, (flag + str(msg)).encode())
+        return stream
+
+    def dispatchFrame(self, streamId, frameType, payload):
+        if frameType == OPEN:
+            stream = SessionStream(self, streamId)
+            with self.lock:
+                self.streams[streamId] = stream
+            msg = payload.decode()
+            self.onOpen(stream, msg[:1], msg[1:])
+            return
+
+        with self.lock:
+            stream = self.streams.get(streamId)
+        # frames for a stream that was already released are dropped
+        if stream is None:
+            return
+        if frameType == DATA:
+            stream.feed(payload)
+        elif frameType == WINDOW:
+            stream.addCredit(CREDIT.unpack(payload)[0])
+        elif frameType == END:
+            stream.feedEnd()
+            self.release(stream)
+
+    def release(self, stream):
+        if stream.localEnded and stream.remoteEnded:
+            with self.lock:
+                self.streams.pop(stream.streamId, None)
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            streams = list(self.streams.values())
+            self.streams.clear()
+        for stream in streams:
+            stream.abort()
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS ClientSession
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class ClientSession(controlSocket):
+
+ARGUMENTS:
+    socket controlSocket : connected, blocking control channel socket
+
+NOTES:
+    Client side of a session. Sends the SESSION cmd packet to switch the connection over, then
+    runs a daemon thread that reads frames off the socket and routes them to streams.
+    Frames are written under a lock so frames from different streams never interleave mid-frame.
+----------------------------------------------------------------------------------------------
+"""
+class ClientSession(Session):
+    def __init__(self, controlSocket):
+        super().__init__(1)
+        self.controlSocket = controlSocket
+        self.writeLock = threading.Lock()
+        utils.sendCmdPacket(controlSocket, utils.SESSION)
+        self.readerThread = threading.Thread(target=self.readLoop, daemon=True)
+        self.readerThread.start()
+
+    def writeFrame(self, streamId, frameType, payload=b''):
+        frame = FRAME_HEADER.pack(streamId, frameType, len(payload)) + payload
+        with self.writeLock:
+            self.controlSocket.sendall(frame)
+
+    def onOpen(self, stream, flag, msg):
+        # server never opens streams
+        stream.abort()
+
+    def readLoop(self):
+        try:
+            while True:
+                streamId, frameType, length = FRAME_HEADER.unpack(utils.recvBytes(self.controlSocket, FRAME_HEADER.size))
+                if length > utils.MAX_PACKET:
+                    break
+                payload = utils.recvBytes(self.controlSocket, length) if length else b''
+                self.dispatchFrame(streamId, frameType, payload)
+        except (RuntimeError, OSError):
+            pass
+        finally:
+            self.shutdown()
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS AsyncSession
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class AsyncSession(reader, writer, onOpen):
+
+ARGUMENTS:
+    StreamReader reader : read side of the control connection
+    StreamWriter writer : write side of the control connection
+    function onOpen : called on the event loop as onOpen(stream, flag, msg) for each stream the client opens
+
+NOTES:
+    Server side of a session, driven by the asyncio event loop. run() reads frames until the
+    client disconnects. Streams are used from executor threads, so writeFrame hops onto the
+    loop to write and waits for the drain, which pushes back on a sender when the client is slow.
+----------------------------------------------------------------------------------------------
+"""
+class AsyncSession(Session):
+    def __init__(self, reader, writer, onOpen):
+        super().__init__(2)
+        self.reader = reader
+        self.writer = writer
+        self.openHandler = onOpen
+        self.loop = asyncio.get_running_loop()
+        self.loopThreadId = threading.get_ident()
+
+    def writeFrame(self, streamId, frameType, payload=b''):
+        if self.closed:
+            raise RuntimeError('session disconnected')
+        frame = FRAME_HEADER.pack(streamId, frameType, len(payload)) + payload
+        if threading.get_ident() == self.loopThreadId:
+            self.writer.write(frame)
+        else:
+            asyncio.run_coroutine_threadsafe(self._write(frame), self.loop).result()
+
+    async def _write(self, frame):
+        self.writer.write(frame)
+        await self.writer.drain()
+
+    def onOpen(self, stream, flag, msg):
+        self.openHandler(stream, flag, msg)
+
+    async def run(self):
+        try:
+            while True:
+                streamId, frameType, length = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+                if length > utils.MAX_PACKET:
+                    break
+                payload = await self.reader.readexactly(length) if length else b''
+                self.dispatchFrame(streamId, frameType, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            traceback.print_exc()
+        finally:
+            self.shutdown()
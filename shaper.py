@@ -0,0 +1,477 @@
+import configparser
+import heapq
+import itertools
+import os
+import threading
+import time
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: shaper.py - bandwidth limits & fair sharing of the server's data channels
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+FUNCTIONS:
+    socket shapeLike(socket : dataSocket, socket : newSocket)
+
+CLASSES:
+    TokenBucket(float : rate, float : burst)
+    Flow(string : client, float : weight)
+    ShapedSocket(socket : sock, Flow : flow)
+    Scheduler(void)
+
+GLOBAL CONSTANTS:
+    int QUANTUM=65536 : most bytes a flow is granted at once, so flows take turns in small slices
+    float BURST_SECONDS=0.25 : a bucket holds this many seconds of its rate unless burst is set
+    float MAX_WAIT=0.05 : longest a waiting thread sleeps before it checks the queue again
+    Scheduler scheduler : the server's scheduler
+
+NOTES:
+    Without limits every data channel goes as fast as tcp lets it, and 1 big GET or SEND can fill the link
+    while a client listing its files waits behind it. With limits set, every byte moved on a data channel
+    (sent or received) first takes a token from the server's bucket and from its client's bucket, refilled
+    at rate & client_rate bytes per second.
+
+    When more flows (commands) want tokens than there are, they're handed out in weighted fair queuing order:
+    each request of up to QUANTUM bytes gets a virtual finish time, its flow's last finish (or the current
+    virtual time, for a flow that was idle) + bytes / weight, and the smallest finish time goes first.
+    A bulk transfer always has its next slice queued, so a new small command only waits for the slices already
+    in line, about 1 QUANTUM per busy flow, instead of behind the whole transfer. A client with weight 2
+    gets twice the share of a client with weight 1. Requests held back by their own client's limit don't
+    block anyone else.
+
+    Limits come from the config file's [shaping] & [weights] sections (see Scheduler.loadConfig), re-read
+    when the server gets SIGHUP, eg
+        [shaping]
+        rate = 104857600
+        client_rate = 20971520
+        [weights]
+        192.168.0.20 = 4
+    With no limits set the data path takes no locks and sends in the same size pieces as before.
+-------------------------------------------------------------------------------------------------------
+"""
+
+QUANTUM=65536
+BURST_SECONDS=0.25
+MAX_WAIT=0.05
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS TokenBucket
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class TokenBucket(rate, burst):
+
+ARGUMENTS:
+    float rate : tokens (bytes) added per second
+    float burst : most tokens the bucket holds, it starts full
+
+NOTES:
+    Not locked, the Scheduler only touches it under its own lock.
+----------------------------------------------------------------------------------------------
+"""
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    # seconds until count tokens are in the bucket, 0 if they are now
+    def wait(self, count, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return max(0.0, (min(count, self.burst) - self.tokens) / self.rate)
+
+    def take(self, count):
+        self.tokens -= count
+
+    def refund(self, count):
+        self.tokens = min(self.burst, self.tokens + count)
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS Flow
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class Flow(client, weight):
+
+ARGUMENTS:
+    string client : ip of the client the command belongs to
+    float weight : share of the bandwidth compared to other flows
+
+NOTES:
+    1 command's place in the fair queue, shared by all of its data channels.
+----------------------------------------------------------------------------------------------
+"""
+class Flow:
+    def __init__(self, client, weight):
+        self.client = client
+        self.weight = weight
+        self.finish = 0.0
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS ShapedSocket
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class ShapedSocket(sock, flow):
+
+ARGUMENTS:
+    socket sock : data channel socket or session stream to limit
+    Flow flow : command the bytes belong to
+
+NOTES:
+    Stands in for sock like metrics.MeteredSocket does, and asks the scheduler for every byte that goes
+    thru send/sendall/recv/recv_into before moving it. Anything else is passed on to sock.
+    Bytes os.sendfile sends never pass thru send, utils.sendFileRange asks with reserve & refund itself.
+----------------------------------------------------------------------------------------------
+"""
+class ShapedSocket:
+    def __init__(self, sock, flow):
+        self.sock = sock
+        self.flow = flow
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def reserve(self, count):
+        return scheduler.reserve(self.flow, count)
+
+    def refund(self, count):
+        scheduler.refund(self.flow, count)
+
+    def send(self, data):
+        view = memoryview(data)
+        granted = self.reserve(view.nbytes)
+        count = self.sock.send(view[:granted])
+        self.refund(granted - count)
+        return count
+
+    def sendall(self, data):
+        view = memoryview(data).cast('B')
+        sent = 0
+        while sent < len(view):
+            granted = self.reserve(len(view) - sent)
+            self.sock.sendall(view[sent:sent + granted])
+            sent += granted
+
+    def recv(self, bufsize):
+        granted = self.reserve(bufsize)
+        data = self.sock.recv(granted)
+        self.refund(granted - len(data))
+        return data
+
+    def recv_into(self, buffer, nbytes=0):
+        granted = self.reserve(nbytes or memoryview(buffer).nbytes)
+        count = self.sock.recv_into(buffer, granted)
+        self.refund(granted - count)
+        return count
+
+    def close(self):
+        self.sock.close()
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS Scheduler
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class Scheduler():
+
+NOTES:
+    Token buckets for the whole server & for each client with a running command, and the fair queue of
+    flows waiting for tokens. Safe to use from several threads, waiting threads sleep on a condition
+    until their request is at the front and the tokens for it are in.
+----------------------------------------------------------------------------------------------
+"""
+class Scheduler:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.rate = None
+        self.clientRate = None
+        self.burst = None
+        self.quantum = QUANTUM
+        self.weights = {}
+        self.bucket = None
+        self.clients = {}
+        self.waiting = []
+        self.order = itertools.count()
+        self.virtualTime = 0.0
+        self.flows = 0
+        self.shapedBytes = 0
+        self.throttled = 0.0
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION configure
+
+    INTERFACE: def configure(self, rate=None, clientRate=None, burst=None, quantum=QUANTUM, weights=None):
+
+    ARGUMENTS:
+        float rate : bytes per second for all data channels together, None for no limit
+        float clientRate : bytes per second for all data channels of 1 client ip, None for no limit
+        float burst : bytes a bucket can hold, rate * BURST_SECONDS if not given
+        int quantum : most bytes granted to a flow at once
+        dict weights : client ip -> weight, clients not in it have weight 1
+
+    RETURNS: void
+
+    NOTES:
+        Can be called while transfers are running, the new limits apply from their next request on.
+        Buckets start over full.
+    ----------------------------------------------------------------------------------------------
+    """
+    def configure(self, rate=None, clientRate=None, burst=None, quantum=QUANTUM, weights=None):
+        with self.cond:
+            self.rate = rate or None
+            self.clientRate = clientRate or None
+            self.burst = burst or None
+            self.quantum = quantum
+            self.weights = dict(weights or {})
+            self.bucket = self._newBucket(self.rate)
+            for client in self.clients:
+                self.clients[client][0] = self._newBucket(self.clientRate)
+            self.cond.notify_all()
+
+    def _newBucket(self, rate):
+        if rate is None:
+            return None
+        return TokenBucket(rate, max(self.burst or rate * BURST_SECONDS, self.quantum))
+
+    def limited(self):
+        return self.rate is not None or self.clientRate is not None
+
+    def describe(self):
+        def show(rate):
+            return '%d B/s' % rate if rate else 'unlimited'
+        return 'rate %s, client rate %s, %d weights' % (show(self.rate), show(self.clientRate), len(self.weights))
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION loadConfig
+
+    INTERFACE: def loadConfig(self, path):
+
+    ARGUMENTS:
+        string path : config file to read the [shaping] & [weights] sections of
+
+    RETURNS: bool - True if the file was read
+
+    THROWS
+        ValueError if a setting isn't a number
+
+    NOTES:
+        Sets the limits to what's in the file, settings that aren't there are unlimited / default.
+            [shaping]
+            rate = <bytes per second>           ; whole server, 0 or missing for no limit
+            client_rate = <bytes per second>    ; each client ip
+            burst = <bytes>
+            quantum = <bytes>
+            [weights]
+            <client ip> = <weight>
+        A missing file turns shaping off.
+    ----------------------------------------------------------------------------------------------
+    """
+    def loadConfig(self, path):
+        config = configparser.ConfigParser()
+        if not os.path.isfile(path):
+            self.configure()
+            return False
+        config.read(path)
+        section = config['shaping'] if config.has_section('shaping') else {}
+        quantum = int(section.get('quantum', QUANTUM))
+        if quantum <= 0:
+            raise ValueError('quantum must be positive')
+        weights = {}
+        if config.has_section('weights'):
+            for client, weight in config['weights'].items():
+                weights[client] = float(weight)
+                if weights[client] <= 0:
+                    raise ValueError('weight of %s must be positive' % client)
+        self.configure(float(section.get('rate', 0)), float(section.get('client_rate', 0)),
+                       float(section.get('burst', 0)), quantum, weights)
+        return True
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION open / close
+
+    INTERFACE: def open(self, client):
+               def close(self, flow):
+
+    ARGUMENTS:
+        string client : ip of the client a command is starting for
+        Flow flow : flow of a command that ended
+
+    RETURNS: Flow - for open, to wrap the command's data channels with (see ShapedSocket)
+
+    NOTES:
+        A client's bucket lives as long as it has a command running.
+    ----------------------------------------------------------------------------------------------
+    """
+    def open(self, client):
+        with self.cond:
+            self.flows += 1
+            entry = self.clients.get(client)
+            if entry is None:
+                entry = self.clients[client] = [self._newBucket(self.clientRate), 0]
+            entry[1] += 1
+            return Flow(client, self.weights.get(client, 1.0))
+
+    def close(self, flow):
+        with self.cond:
+            self.flows -= 1
+            entry = self.clients[flow.client]
+            entry[1] -= 1
+            if not entry[1]:
+                del self.clients[flow.client]
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION reserve
+
+    INTERFACE: def reserve(self, flow, count):
+
+    ARGUMENTS:
+        Flow flow : flow asking
+        int count : bytes it wants to move
+
+    RETURNS: int - bytes it may move now, at least 1 & at most count, blocks until then
+
+    NOTES:
+        Without limits this returns count straight away. Otherwise at most quantum bytes are granted,
+        once the request is the first in fair queue order whose client has the tokens for it, and the
+        server has them too. Hand back what wasn't used with refund.
+    ----------------------------------------------------------------------------------------------
+    """
+    def reserve(self, flow, count):
+        if not self.limited() or count <= 0:
+            return count
+        with self.cond:
+            count = min(count, self.quantum)
+            start = max(self.virtualTime, flow.finish)
+            flow.finish = start + count / flow.weight
+            request = (flow.finish, next(self.order), flow, count, start)
+            heapq.heappush(self.waiting, request)
+            asked = time.monotonic()
+            try:
+                while True:
+                    first, delay = self._next(time.monotonic())
+                    if first is request and not delay:
+                        break
+                    if first is not None and first is not request and not delay:
+                        self.cond.notify_all()
+                    self.cond.wait(min(delay or MAX_WAIT, MAX_WAIT))
+            except BaseException:
+                self.waiting.remove(request)
+                heapq.heapify(self.waiting)
+                raise
+            self.waiting.remove(request)
+            heapq.heapify(self.waiting)
+            self.virtualTime = max(self.virtualTime, start)
+            if self.bucket:
+                self.bucket.take(count)
+            bucket = self._clientBucket(flow.client)
+            if bucket:
+                bucket.take(count)
+            self.shapedBytes += count
+            self.throttled += time.monotonic() - asked
+            self.cond.notify_all()
+            return count
+
+    # first request in finish time order whose client has the tokens, & seconds until the server has them too
+    def _next(self, now):
+        soonest = None
+        for request in sorted(self.waiting):
+            finish, order, flow, count, start = request
+            bucket = self._clientBucket(flow.client)
+            delay = bucket.wait(count, now) if bucket else 0.0
+            if not delay:
+                return request, self.bucket.wait(count, now) if self.bucket else 0.0
+            soonest = delay if soonest is None else min(soonest, delay)
+        return None, soonest
+
+    def _clientBucket(self, client):
+        entry = self.clients.get(client)
+        return entry[0] if entry else None
+
+    def refund(self, flow, count):
+        if count <= 0 or not self.limited():
+            return
+        with self.cond:
+            if self.bucket:
+                self.bucket.refund(count)
+            bucket = self._clientBucket(flow.client)
+            if bucket:
+                bucket.refund(count)
+            self.shapedBytes -= count
+            self.cond.notify_all()
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION stats
+
+    INTERFACE: def stats(self):
+
+    RETURNS: dict - limits, flows running & waiting, bytes shaped & time spent waiting for tokens,
+                    for the metrics (see metrics.Metrics.addSource)
+    ----------------------------------------------------------------------------------------------
+    """
+    def stats(self):
+        with self.cond:
+            return {'rate': int(self.rate or 0), 'client_rate': int(self.clientRate or 0), 'flows': self.flows,
+                    'waiting': len(self.waiting), 'bytes_total': self.shapedBytes,
+                    'throttled_seconds_total': round(self.throttled, 6)}
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION shapeLike
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def shapeLike(dataSocket, newSocket):
+
+ARGUMENTS:
+    socket dataSocket : a command's data channel, shaped or not (or metered, around a shaped socket)
+    socket newSocket : another data connection for the same command
+
+RETURNS: socket - newSocket, wrapped in a ShapedSocket in the same flow if dataSocket is shaped
+----------------------------------------------------------------------------------------------
+"""
+def shapeLike(dataSocket, newSocket):
+    flow = getattr(dataSocket, 'flow', None)
+    if isinstance(flow, Flow):
+        return ShapedSocket(newSocket, flow)
+    return newSocket
+
+scheduler = Scheduler()
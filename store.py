@@ -0,0 +1,315 @@
+import os
+import re
+import threading
+import utils
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: store.py - content addressed blob store behind the server's ./files dir
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+FUNCTIONS:
+    bool isDigest(string : digest)
+
+CLASSES:
+    BlobStore(string : filesDir)
+
+GLOBAL CONSTANTS:
+    string STORE_DIR='.store' : dir inside ./files that holds the blobs, hidden from listings like any dot file
+    int READ_ONLY=0o444 : mode blobs & the names linked to them get
+
+NOTES:
+    Every complete upload is stored once by its sha256, as ./files/.store/<first 2 hex chars>/<hex>.
+    The name a client sees, ./files/<name>, is a hard link to its blob, so names that share content share
+    1 copy on disk, and GET/GETALL keep working on plain paths. Which hash a name maps to is found from
+    its inode, so the mapping can't go stale when a name is replaced.
+
+    Nothing ever writes into a linked file in place: every receive goes to a partial file that's renamed
+    over the name (see utils.partPath), which swaps in a new inode and leaves the blob alone. The old blob
+    is released once the name is replaced, and removed if no other name shares it (see release).
+    Something else on the host could still edit a name in place, which edits its blob & every name linked
+    to it under the old hash. So blobs are made read-only (0444) as they're stored, and each inode's entry
+    keeps the size & mtime it had then. An inode whose stat no longer matches is taken out of the store and
+    its hash isn't trusted or deduped against again.
+
+    Before a SEND the client sends the file's hash. If the blob is already here, the name is linked to it
+    and the upload is skipped. The hash comes from the client, so anything that isn't 64 lowercase hex chars
+    is treated as not stored, it never becomes part of a path.
+-------------------------------------------------------------------------------------------------------
+"""
+
+STORE_DIR='.store'
+READ_ONLY=0o444
+
+# what a hex sha256 looks like, the only thing allowed into a blob path
+_DIGEST = re.compile('[0-9a-f]{64}')
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION isDigest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def isDigest(digest):
+
+ARGUMENTS:
+    string digest : hash a client sent
+
+RETURNS: bool - True if digest is a lowercase hex sha256
+----------------------------------------------------------------------------------------------
+"""
+def isDigest(digest):
+    return isinstance(digest, str) and _DIGEST.fullmatch(digest) is not None
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS BlobStore
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class BlobStore(filesDir='./files'):
+
+ARGUMENTS:
+    string filesDir : dir the names live in, the store is kept inside it
+
+NOTES:
+    Builds an inode -> (hash, size, mtime_ns) table from the blobs on disk at startup, making any that
+    aren't read-only yet read-only. If the filesystem can't hard link, dedup is turned off and uploads are
+    saved as plain files like before.
+----------------------------------------------------------------------------------------------
+"""
+class BlobStore:
+    def __init__(self, filesDir='./files'):
+        self.filesDir = filesDir
+        self.root = os.path.join(filesDir, STORE_DIR)
+        self.lock = threading.Lock()
+        self.inodes = {}
+        self.enabled = True
+        os.makedirs(self.root, exist_ok=True)
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                for blob in os.scandir(shard.path):
+                    stat = blob.stat()
+                    if stat.st_mode & 0o222:
+                        os.chmod(blob.path, READ_ONLY)
+                    self.inodes[blob.inode()] = (blob.name, stat.st_size, stat.st_mtime_ns)
+
+    # a digest that isn't a sha256 could walk out of the store (eg ../../etc/passwd), so it's refused
+    def blobPath(self, digest):
+        if not isDigest(digest):
+            raise ValueError('not a sha256: %r' % (digest,))
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        if not (self.enabled and isDigest(digest)):
+            return False
+        try:
+            return self._current(os.stat(self.blobPath(digest))) == digest
+        except FileNotFoundError:
+            return False
+
+    # the hash stored for stat's inode, None if there's none or the inode changed since (& it's dropped)
+    def _current(self, stat):
+        entry = self.inodes.get(stat.st_ino)
+        if entry is None:
+            return None
+        digest, size, mtime = entry
+        if (stat.st_size, stat.st_mtime_ns) == (size, mtime):
+            return digest
+        print('Blob edited in place, dropped from the store:', digest)
+        self.inodes.pop(stat.st_ino, None)
+        try:
+            # the names linked to it keep the edited bytes, only the store's claim on them goes
+            if os.stat(self.blobPath(digest)).st_ino == stat.st_ino:
+                os.remove(self.blobPath(digest))
+        except FileNotFoundError:
+            pass
+        return None
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION lookup
+
+    INTERFACE: def lookup(self, name):
+
+    ARGUMENTS: string name : file in ./files
+
+    RETURNS: string - hex sha256 of the file if it's a stored blob, None otherwise
+
+    NOTES:
+        A blob whose size or mtime changed since it was stored was edited in place, so its hash is
+        wrong. It's dropped from the store and None is returned, the caller hashes the file itself.
+    ----------------------------------------------------------------------------------------------
+    """
+    def lookup(self, name):
+        try:
+            stat = os.stat(os.path.join(self.filesDir, name))
+        except OSError:
+            return None
+        with self.lock:
+            return self._current(stat)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION link
+
+    INTERFACE: def link(self, name, digest):
+
+    ARGUMENTS:
+        string name : file in ./files to point at the blob
+        string digest : hex sha256 of a blob in the store
+
+    RETURNS: void
+
+    NOTES:
+        Links the blob under a temp name, then renames it over name, so a reader of name sees either
+        the old file or the new one, never a missing file.
+    ----------------------------------------------------------------------------------------------
+    """
+    def link(self, name, digest):
+        path = os.path.join(self.filesDir, name)
+        # renaming over a link to the same inode is a no-op that would leave the temp name behind
+        if os.path.exists(path) and os.path.samefile(path, self.blobPath(digest)):
+            return
+        tempName = utils.partPath(name) + '.link'
+        if os.path.lexists(tempName):
+            os.remove(tempName)
+        os.link(self.blobPath(digest), tempName)
+        os.replace(tempName, path)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION linkExisting
+
+    INTERFACE: def linkExisting(self, name, digest):
+
+    ARGUMENTS:
+        string name : file in ./files a client wants to upload
+        string digest : hex sha256 the client sent for it
+
+    RETURNS: bool - True if the content was already stored and name now points at it,
+                    False if it isn't or digest isn't a sha256
+
+    NOTES:
+        Checked & linked under the store lock, so a concurrent garbage collection can't remove the blob
+        in between.
+    ----------------------------------------------------------------------------------------------
+    """
+    def linkExisting(self, name, digest):
+        with self.lock:
+            if not self.has(digest):
+                return False
+            self.link(name, digest)
+            return True
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION ingest
+
+    INTERFACE: def ingest(self, name, digest=None):
+
+    ARGUMENTS:
+        string name : file in ./files that was just received
+        string digest : hex sha256 of the file if already known, computed otherwise
+
+    RETURNS: string - hex sha256 of the file
+
+    NOTES:
+        Adds a newly received file to the store. If its content is already stored, the name is
+        re-linked to the existing blob and the duplicate bytes are freed. Otherwise the file itself
+        becomes the blob, made read-only first.
+    ----------------------------------------------------------------------------------------------
+    """
+    def ingest(self, name, digest=None):
+        path = os.path.join(self.filesDir, name)
+        if digest is None:
+            digest = utils.fileDigest(path)
+        if not self.enabled:
+            return digest
+        try:
+            with self.lock:
+                if self.has(digest):
+                    self.link(name, digest)
+                else:
+                    os.makedirs(os.path.dirname(self.blobPath(digest)), exist_ok=True)
+                    os.chmod(path, READ_ONLY)
+                    os.link(path, self.blobPath(digest))
+                    stat = os.stat(path)
+                    self.inodes[stat.st_ino] = (digest, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            print('Blob store disabled, can\'t hard link:', e)
+            self.enabled = False
+        return digest
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION release
+
+    INTERFACE: def release(self, digest):
+
+    ARGUMENTS:
+        string digest : hex sha256 of a blob a name pointed at before it was replaced
+
+    RETURNS: bool - True if the blob was removed
+
+    NOTES:
+        Removes the blob if it has no names left, like collectGarbage does for every blob but without
+        going thru all of them, so each upload over an existing name frees the old content right away.
+    ----------------------------------------------------------------------------------------------
+    """
+    def release(self, digest):
+        with self.lock:
+            try:
+                blob = self.blobPath(digest)
+                stat = os.stat(blob)
+            except (ValueError, FileNotFoundError):
+                return False
+            if stat.st_nlink > 1:
+                return False
+            os.remove(blob)
+            self.inodes.pop(stat.st_ino, None)
+            return True
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION collectGarbage
+
+    INTERFACE: def collectGarbage(self):
+
+    ARGUMENTS: void
+
+    RETURNS: int - number of blobs removed
+
+    NOTES:
+        A blob with a link count of 1 has no names left pointing at it (they were replaced or deleted),
+        so it's removed.
+    ----------------------------------------------------------------------------------------------
+    """
+    def collectGarbage(self):
+        removed = 0
+        with self.lock:
+            for inode, (digest, size, mtime) in list(self.inodes.items()):
+                blob = self.blobPath(digest)
+                try:
+                    if os.stat(blob).st_nlink <= 1:
+                        os.remove(blob)
+                        del self.inodes[inode]
+                        removed += 1
+                except FileNotFoundError:
+                    del self.inodes[inode]
+        return removed
@@ -0,0 +1,229 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import delta
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: test_delta.py - unit tests for the delta transfer's op generation & receiver
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+CLASSES:
+    GenerateOpsTest(TestCase)
+    RecvDeltaTest(TestCase)
+
+GLOBAL CONSTANTS:
+    int BLOCK=2048 : block size the receiver's signatures are made with, delta.MIN_BLOCK
+
+NOTES:
+    Every case builds the ops from 1 copy of a file against the signatures of another, rebuilds the file
+    from the ops the way recvDelta does, and checks it came out the same. How many literal bytes it took
+    is checked too, since a delta that round trips by sending everything is still broken.
+
+    run with: python -m pytest tests (or python -m unittest discover tests)
+-------------------------------------------------------------------------------------------------------
+"""
+
+BLOCK=delta.MIN_BLOCK
+
+# the receiver's signatures of base, as sendSignatures would make them
+def _signatures(base):
+    blocks = [base[i:i + BLOCK] for i in range(0, len(base), BLOCK)]
+    return [(zlib.adler32(block), delta._strongHash(block)) for block in blocks]
+
+# the ops that turn base into data, as a list
+def _ops(data, base):
+    return list(delta._generateOps(memoryview(data), BLOCK, len(base), _signatures(base)))
+
+# the file recvDelta would rebuild from base & ops
+def _rebuild(base, ops):
+    rebuilt = bytearray()
+    for op, value in ops:
+        if op == delta.LITERAL:
+            rebuilt += value
+        else:
+            rebuilt += base[value * BLOCK:(value + 1) * BLOCK]
+    return bytes(rebuilt)
+
+def _literalBytes(ops):
+    return sum(len(value) for op, value in ops if op == delta.LITERAL)
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS GenerateOpsTest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class GenerateOpsTest(unittest.TestCase):
+
+NOTES:
+    Round trips of delta._generateOps. The data is seeded random bytes, so runs are repeatable and
+    no block matches by accident.
+----------------------------------------------------------------------------------------------
+"""
+class GenerateOpsTest(unittest.TestCase):
+    def setUp(self):
+        self.random = random.Random(6)
+
+    def randomBytes(self, count):
+        return self.random.randbytes(count)
+
+    def assertRoundTrip(self, data, base, maxLiteral):
+        ops = _ops(data, base)
+        self.assertEqual(_rebuild(base, ops), data)
+        self.assertLessEqual(_literalBytes(ops), maxLiteral)
+        for op, value in ops:
+            if op == delta.LITERAL:
+                self.assertTrue(0 < len(value) <= delta.MAX_LITERAL)
+            else:
+                self.assertTrue(0 <= value < len(_signatures(base)))
+        return ops
+
+    def testUnchanged(self):
+        base = self.randomBytes(BLOCK * 40)
+        ops = self.assertRoundTrip(base, base, 0)
+        self.assertEqual([value for op, value in ops], list(range(40)))
+
+    def testInsert(self):
+        base = self.randomBytes(BLOCK * 40)
+        data = base[:BLOCK * 10 + 100] + b'inserted' + base[BLOCK * 10 + 100:]
+        self.assertRoundTrip(data, base, 2 * BLOCK + 8)
+
+    def testDelete(self):
+        base = self.randomBytes(BLOCK * 40)
+        data = base[:BLOCK * 10 + 100] + base[BLOCK * 12 + 300:]
+        self.assertRoundTrip(data, base, 2 * BLOCK)
+
+    def testChangedBytes(self):
+        base = self.randomBytes(BLOCK * 40)
+        data = bytearray(base)
+        for position in (5, BLOCK * 20 + 7, len(data) - 1):
+            data[position] ^= 0xff
+        self.assertRoundTrip(bytes(data), base, 3 * BLOCK)
+
+    def testShortLastBlock(self):
+        base = self.randomBytes(BLOCK * 10 + 500)
+        ops = self.assertRoundTrip(base, base, 0)
+        self.assertEqual(ops[-1], (delta.BLOCK, 10))
+        # changed up front, the short block still only matches the very end
+        data = b'new start' + base
+        ops = self.assertRoundTrip(data, base, BLOCK + 9)
+        self.assertEqual(ops[-1], (delta.BLOCK, 10))
+
+    def testShortLastBlockNotAtEnd(self):
+        base = self.randomBytes(BLOCK * 10 + 500)
+        data = base + b'appended'
+        self.assertRoundTrip(data, base, BLOCK + 500 + 8)
+
+    def testSmallerThanBlock(self):
+        base = self.randomBytes(BLOCK * 3)
+        self.assertRoundTrip(b'tiny', base, 4)
+        self.assertRoundTrip(b'', base, 0)
+
+    def testNoBase(self):
+        data = self.randomBytes(delta.MAX_LITERAL * 2 + 1000)
+        ops = self.assertRoundTrip(data, b'', len(data))
+        self.assertEqual([len(value) for op, value in ops], [delta.MAX_LITERAL, delta.MAX_LITERAL, 1000])
+
+    def testLiteralFlush(self):
+        # a long unmatched run with a table to check against, flushed from inside the scan. It ends on a
+        # block boundary, so the blocks after it are matched from a skipped span too
+        base = self.randomBytes(BLOCK * 8)
+        data = self.randomBytes(delta.MAX_LITERAL * 2 + BLOCK * 3) + base
+        ops = self.assertRoundTrip(data, base, delta.MAX_LITERAL * 2 + BLOCK * 3)
+        self.assertEqual([len(value) for op, value in ops[:3]], [delta.MAX_LITERAL, delta.MAX_LITERAL, BLOCK * 3])
+        self.assertEqual([value for op, value in ops[3:]], list(range(8)))
+
+    def testSkipFindsShiftedData(self):
+        # a changed region long enough to start skipping, then unchanged data that no longer sits on a
+        # block boundary, which only a probe span can find again
+        base = self.randomBytes(BLOCK * 200)
+        changed = delta.MISS_BLOCKS + 2 * delta.PROBE_EVERY
+        data = self.randomBytes(BLOCK * changed + 3) + base[BLOCK * changed:]
+        ops = self.assertRoundTrip(data, base, BLOCK * (changed + delta.PROBE_EVERY + 1) + 3)
+        self.assertEqual([value for op, value in ops[-10:]], list(range(190, 200)))
+
+    def testSkipSendsChangedFileAsLiterals(self):
+        base = self.randomBytes(BLOCK * 100)
+        data = self.randomBytes(BLOCK * 100)
+        ops = self.assertRoundTrip(data, base, len(data))
+        self.assertTrue(all(op == delta.LITERAL for op, value in ops))
+
+# a socket that hands out data, then fails like a reset connection
+class _ResetSocket:
+    def __init__(self, data):
+        self.data = data
+
+    def recv(self, count):
+        if not self.data:
+            raise ConnectionResetError('reset by peer')
+        chunk, self.data = self.data[:count], self.data[count:]
+        return chunk
+
+    def recv_into(self, buffer, count=0):
+        chunk = self.recv(count or len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS RecvDeltaTest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class RecvDeltaTest(unittest.TestCase):
+
+NOTES:
+    Runs in a temp dir with its own ./files, like the server & client do.
+----------------------------------------------------------------------------------------------
+"""
+class RecvDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.startDir = os.getcwd()
+        self.root = tempfile.mkdtemp()
+        os.chdir(self.root)
+        os.makedirs('files')
+        with open('files/a.bin', 'wb') as file:
+            file.write(b'x' * BLOCK * 2)
+
+    def tearDown(self):
+        os.chdir(self.startDir)
+        shutil.rmtree(self.root)
+
+    def testResetRemovesPartFile(self):
+        ops = delta.OP.pack(delta.BLOCK, 0) + delta.OP.pack(delta.LITERAL, 100) + b'y' * 10
+        with self.assertRaises(ConnectionResetError):
+            delta.recvDelta(_ResetSocket(ops), 'a.bin', BLOCK)
+        self.assertEqual(sorted(os.listdir('files')), ['a.bin'])
+
+    def testRebuilds(self):
+        ops = delta.OP.pack(delta.BLOCK, 1) + delta.OP.pack(delta.LITERAL, 3) + b'yyy' + delta.OP.pack(delta.END, BLOCK + 3)
+        self.assertTrue(delta.recvDelta(_ResetSocket(ops), 'a.bin', BLOCK))
+        with open('files/a.bin', 'rb') as file:
+            self.assertEqual(file.read(), b'x' * BLOCK + b'yyy')
+        self.assertEqual(sorted(os.listdir('files')), ['a.bin'])
+
+if __name__ == '__main__':
+    unittest.main()
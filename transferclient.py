@@ -0,0 +1,426 @@
+import asyncio
+import concurrent.futures
+import threading
+import hashlib
+import utils
+import client
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: transferclient.py - client library, for scripts that transfer files without the prompt
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+CLASSES:
+    FileTransferClient(string : ip, bool : useSession, dict : options, bool : verbose)
+    AsyncFileTransferClient(FileTransferClient : syncClient)
+
+GLOBAL CONSTANTS:
+    int ASYNC_WORKERS=8 : threads an AsyncFileTransferClient runs commands on at the same time
+
+NOTES:
+    Keeps 1 control connection open for any number of commands, and returns what happened instead of
+    printing it, eg
+
+        with FileTransferClient('192.168.0.10', useSession=True) as ftc:
+            for entry in ftc.list(prefix='build-'):
+                result = ftc.get(entry['name'])
+
+    The commands are the same ones the terminal client runs (see client.py), so every transfer option
+    works the same: streams, delta, compress, resume of broken transfers and dedup of uploads.
+
+    Commands from different threads run at the same time, each on its own session stream, or without a session
+    on its own OS assigned data port the server connects back to. Only commands on the same file wait
+    for each other. With a fixed data port (utils.DATA_PORT, eg 8888 for older servers) and no session,
+    commands on 1 client run 1 at a time, and only 1 client per machine can be transferring.
+-------------------------------------------------------------------------------------------------------
+"""
+
+ASYNC_WORKERS=8
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS FileTransferClient
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class FileTransferClient(ip, useSession=False, options=None, verbose=False):
+
+ARGUMENTS:
+    string ip : ipv4 address of server
+    bool useSession : run commands over a multiplexed session instead of a data channel per command
+    dict options : default transfer options for every get/send, eg {'streams': 4, 'delta': True, 'compress': 'zlib', 'sparse': True}
+    bool verbose : keep printing the transfer progress msgs (sets utils.VERBOSE for the whole process)
+
+THROWS
+    OSError if the server can't be reached
+
+NOTES:
+    Files are read from & saved to ./files like the terminal client. Options passed to a single call
+    are added to the defaults for that call.
+----------------------------------------------------------------------------------------------
+"""
+class FileTransferClient:
+    def __init__(self, ip, useSession=False, options=None, verbose=False):
+        utils.VERBOSE = verbose
+        self.options = dict(options or {})
+        self.useSession = useSession
+        self.lock = threading.Lock()
+        self.fileLocks = {}
+        self.controlSocket, self.activeSession = client.connect(ip, useSession)
+        self.channel = self.activeSession or self.controlSocket
+        self.concurrent = client.canOverlap(self.channel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        client.disconnect(self.controlSocket, self.activeSession)
+
+    # commands run side by side, except 2 on the same file that would share its partial file,
+    # a fixed data port runs 1 at a time
+    def _exclusive(self, name=None):
+        if not self.concurrent:
+            return self.lock
+        if name is None:
+            return _NoLock
+        with self.lock:
+            return self.fileLocks.setdefault(name, threading.Lock())
+
+    def _options(self, options):
+        return dict(self.options, **options)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION get
+
+    INTERFACE: def get(self, name, **options):
+
+    ARGUMENTS:
+        string name : file on the server to save to ./files
+        options : transfer options for this call, eg streams=4
+
+    RETURNS: dict - {'name', 'status': 'saved' / 'not found' / 'incomplete', 'size'} (see client.handleGet)
+    ----------------------------------------------------------------------------------------------
+    """
+    def get(self, name, **options):
+        with self._exclusive(name):
+            return client.handleGet(self.channel, name, self._options(options))
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION send
+
+    INTERFACE: def send(self, name, **options):
+
+    ARGUMENTS:
+        string name : file in ./files to upload
+        options : transfer options for this call
+
+    RETURNS: dict - {'name', 'status': 'sent' / 'skipped' / 'missing', 'size'} (see client.handleSend)
+    ----------------------------------------------------------------------------------------------
+    """
+    def send(self, name, **options):
+        with self._exclusive(name):
+            return client.handleSend(self.channel, name, self._options(options))
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION getMany / sendMany
+
+    INTERFACE: def getMany(self, patterns, **options):
+               def sendMany(self, patterns, **options):
+
+    ARGUMENTS:
+        list patterns : names and/or glob patterns, matched on the server for getMany, in ./files for sendMany
+        options : transfer options for this call, only compress, sparse & verify apply
+
+    RETURNS: list - names of the files moved, all in 1 command (see client.handleMultiGet)
+    ----------------------------------------------------------------------------------------------
+    """
+    def getMany(self, patterns, **options):
+        with self._exclusive():
+            return client.handleMultiGet(self.channel, list(patterns), self._options(options))
+
+    def sendMany(self, patterns, **options):
+        with self._exclusive():
+            return client.handleMultiSend(self.channel, list(patterns), self._options(options))
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION iterList
+
+    INTERFACE: def iterList(self, prefix='', meta=True, hashes=False):
+
+    ARGUMENTS:
+        string prefix : only names starting with this
+        bool meta : include size & mtime (ns) of each file
+        bool hashes : include the sha256 of each file
+
+    RETURNS: generator - yields 1 dict per file, fetched a page at a time (see client.fetchList)
+
+    NOTES:
+        Without a session, the connection is busy until the generator is used up or closed.
+    ----------------------------------------------------------------------------------------------
+    """
+    def iterList(self, prefix='', meta=True, hashes=False):
+        with self._exclusive():
+            for entries in client.fetchList(self.channel, prefix, meta, hashes):
+                yield from entries
+
+    def list(self, prefix='', meta=True, hashes=False):
+        return list(self.iterList(prefix, meta, hashes))
+
+    def stats(self):
+        with self._exclusive():
+            return client.fetchStats(self.channel)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION sync
+
+    INTERFACE: def sync(self, direction='both', patterns=None, delete=False, **options):
+
+    ARGUMENTS:
+        string direction : 'get' to mirror the server into ./files, 'send' to mirror ./files onto the server,
+                           'both' for both ways
+        list patterns : names and/or glob patterns to sync, everything if empty
+        bool delete : with a direction, remove the files the other side doesn't have
+        options : transfer options for this call, workers=N moves N files at the same time
+
+    RETURNS: dict - {'fetched', 'sent', 'deleted', 'failed', 'unchanged'} (see client.handleSync)
+    ----------------------------------------------------------------------------------------------
+    """
+    def sync(self, direction='both', patterns=None, delete=False, **options):
+        with self._exclusive():
+            return client.handleSync(self.channel, direction, list(patterns or []), delete, self._options(options))
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION iterFile
+
+    INTERFACE: def iterFile(self, name, chunkSize=utils.RECV_CHUNK):
+
+    ARGUMENTS:
+        string name : file on the server
+        int chunkSize : max bytes per chunk yielded
+
+    RETURNS: generator - yields the file's bytes in chunks as they arrive, nothing is saved to disk
+
+    THROWS
+        FileNotFoundError if the server doesn't have the file
+        RuntimeError if the server disconnects before the whole file & its sha256 arrived, or the bytes don't
+            match the sha256 the server sent after them
+
+    NOTES:
+        A plain GET, read straight off the data channel: [FOUND][filesize packet][file bytes][sha256] (see server.handleGet).
+        The chunks are hashed as they're yielded, so a mismatch only shows after the last 1, and the caller
+        should throw away what it got when that raises. options verify=False leaves the sha256 out.
+        Without a session, the connection is busy until the generator is used up or closed.
+    ----------------------------------------------------------------------------------------------
+    """
+    def iterFile(self, name, chunkSize=utils.RECV_CHUNK):
+        with self._exclusive():
+            digest = hashlib.sha256() if self.options.get('verify', True) else None
+            request = utils.encodeRequest(name, {'verify': 1} if digest else {})
+            dataSocket = client.openDataChannel(self.channel, utils.GET, request)
+            try:
+                if utils.readDataPacket(dataSocket) != utils.FOUND:
+                    raise FileNotFoundError('file not found on server: ' + name)
+                left = int(utils.readDataPacket(dataSocket))
+                while left > 0:
+                    chunk = dataSocket.recv(min(chunkSize, left))
+                    if not chunk:
+                        raise RuntimeError('server disconnected with %d bytes of %s left' % (left, name))
+                    left -= len(chunk)
+                    if digest:
+                        digest.update(chunk)
+                    yield chunk
+                if digest:
+                    verified = utils.checkDigest(dataSocket, digest)
+                    if verified is None:
+                        raise RuntimeError('server disconnected before the sha256 of %s, it can\'t be verified' % name)
+                    if not verified:
+                        raise RuntimeError('%s was corrupted on the way, its sha256 does not match' % name)
+            finally:
+                dataSocket.close()
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION sendStream
+
+    INTERFACE: def sendStream(self, name, source, size):
+
+    ARGUMENTS:
+        string name : name to save the upload as on the server
+        source : file object opened in binary mode, or any iterable of bytes chunks
+        int size : exact number of bytes source will give
+
+    RETURNS: dict - {'name', 'status': 'sent' / 'corrupt' (server got different bytes), 'size'}
+
+    THROWS
+        ValueError if source gives more or less than size bytes (the server keeps what it got as a partial file)
+
+    NOTES:
+        Uploads without a local file, eg generated or piped data. The size has to be known up front since
+        it's sent before the bytes, and there's no hash up front, so the upload can't be deduplicated or resumed.
+        The sha256 is computed while the chunks go out and sent after them for the server to check,
+        unless options has verify=False.
+    ----------------------------------------------------------------------------------------------
+    """
+    def sendStream(self, name, source, size):
+        chunks = source
+        if hasattr(source, 'read'):
+            chunks = iter(lambda: source.read(utils.RECV_CHUNK), b'')
+        digest = hashlib.sha256() if self.options.get('verify', True) else None
+        requestOpts = {'size': size, 'verify': 1} if digest else {'size': size}
+        status = 'sent'
+        with self._exclusive(name):
+            dataSocket = client.openDataChannel(self.channel, utils.SEND, utils.encodeRequest(name, requestOpts))
+            try:
+                utils.sendDataPacket(dataSocket, size)
+                sent = 0
+                for chunk in chunks:
+                    if sent + len(chunk) > size:
+                        raise ValueError('source has more than %d bytes' % size)
+                    dataSocket.sendall(chunk)
+                    if digest:
+                        digest.update(chunk)
+                    sent += len(chunk)
+                if sent != size:
+                    raise ValueError('source ended after %d of %d bytes' % (sent, size))
+                if digest:
+                    utils.sendDigest(dataSocket, digest)
+                    if utils.readDataPacket(dataSocket) != utils.FOUND:
+                        status = 'corrupt'
+            finally:
+                dataSocket.close()
+        return {'name': name, 'status': status, 'size': size}
+
+# stands in for the lock in session mode
+class _NoLockType:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+_NoLock = _NoLockType()
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS AsyncFileTransferClient
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class AsyncFileTransferClient(syncClient):
+
+ARGUMENTS:
+    FileTransferClient syncClient : connected client to run the commands on, use connect() to make 1
+
+NOTES:
+    asyncio version of FileTransferClient, eg
+
+        ftc = await AsyncFileTransferClient.connect('192.168.0.10', useSession=True)
+        results = await asyncio.gather(*(ftc.get(name) for name in names))
+        await ftc.close()
+
+    Each call runs the blocking command on a thread of its own pool, like the server's runBlocking, so the
+    event loop never waits on a transfer. Up to ASYNC_WORKERS commands run at the same time, or 1 at a time
+    with a fixed data port and no session.
+----------------------------------------------------------------------------------------------
+"""
+class AsyncFileTransferClient:
+    def __init__(self, syncClient):
+        self.syncClient = syncClient
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=ASYNC_WORKERS if syncClient.concurrent else 1)
+
+    @classmethod
+    async def connect(cls, ip, useSession=False, options=None, verbose=False):
+        syncClient = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: FileTransferClient(ip, useSession, options, verbose))
+        return cls(syncClient)
+
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def close(self):
+        await self._run(self.syncClient.close)
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+
+    async def get(self, name, **options):
+        return await self._run(self.syncClient.get, name, **options)
+
+    async def send(self, name, **options):
+        return await self._run(self.syncClient.send, name, **options)
+
+    async def getMany(self, patterns, **options):
+        return await self._run(self.syncClient.getMany, patterns, **options)
+
+    async def sendMany(self, patterns, **options):
+        return await self._run(self.syncClient.sendMany, patterns, **options)
+
+    async def list(self, prefix='', meta=True, hashes=False):
+        return await self._run(self.syncClient.list, prefix, meta, hashes)
+
+    async def stats(self):
+        return await self._run(self.syncClient.stats)
+
+    async def sync(self, direction='both', patterns=None, delete=False, **options):
+        return await self._run(self.syncClient.sync, direction, patterns, delete, **options)
+
+    async def sendStream(self, name, source, size):
+        return await self._run(self.syncClient.sendStream, name, source, size)
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION iterList / iterFile
+
+    INTERFACE: async def iterList(self, prefix='', meta=True, hashes=False):
+               async def iterFile(self, name, chunkSize=utils.RECV_CHUNK):
+
+    RETURNS: async generator - same items as FileTransferClient.iterList / iterFile, each fetched on the pool
+    ----------------------------------------------------------------------------------------------
+    """
+    async def iterList(self, prefix='', meta=True, hashes=False):
+        async for entry in self._iterate(self.syncClient.iterList(prefix, meta, hashes)):
+            yield entry
+
+    async def iterFile(self, name, chunkSize=utils.RECV_CHUNK):
+        async for chunk in self._iterate(self.syncClient.iterFile(name, chunkSize)):
+            yield chunk
+
+    async def _iterate(self, generator):
+        try:
+            while True:
+                item = await self._run(next, generator, _END)
+                if item is _END:
+                    break
+                yield item
+        finally:
+            await self._run(generator.close)
+
+_END = object()
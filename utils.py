@@ -1,5 +1,19 @@
 import socket
 import os
+import errno
+import threading
+import time
+import urllib.parse
+import struct
+import zlib
+import lzma
+import hashlib
+import weakref
+import fnmatch
+import configparser
+import itertools
+import mmap
+import pipeline
 
 """
 ------------------------------------------------------------------------------------------------------
@@ -14,32 +28,142 @@ DESIGNER: Junyin Xia
 PROGRAMMER: Junyin Xia
 
 FUNCTIONS:
-    void main (void)
-    void userInputLoop(string : ip)
-    void handleGet(socket : controlSocket, string : filename)
-    void handleSend(socket : controlSocket, string : filename)
+    void log(args...)
+    socket createTcpSocket(int : bindPort, string : role)
+    void tuneSocket(socket : sock, string : role)
+    bool setCork(socket : sock, bool : on)
+    int chunkSize(socket : sock)
+    bool loadConfig(string : path, bool : required)
+    void sendStr(socket : sendSocket, string : str)
+    string recvStr(socket : recvSocket, int : msgLen)
+    bytes recvBytes(socket : recvSocket, int : msgLen)
+    void setProtocol(socket : sock, int : version)
+    int protocolOf(socket : sock)
+    void sendCmdPacket(socket : sendSocket, string : flag, string : msg)
+    tuple readCmdPacket(socket : readSocket)
+    void sendDataPacket(socket : sendSocket, string : msg)
+    string readDataPacket(socket : readSocket)
+    bytes readDataBytes(socket : readSocket)
+    string encodeRequest(string : filename, dict : opts)
+    tuple decodeRequest(string : msg)
+    void sendFile(socket : sendSocket, string : filename, int : offset, int : length, string : codec, hash : digest, bool : sparse)
+    void sendFileBytes(socket : sendSocket, memoryview : data, int : offset, int : length, hash : digest)
+    int sendFileRange(socket : sendSocket, file : file, int : offset, int : count, hash : digest)
+    bool recvFile(socket : recvSocket, string : filename, int : offset, bool : compressed, hash : digest, bool : sparse)
+    int recvToFile(socket : recvSocket, int : fd, int : offset, int : count, hash : digest)
+    void sendDigest(socket : sendSocket, hash : digest)
+    bool checkDigest(socket : recvSocket, hash : digest)
+    memoryview recvBuffer(int : size)
+    void setBufferSize(int : size)
+    void preallocate(int : fd, int : offset, int : count)
+    string chooseCodec(file : file, int : offset, int : count, string : requested)
+    generator dataExtents(int : fd, int : offset, int : count)
+    string partPath(string : filename)
+    int partialSize(string : filename)
+    bool lockName(string : filename, bool : blocking)
+    void unlockName(string : filename)
+    list listFiles(void)
+    bool isPattern(string : name)
+    list matchFiles(list : patterns, list : available)
+    void sendNameList(socket : sendSocket, list : names)
+    list readNameList(socket : readSocket)
+    int sendFiles(socket : sendSocket, list : names, string : codec, bool : verify, bool : sparse)
+    list recvFiles(socket : recvSocket, bool : compressed, bool : verify, bool : sparse)
+    string fileDigest(string : path)
+    int resolveStreamCount(int : requested, int : filesize)
+    list planRanges(int : filesize, int : count)
+    void sendFileParallel(list : sendSockets, string : filename, bool : verify)
+    list recvFileParallel(list : recvSockets, string : filename, int : filesize, bool : verify)
 
 GLOBAL CONSTANTS:
     ports
         int SERVER_COMM_PORT=7005 : control channel server port, client port is dynamic
         int SERVER_TX_PORT=7006 : data channel server port 
         int PORT_X=8888 : data channel client port 
+        int DATA_PORT=0 : port the client actually listens on for data channels, 0 for a new OS assigned port per
+                          command, sent to the server as port=N. Clients set it to PORT_X for servers that don't know port=N
 
     flag, all saved in string form to avoid calling str(flag)
         string GETALL='0'
         string GET='1'
         string SEND='2'
-        tuple CMDS=('GETALL','GET','SEND') : list for getting string form of flags from int, eg CMD[int(GETALL)]='GETALL'
+        string SESSION='3' : switch the control connection to a multiplexed session, see session.py
+        string MGET='4' : get every file matching a list of names/glob patterns over 1 data channel
+        string MSEND='5' : send a batch of files over 1 data channel
+        string STATS='6' : get the server's transfer metrics as json (see metrics.py)
+        string DELETE='7' : remove a list of files from the server, used by a SYNC that deletes
+        tuple CMDS=('GETALL','GET','SEND','SESSION','MGET','MSEND','STATS','DELETE') : list for getting string form of flags from int, eg CMD[int(GETALL)]='GETALL'
 
     status
         string NOT_FOUND='/404/' : msg the server sends to client when requested file not found 
         string FOUND='/200/' : msg the server sends to client when requested file found
+        string CORRUPT='/422/' : msg the server sends back when a verified SEND didn't match its digest
     
     misc    
-        int BUFFER_SIZE=8192 : max number of bytes (8kb) to read at a time from either a socket or a file
+        bool VERBOSE=True : print progress msgs (see log), a script using the client as a library turns them off
+        int RECV_CHUNK=262144 : smallest chunk file bytes are read & received in (see chunkSize)
+        tuple SENDFILE_UNSUPPORTED : errnos os.sendfile raises when zero-copy isn't possible for a socket/file pair
+        string OPTS_SEP='\\0' : separates the filename from the options in a cmd packet msg, can't appear in a filename
+        string GLOB_CHARS='*?[' : a name with any of these in it is a glob pattern (see fnmatch)
+
+    parallel transfers
+        int MAX_STREAMS=8 : max number of data connections 1 file is split across
+        int PARALLEL_RANGE_SIZE=67108864 : bytes per stream (64mb) used to pick a stream count when asked to auto-tune
+
+    compression
+        tuple CODECS=('zlib','lzma') : codecs a transfer can ask for, 'none' is sent back when compression is skipped
+        int ZLIB_LEVEL=1, LZMA_PRESET=1 : fastest settings, they still get most of the ratio on text
+        int COMPRESS_CHUNK=262144 : bytes of file read & compressed at a time
+        int SAMPLE_SIZE=65536, SAMPLE_COUNT=4 : how much of the file is test compressed to decide if it's worth it
+        float MIN_RATIO=0.9 : compression is skipped if the sample doesn't shrink below this fraction of its size
+        Struct FRAME_LEN : length prefix of each compressed frame, a 0 length frame ends the stream
+
+    socket tuning, each can be set in the [socket] section of the config file (see loadConfig)
+        string CONTROL='control', DATA='data' : roles a socket is tuned for (see tuneSocket)
+        string CONFIG_FILE='./transfer.ini' : config file read on startup if it exists
+        int MAX_CHUNK=2097152 : largest chunk chunkSize picks from the bandwidth-delay product
+        int CHUNK_SIZE=None : chunk bytes to always use, None picks 1 per socket (config: chunk)
+        int SOCKET_BUFFER=None : SO_SNDBUF & SO_RCVBUF bytes, None keeps the OS autotuning (config: buffer)
+        int NOTSENT_LOWAT=None : TCP_NOTSENT_LOWAT bytes on data sockets, None for the OS default (config: notsent_lowat)
+        bool NODELAY=True : TCP_NODELAY on control sockets (config: nodelay)
+        bool CORK=True : TCP_CORK around each file's headers & bytes (config: cork)
+        Struct TCP_INFO_LAYOUT : start of linux's struct tcp_info, its 8 flag bytes then 24 u32 fields
+        int TCPI_SND_MSS=2, TCPI_SND_CWND=18, TCPI_RCV_SPACE=22 : index of those fields in TCP_INFO_LAYOUT
+
+    mapped receive, each can be set in the [receive] section of the config file (see loadConfig)
+        bool RECV_MMAP=False : receive file bytes straight into a mapping of the file (config: mmap)
+        int MMAP_FLUSH=0 : msync the mapping every this many bytes received, 0 leaves write back to
+                           the kernel like a pwrite would (config: mmap_flush)
+        int MMAP_WINDOW=67108864 : most bytes of a file mapped at once (64mb)
+
+    write-behind
+        WriteBehind WRITE_BEHIND=None : queue the server hands its receives' writes to & syncs complete files
+                                        with (see writebehind.py), None writes in line with no syncs
+
+    packet framing
+        int PROTOCOL_V1=1 : original packets, 3 ascii digit length, msgs up to 999 bytes
+        int PROTOCOL_V2=2 : binary packets, 8 byte length
+        int DEFAULT_PROTOCOL : format used on sockets that weren't set with setProtocol
+        int V2_MARKER=0xF2 : first byte of every v2 packet, can't be mistaken for a v1 flag or length digit
+        int V1_MAX_LENGTH=999 : longest msg a v1 packet can carry
+        int MAX_PACKET=16777216 : longest msg a v2 packet is read with (16mb), well over the biggest listing page
+        Struct CMD_HEADER : [V2_MARKER][flag][msg length] header of a v2 cmd packet
+        Struct DATA_HEADER : [V2_MARKER][msg length] header of a v2 data packet
 
 NOTES:
     This file contains helper functions shared between server & client.
+
+    Packets come in 2 formats. A server reads the first cmd packet of a connection in either format and
+    answers in the same 1 on that connection (see readCmdPacket), so old clients keep working. The client
+    speaks v2 unless told to use v1 for an old server.
+
+    A transfer that asks for verify=1 is checked end to end: the sender hashes the file bytes (sha256) as they
+    go out and sends the digest after them, the receiver hashes what it writes and compares (see checkDigest).
+    Both hash the same buffers the bytes move thru, so no file is read a 2nd time.
+
+    A transfer that asks for sparse=1 only moves the data regions of the file, found with SEEK_DATA/SEEK_HOLE
+    (see dataExtents), and the receiver leaves holes where the sender had them. A mostly empty VM image or
+    preallocated database file then costs its data, not its size, on the wire & on disk.
 -------------------------------------------------------------------------------------------------------
 """
 
@@ -48,15 +172,95 @@ NOTES:
 SERVER_COMM_PORT=7005
 SERVER_TX_PORT=7006
 PORT_X=8888
+DATA_PORT=0
 
 GETALL='0'
 GET='1'
 SEND='2'
-CMDS=('GETALL','GET','SEND')
+SESSION='3'
+MGET='4'
+MSEND='5'
+STATS='6'
+DELETE='7'
+CMDS=('GETALL','GET','SEND','SESSION','MGET','MSEND','STATS','DELETE')
 
 NOT_FOUND='/404/'
 FOUND='/200/'
-BUFFER_SIZE=8192
+CORRUPT='/422/'
+VERBOSE=True
+RECV_CHUNK=262144
+SENDFILE_UNSUPPORTED=(errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP, errno.EBADF)
+OPTS_SEP='\0'
+GLOB_CHARS='*?['
+
+MAX_STREAMS=8
+PARALLEL_RANGE_SIZE=67108864
+
+CODECS=('zlib','lzma')
+ZLIB_LEVEL=1
+LZMA_PRESET=1
+COMPRESS_CHUNK=262144
+SAMPLE_SIZE=65536
+SAMPLE_COUNT=4
+MIN_RATIO=0.9
+FRAME_LEN=struct.Struct('!I')
+
+PROTOCOL_V1=1
+PROTOCOL_V2=2
+DEFAULT_PROTOCOL=PROTOCOL_V2
+V2_MARKER=0xF2
+V1_MAX_LENGTH=999
+MAX_PACKET=16777216
+CMD_HEADER=struct.Struct('!BcQ')
+DATA_HEADER=struct.Struct('!BQ')
+
+CONTROL='control'
+DATA='data'
+CONFIG_FILE='./transfer.ini'
+MAX_CHUNK=2097152
+CHUNK_SIZE=None
+SOCKET_BUFFER=None
+NOTSENT_LOWAT=None
+NODELAY=True
+CORK=True
+TCP_INFO_LAYOUT=struct.Struct('8x24I')
+TCPI_SND_MSS=2
+TCPI_SND_CWND=18
+TCPI_RCV_SPACE=22
+
+RECV_MMAP=False
+MMAP_FLUSH=0
+MMAP_WINDOW=67108864
+
+WRITE_BEHIND=None
+
+protocols = weakref.WeakKeyDictionary()
+recvBuffers = threading.local()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION log
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def log(*args):
+    
+ARGUMENTS: args : printed like print's arguments
+
+RETURNS: void
+
+NOTES:
+    Progress msgs of transfers ('File saved', 'Resuming from byte' ...) go through here instead of print,
+    so they can be turned off with VERBOSE when the caller wants results, not output.
+----------------------------------------------------------------------------------------------
+"""
+def log(*args):
+    if VERBOSE:
+        print(*args)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -68,27 +272,207 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def createTcpSocket(bindPort=None):
+INTERFACE: def createTcpSocket(bindPort=None, role=None):
     
-ARGUMENTS: int bindPort : port to bind new socket to, leave empty to use random port assigned by OS 
+ARGUMENTS:
+    int bindPort : port to bind new socket to, leave empty to use random port assigned by OS 
+    string role : CONTROL or DATA to tune the socket for that channel (see tuneSocket), None to leave it untuned
 
-RETURNS: void
+RETURNS: socket - the new socket
 
 NOTES:
 Creates a new TCP socket, and binds it to a local port if specified.
 Also sets the socket address to be reusable.
+It's tuned before it's bound, since the receive buffer size has to be set before connecting (the window scale
+is agreed on in the handshake). Sockets accepted from a listening socket inherit its options.
 ----------------------------------------------------------------------------------------------
 """
-def createTcpSocket(bindPort=None):
+def createTcpSocket(bindPort=None, role=None):
     newSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     newSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if role is not None:
+        tuneSocket(newSocket, role)
     if bindPort is not None:
         newSocket.bind(('', bindPort))
     return newSocket
 
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION tuneSocket
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def tuneSocket(sock, role):
+    
+ARGUMENTS:
+    socket sock : tcp socket, not connected yet
+    string role : CONTROL or DATA
+
+RETURNS: void
+
+NOTES:
+    Both roles get SOCKET_BUFFER as send & receive buffer if it's set. Left unset, linux grows the buffers
+    on its own as the connection speeds up, and setting them turns that off, so only set it to go past
+    the autotuning limits on a long fat link (linux caps it at net.core.rmem_max/wmem_max).
+    Control sockets get TCP_NODELAY: cmd packets & session frames are small writes that need an answer,
+    and Nagle would hold them back until the last write is acked (a delayed ack costs ~40ms).
+    Data sockets get TCP_NOTSENT_LOWAT if set, which caps how much unsent data sits in the send buffer.
+    Options the platform doesn't have are skipped.
+----------------------------------------------------------------------------------------------
+"""
+def tuneSocket(sock, role):
+    if SOCKET_BUFFER:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+    if role == CONTROL and NODELAY:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    elif role == DATA and NOTSENT_LOWAT and hasattr(socket, 'TCP_NOTSENT_LOWAT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, NOTSENT_LOWAT)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION setCork
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def setCork(sock, on):
+    
+ARGUMENTS:
+    socket sock : data socket about to send, or done sending, 1 file
+    bool on : True to hold back partial segments, False to send what's held back
+
+RETURNS: bool - True if the socket was corked/uncorked, False if it can't be (no TCP_CORK, session stream, CORK off)
+
+NOTES:
+    While corked, the kernel only sends full segments, so a file's small header packets go out in the same
+    segment as its first bytes, and a batch of small files packs into full segments. Uncorking sends the rest.
+----------------------------------------------------------------------------------------------
+"""
+def setCork(sock, on):
+    if not CORK or not hasattr(socket, 'TCP_CORK'):
+        return False
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if on else 0)
+    except (AttributeError, OSError):
+        return False
+    return True
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION chunkSize
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def chunkSize(sock):
+    
+ARGUMENTS:
+    socket sock : socket a file is about to be sent or received on
+
+RETURNS: int - bytes to read from the file or socket at a time
+
+NOTES:
+    CHUNK_SIZE if it's set. Otherwise the connection's bandwidth-delay product, read from TCP_INFO:
+    the sender's congestion window (snd_cwnd * snd_mss), or the receiver's estimate of what arrives per
+    round trip (rcv_space), whichever is bigger. That's rounded up to a power of 2 between RECV_CHUNK and
+    MAX_CHUNK, so a fast or far away link is read in fewer, bigger syscalls.
+    RECV_CHUNK if there's no TCP_INFO (not linux, session stream).
+----------------------------------------------------------------------------------------------
+"""
+def chunkSize(sock):
+    if CHUNK_SIZE:
+        return CHUNK_SIZE
+    try:
+        info = TCP_INFO_LAYOUT.unpack(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_LAYOUT.size))
+    except (AttributeError, OSError, struct.error):
+        return RECV_CHUNK
+    bdp = max(info[TCPI_SND_CWND] * info[TCPI_SND_MSS], info[TCPI_RCV_SPACE])
+    chunk = RECV_CHUNK
+    while chunk < bdp and chunk < MAX_CHUNK:
+        chunk *= 2
+    return chunk
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION loadConfig
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def loadConfig(path=CONFIG_FILE, required=False):
+    
+ARGUMENTS:
+    string path : ini file to read
+    bool required : raise if the file doesn't exist, otherwise a missing file is skipped
+
+RETURNS: bool - True if the file was read
+
+THROWS
+    FileNotFoundError if required and the file doesn't exist
+    ValueError if a setting isn't a number/boolean
+
+NOTES:
+    Reads the socket tuning settings from the [socket] section, eg
+        [socket]
+        buffer = 4194304
+        chunk = 1048576
+        notsent_lowat = 131072
+        nodelay = yes
+        cork = yes
+    and how deep transfers are pipelined from the [pipeline] section (see pipeline.py), eg
+        [pipeline]
+        depth = 4
+        min_bytes = 1048576
+    where depth = 0 runs every transfer on 1 thread, and whether files are received into a mapping of
+    the file from the [receive] section (see recvToFile), eg
+        [receive]
+        mmap = yes
+        mmap_flush = 268435456
+    Settings that aren't there keep their defaults. Commandline options are applied after this, so they win.
+----------------------------------------------------------------------------------------------
+"""
+def loadConfig(path=CONFIG_FILE, required=False):
+    global CHUNK_SIZE, SOCKET_BUFFER, NOTSENT_LOWAT, NODELAY, CORK, RECV_MMAP, MMAP_FLUSH
+    if not os.path.isfile(path):
+        if required:
+            raise FileNotFoundError('config file not found: ' + path)
+        return False
+    config = configparser.ConfigParser()
+    config.read(path)
+    if config.has_section('socket'):
+        section = config['socket']
+        CHUNK_SIZE = section.getint('chunk', CHUNK_SIZE)
+        SOCKET_BUFFER = section.getint('buffer', SOCKET_BUFFER)
+        NOTSENT_LOWAT = section.getint('notsent_lowat', NOTSENT_LOWAT)
+        NODELAY = section.getboolean('nodelay', NODELAY)
+        CORK = section.getboolean('cork', CORK)
+    if config.has_section('pipeline'):
+        section = config['pipeline']
+        pipeline.PIPELINE_DEPTH = section.getint('depth', pipeline.PIPELINE_DEPTH)
+        pipeline.MIN_PIPELINE_BYTES = section.getint('min_bytes', pipeline.MIN_PIPELINE_BYTES)
+    if config.has_section('receive'):
+        section = config['receive']
+        RECV_MMAP = section.getboolean('mmap', RECV_MMAP)
+        MMAP_FLUSH = section.getint('mmap_flush', MMAP_FLUSH)
+    return True
 
 """
 ----------------------------------------------------------------------------------------------
+
 FUNCTION sendStr
 
 DATE: Oct 1 2020
@@ -148,7 +532,7 @@ THROWS
     RuntimeError if socket disconnects before all bytes are read
 
 NOTES:
-    A wrapper function for python's socket.recv(bytes). Reads BUFFER_SIZE bytes from socket at a time, and keep reading until expected size reached.
+    A wrapper function for python's socket.recv(bytes). Reads from socket until expected size reached (see recvBytes).
     Due to nature of network buffers, python's socket.recv may not read all the bytes on the socket in 1 call. 
     especially when receiving longer messages. That is why client & server uses this wrapper for anything longer than a couple bytes.
 
@@ -156,16 +540,102 @@ NOTES:
 ----------------------------------------------------------------------------------------------
 """
 def recvStr(recvSocket,msgLen):
-    chunks = []
-    bytes_read = 0
+    return recvBytes(recvSocket,msgLen).decode()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvBytes
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvBytes(recvSocket,msgLen):
+    
+ARGUMENTS:
+    socket recvSocket : socket to read from
+    int msgLen : exact number of bytes to read
+
+RETURNS: bytes - msgLen bytes read from socket
+
+THROWS
+    RuntimeError if socket disconnects before all bytes are read
+
+NOTES:
+    Same as recvStr, but returns the raw bytes. Used for binary headers (eg session frames).
+    A short msg usually arrives whole, so it's read with 1 recv and no copying. Otherwise the rest is read
+    with recv_into straight into 1 buffer of the full size, instead of joining a list of chunks.
+----------------------------------------------------------------------------------------------
+"""
+def recvBytes(recvSocket,msgLen):
+    if msgLen == 0:
+        return b''
+    chunk = b''
+    if msgLen <= RECV_CHUNK:
+        chunk = recvSocket.recv(msgLen)
+        if len(chunk) == msgLen:
+            return chunk
+    # rest didn't arrive in 1 go, read it straight into 1 buffer of the full size
+    buffer = bytearray(msgLen)
+    view = memoryview(buffer)
+    view[:len(chunk)] = chunk
+    bytes_read = len(chunk)
     while bytes_read < msgLen:
-        chunk = recvSocket.recv(min(BUFFER_SIZE,msgLen))
-        # python empty str is false, empty chunk == connection broke, stop reading
-        if not chunk:
+        count = recvSocket.recv_into(view[bytes_read:])
+        # 0 bytes == connection broke, stop reading
+        if not count:
             raise RuntimeError('recvStr socket disconnected while reading!')
-        chunks.append(chunk)
-        bytes_read += len(chunk)
-    return b''.join(chunks).decode()
+        bytes_read += count
+    return bytes(buffer)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION setProtocol
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def setProtocol(sock, version):
+    
+ARGUMENTS:
+    socket sock : socket or session stream
+    int version : PROTOCOL_V1 or PROTOCOL_V2, the packet format the other side of sock speaks
+
+RETURNS: void
+
+NOTES:
+    Remembers which packet format to use on sock. Kept in a weak table so it goes away with the socket.
+    Sockets that were never set use DEFAULT_PROTOCOL.
+----------------------------------------------------------------------------------------------
+"""
+def setProtocol(sock, version):
+    protocols[sock] = version
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION protocolOf
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def protocolOf(sock):
+    
+ARGUMENTS:
+    socket sock : socket or session stream
+
+RETURNS: int - packet format spoken on sock
+----------------------------------------------------------------------------------------------
+"""
+def protocolOf(sock):
+    return protocols.get(sock, DEFAULT_PROTOCOL)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -182,22 +652,30 @@ INTERFACE: def sendCmdPacket(sendSocket,flag,msg=''):
 ARGUMENTS:
     socket sendSocket : socket to send packet to
     string flag : one of the global command flags, GET/GETALL/SEND
-    msg : string message to send with packet, empty by default
+    msg : string or bytes message to send with packet, empty by default
 
 RETURNS: void
 
+THROWS
+    RuntimeError if msg is too long for a v1 packet
+
 NOTES:
-    Constructors a packet (string) like so
+    Constructors a packet like so (protocol v2)
+    [V2_MARKER][flag][length of msg][msg]
+      1 byte   1 byte  8 bytes
+    or on a v1 socket (see setProtocol)
     [flag][length of msg][msg]
     1 byte  3 bytes
-    Then calls sendStr to send packet to socket
+    Header & msg go out in 1 sendall.
 ----------------------------------------------------------------------------------------------
 """
 def sendCmdPacket(sendSocket,flag,msg=''):
-    msgStr=str(msg)
-    paddedLength = '{:0>3}'.format(len(msgStr))
-    packet=flag + paddedLength + msgStr
-    sendStr(sendSocket, packet)
+    payload = _packetPayload(msg)
+    if protocolOf(sendSocket) == PROTOCOL_V2:
+        header = CMD_HEADER.pack(V2_MARKER, flag.encode(), len(payload))
+    else:
+        header = flag.encode() + _v1Length(payload)
+    sendSocket.sendall(header + payload)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -218,18 +696,26 @@ RETURNS:
     flag : string flag command, one of GET/GETALL/SEND
     msg : usually the requested file's name, for GETALL this is empty 
 
+THROWS
+    RuntimeError if a v2 packet says it's longer than MAX_PACKET
+
 NOTES:
-    Read some bytes from a socket, in this format
-    [flag][length of msg][msg]
-    1 byte  3 bytes
-    then returns the flag and decoded string.
-    See readDataPacket header for why it's used here
+    Read a cmd packet in either format, and returns the flag and decoded string.
+    The first byte tells the formats apart, a v1 packet starts with an ascii digit flag and 
+    a v2 packet with V2_MARKER. The socket is then set to the format the sender used, so replies match.
+    The length comes from the peer & the msg buffer is allocated from it, so it's checked first.
 ----------------------------------------------------------------------------------------------
 """
 def readCmdPacket(readSocket):
-    flag =recvStr(readSocket,1)
-    msg = readDataPacket(readSocket)
-    return (flag, msg)
+    first = recvBytes(readSocket, 1)
+    if first[0] == V2_MARKER:
+        setProtocol(readSocket, PROTOCOL_V2)
+        marker, flag, msgLen = CMD_HEADER.unpack(first + recvBytes(readSocket, CMD_HEADER.size - 1))
+        _checkLength(msgLen)
+        return (flag.decode(), recvBytes(readSocket, msgLen).decode())
+    setProtocol(readSocket, PROTOCOL_V1)
+    msgLen = int(recvBytes(readSocket, 3))
+    return (first.decode(), recvBytes(readSocket, msgLen).decode())
 
 """
 ----------------------------------------------------------------------------------------------
@@ -245,22 +731,30 @@ INTERFACE: def sendDataPacket(sendSocket, msg):
     
 ARGUMENTS:
     socket sendSocket : socket to send msg from
-    string msg : message to send as part of packet
+    msg : string or bytes message to send as part of packet
 
 RETURNS: void
 
+THROWS
+    RuntimeError if msg is too long for a v1 packet
+
 NOTES:
-    Send some bytes to a socket, in this format
+    Send some bytes to a socket, in this format (protocol v2)
+    [V2_MARKER][length of msg][msg]
+      1 byte     8 bytes       N bytes
+    or on a v1 socket
     [length of msg][msg]
       3 bytes       N bytes
     This is same format has cmdPacket, minus the flag 1 byte.
 ----------------------------------------------------------------------------------------------
 """
 def sendDataPacket(sendSocket, msg):
-    msgStr=str(msg)
-    paddedLength = '{:0>3}'.format(len(msgStr))
-    packet=paddedLength + msgStr
-    sendStr(sendSocket, packet)
+    payload = _packetPayload(msg)
+    if protocolOf(sendSocket) == PROTOCOL_V2:
+        header = DATA_HEADER.pack(V2_MARKER, len(payload))
+    else:
+        header = _v1Length(payload)
+    sendSocket.sendall(header + payload)
 
 """
 ----------------------------------------------------------------------------------------------
@@ -280,15 +774,121 @@ ARGUMENTS:
 RETURNS: string : string message that was read from socket
 
 NOTES:
-    Read some bytes from a socket, in this format
-    [length of msg][msg]
-           3 bytes  N bytes
-    then returns the decoded msg.
+    Reads a data packet with readDataBytes, then returns the decoded msg.
 ----------------------------------------------------------------------------------------------
 """
 def readDataPacket(readSocket):
-    msgLen=int(recvStr(readSocket,3))
-    return recvStr(readSocket, msgLen)
+    return readDataBytes(readSocket).decode()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION readDataBytes
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def readDataBytes(readSocket):
+    
+ARGUMENTS:
+    socket readSocket : socket to read from
+
+RETURNS: bytes : raw msg that was read from socket
+
+THROWS
+    RuntimeError if a v2 packet doesn't start with V2_MARKER (the stream is out of step), or says it's
+                 longer than MAX_PACKET
+
+NOTES:
+    Reads the fixed size header for the socket's protocol (see sendDataPacket), then the msg.
+    The length is checked before the msg buffer is allocated from it, so a peer can't make it allocate
+    gbs with 1 header.
+----------------------------------------------------------------------------------------------
+"""
+def readDataBytes(readSocket):
+    if protocolOf(readSocket) == PROTOCOL_V2:
+        marker, msgLen = DATA_HEADER.unpack(recvBytes(readSocket, DATA_HEADER.size))
+        if marker != V2_MARKER:
+            raise RuntimeError('readDataBytes bad packet marker: ' + hex(marker))
+        _checkLength(msgLen)
+    else:
+        msgLen = int(recvBytes(readSocket, 3))
+    return recvBytes(readSocket, msgLen)
+
+# refuses a v2 length from the peer that's too long to be a real packet
+def _checkLength(msgLen):
+    if msgLen > MAX_PACKET:
+        raise RuntimeError('packet of ' + str(msgLen) + ' bytes is over MAX_PACKET')
+
+# str msgs are sent utf-8 encoded, bytes as is
+def _packetPayload(msg):
+    if isinstance(msg, (bytes, bytearray, memoryview)):
+        return bytes(msg)
+    return str(msg).encode()
+
+# 3 digit length of a v1 packet, which can't hold more than 999 bytes
+def _v1Length(payload):
+    if len(payload) > V1_MAX_LENGTH:
+        raise RuntimeError('packet of ' + str(len(payload)) + ' bytes too long for protocol v1')
+    return '{:0>3}'.format(len(payload)).encode()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION encodeRequest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def encodeRequest(filename, opts=None):
+    
+ARGUMENTS:
+    string filename : file the command is about
+    dict opts : extra options for the command, eg {'streams': 4}. Leave empty for a plain request
+
+RETURNS: string - msg to send in a cmd packet
+
+NOTES:
+    Builds the msg of a cmd packet as
+    [filename]['\\0'][opt1=val1&opt2=val2...]
+    A request without options is just the filename, exactly what older clients send.
+----------------------------------------------------------------------------------------------
+"""
+def encodeRequest(filename, opts=None):
+    if not opts:
+        return filename
+    return filename + OPTS_SEP + urllib.parse.urlencode(opts)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION decodeRequest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def decodeRequest(msg):
+    
+ARGUMENTS:
+    string msg : msg read from a cmd packet
+
+RETURNS: 
+    string filename : file the command is about
+    dict opts : options sent with the command, values are strings
+
+NOTES:
+    Counterpart to encodeRequest.
+----------------------------------------------------------------------------------------------
+"""
+def decodeRequest(msg):
+    filename, sep, query = msg.partition(OPTS_SEP)
+    return (filename, dict(urllib.parse.parse_qsl(query)))
 
 """
 ----------------------------------------------------------------------------------------------
@@ -300,39 +900,282 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def sendFile(sendSocket,filename):
+INTERFACE: def sendFile(sendSocket,filename,offset=0,length=None,codec=None,digest=None,sparse=False):
     
 ARGUMENTS:
     socket sendSocket : socket to send file to
     string filename : file to read & send 
+    int offset : byte to start sending from, used to resume a broken transfer
+    int length : max number of bytes to send, leave empty to send up to the end of file
+    string codec : compression the receiver asked for (one of CODECS), leave empty for a plain transfer
+    hash digest : hashlib object to hash the bytes sent with & send after them (see sendDigest), or the hex
+                  sha256 of the range if it's already known. Leave empty for no digest
+    bool sparse : True if the receiver asked for a sparse transfer, to send only the data regions
 
 RETURNS: void
 
 NOTES:
     This function does not check if file exist, server.handleGet & client.handleSend functions already handles it. 
-    Writes a file to a socket chunk by chunk. 
+    Writes a file to a socket using sendFileRange.
 
-    Open a file in binary mode, and send its filesize as a data packet
+    Open a file in binary mode, and send the number of bytes that will follow as a data packet
         packet1 - [size of filesize str][filesize as str]
                     3 bytes                 N bytes
-    If file isn't empty, read the file BUFFER_SIZE chunks at a time, and send each chunk across sendSocket
-    (Untested, but in theory, since file is read & transferred 1 BUFFER_SIZE chunk at a time, any sized file can be sent.)
+    That's the whole filesize unless a range was asked for.
+    If the range isn't empty, it's handed to sendFileRange, which lets the kernel copy it straight
+    from the page cache into the socket when it can.
+
+    When a codec was asked for, packet1 is followed by the codec actually used as a data packet. It's 'none' if
+    a sample of the file didn't compress (see chooseCodec), and the bytes go out as usual. Otherwise the range
+    is streamed as compressed frames (see _sendCompressed).
+
+    The socket is corked while the file goes out (see setCork), so the packets don't each get a small segment.
+
+    With a digest, the digest of the uncompressed range follows as a last data packet. A hashlib object is fed
+    the bytes as they're sent, which means reading them instead of letting the kernel copy them, a digest that's
+    already known keeps the zero-copy path.
+
+    A sparse transfer that isn't compressed sends the range as its data regions instead, each behind a data
+    packet with its place in the range, and an empty packet after the last (see _sendSparse).
+    Compression already squeezes the holes down to nearly nothing, so a compressed range is sent as usual.
 ----------------------------------------------------------------------------------------------
 """
-def sendFile(sendSocket,filename):
+def sendFile(sendSocket,filename,offset=0,length=None,codec=None,digest=None,sparse=False):
+    hashing = digest if digest is not None and not isinstance(digest, str) else None
     # read binary mode
     with open('./files/'+filename,'rb') as file:
-        filesize=os.path.getsize('./files/'+filename)
+        filesize=os.fstat(file.fileno()).st_size
+        count=max(0, filesize-offset)
+        if length is not None:
+            count=min(count, length)
         
-        sendDataPacket(sendSocket, filesize)
-        if filesize != 0:
-            bytes_sent=0
-            while bytes_sent < filesize:
-                chunk=file.read(BUFFER_SIZE)
-                if not chunk:
-                    raise RuntimeError("sendFile socket disconnected while sending")
-                bytes_sent+=sendSocket.send(chunk)
-        print('File sent, bytes',filesize)
+        corked = setCork(sendSocket, True)
+        try:
+            sendDataPacket(sendSocket, count)
+            if codec is not None:
+                codec = chooseCodec(file, offset, count, codec)
+                sendDataPacket(sendSocket, codec)
+            if codec in CODECS:
+                wireBytes = _sendCompressed(sendSocket, file, offset, count, codec, hashing)
+            elif sparse:
+                wireBytes = _sendSparse(sendSocket, file, offset, count, hashing)
+            elif count != 0:
+                sendFileRange(sendSocket, file, offset, count, hashing)
+            if digest is not None:
+                sendDigest(sendSocket, digest)
+        finally:
+            if corked:
+                setCork(sendSocket, False)
+    if codec in CODECS:
+        log('File sent, bytes',count,codec,'compressed to',wireBytes)
+    elif sparse:
+        log('File sent, bytes',count,'of which',count - wireBytes,'in holes')
+    else:
+        log('File sent, bytes',count)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendFileBytes
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendFileBytes(sendSocket, data, offset=0, length=None, digest=None):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send the file to
+    memoryview data : whole content of the file, eg from the server's cache (see cache.py)
+    int offset : position in the file to start sending from
+    int length : max number of bytes to send, None to send till the end
+    hash digest : hashlib object or known hex digest to send after the bytes, like sendFile
+
+RETURNS: void
+
+NOTES:
+    Same as an uncompressed sendFile, but the file is already in memory, so nothing is opened or read.
+----------------------------------------------------------------------------------------------
+"""
+def sendFileBytes(sendSocket, data, offset=0, length=None, digest=None):
+    count = max(0, len(data) - offset)
+    if length is not None:
+        count = min(count, length)
+    corked = setCork(sendSocket, True)
+    try:
+        sendDataPacket(sendSocket, count)
+        if count != 0:
+            sendSocket.sendall(data[offset:offset + count])
+        if digest is not None:
+            if not isinstance(digest, str):
+                digest.update(data[offset:offset + count])
+            sendDigest(sendSocket, digest)
+    finally:
+        if corked:
+            setCork(sendSocket, False)
+    log('File sent, bytes',count,'from cache')
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendFileRange
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendFileRange(sendSocket, file, offset, count, digest=None):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send file bytes to
+    file file : file object opened in binary mode
+    int offset : position in file of the first byte to send
+    int count : number of bytes to send
+    hash digest : hashlib object to feed the bytes to, None if they don't need hashing
+
+RETURNS: int - number of bytes sent, always count
+
+THROWS
+    RuntimeError if the file ends before count bytes were sent
+
+NOTES:
+    Sends count bytes of a file starting at offset, without framing.
+    Tries the zero-copy path first (os.sendfile), where file pages go from the page cache to the socket
+    without ever becoming python bytes. If the socket or platform can't do that (no fileno, no os.sendfile,
+    or the kernel rejects the pair), the rest of the range is sent with the buffered fallback.
+    A metered socket (see metrics.MeteredSocket) is told how many bytes went out zero-copy.
+    Bytes that have to be hashed pass thru python anyway, so they always take the buffered path.
+----------------------------------------------------------------------------------------------
+"""
+def sendFileRange(sendSocket, file, offset, count, digest=None):
+    sent = 0
+    if digest is None and hasattr(os, 'sendfile') and hasattr(sendSocket, 'fileno'):
+        sent = _sendFileZeroCopy(sendSocket, file, offset, count)
+        # these bytes never went thru sendSocket.send, tell a metered socket about them (see metrics.py)
+        if sent and hasattr(sendSocket, 'countSent'):
+            sendSocket.countSent(sent)
+    if sent < count:
+        sent += _sendFileBuffered(sendSocket, file, offset + sent, count - sent, digest)
+    return sent
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _sendFileZeroCopy
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _sendFileZeroCopy(sendSocket, file, offset, count):
+    
+ARGUMENTS:
+    socket sendSocket : blocking socket to send file bytes to
+    file file : file object opened in binary mode
+    int offset : position in file of the first byte to send
+    int count : number of bytes to send
+
+RETURNS: int - number of bytes sent. 0 if zero-copy isn't supported for this socket & file
+
+THROWS
+    RuntimeError if the file ends before count bytes were sent
+
+NOTES:
+    os.sendfile may send fewer bytes than asked for (just like socket.send), so keep calling it from
+    the new offset until the whole range is out.
+    On a shaped socket each call only sends what the scheduler granted (see shaper.ShapedSocket).
+----------------------------------------------------------------------------------------------
+"""
+def _sendFileZeroCopy(sendSocket, file, offset, count):
+    try:
+        sockFd = sendSocket.fileno()
+        fileFd = file.fileno()
+    except (OSError, ValueError):
+        return 0
+
+    # a shaped socket (see shaper.py) hands out the range a slice at a time
+    reserve = getattr(sendSocket, 'reserve', None)
+    sent = 0
+    while sent < count:
+        granted = reserve(count - sent) if reserve else count - sent
+        try:
+            bytes_sent = os.sendfile(sockFd, fileFd, offset + sent, granted)
+        except InterruptedError:
+            if reserve:
+                sendSocket.refund(granted)
+            continue
+        except OSError as e:
+            if reserve:
+                sendSocket.refund(granted)
+            # kernel refused this socket/file pair, let caller fall back to read + send
+            if sent == 0 and e.errno in SENDFILE_UNSUPPORTED:
+                return 0
+            raise
+        if reserve:
+            sendSocket.refund(granted - bytes_sent)
+        if bytes_sent == 0:
+            raise RuntimeError("sendFile file ended before all bytes were sent")
+        sent += bytes_sent
+    return sent
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _sendFileBuffered
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _sendFileBuffered(sendSocket, file, offset, count, digest=None):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send file bytes to
+    file file : file object opened in binary mode
+    int offset : position in file of the first byte to send
+    int count : number of bytes to send
+    hash digest : hashlib object to feed each chunk to before it's sent, None for no hashing
+
+RETURNS: int - number of bytes sent, always count
+
+THROWS
+    RuntimeError if the file ends before count bytes were sent
+
+NOTES:
+    Fallback for sendFileRange. Reads the file in chunkSize chunks and hands each chunk to sendall,
+    which keeps calling send until every byte of the chunk is written (a single send can be partial).
+    A big range runs as a pipeline (see pipeline.py), reading & hashing the next chunks on their own
+    threads while the socket drains this 1, into a ring of reused buffers.
+----------------------------------------------------------------------------------------------
+"""
+def _sendFileBuffered(sendSocket, file, offset, count, digest=None):
+    threaded = pipeline.shouldThread(count)
+    stages = [_hashing(digest)] if digest is not None else []
+    ring = pipeline.bufferRing(min(chunkSize(sendSocket), count), len(stages), threaded)
+    pipeline.runPipeline(_readChunks(file, offset, count, itertools.cycle(ring)), stages, sendSocket.sendall, threaded)
+    return count
+
+# yields count bytes of file from offset, each read into the next buffer of ring
+def _readChunks(file, offset, count, ring):
+    file.seek(offset)
+    while count > 0:
+        view = next(ring)
+        bytes_read = file.readinto(view[:min(len(view), count)])
+        if not bytes_read:
+            raise RuntimeError("sendFile file ended before all bytes were sent")
+        count -= bytes_read
+        yield view[:bytes_read]
+
+# pipeline stage that feeds each chunk to digest & passes it on
+def _hashing(digest):
+    def update(chunk):
+        digest.update(chunk)
+        return chunk
+    return update
 
 """
 ----------------------------------------------------------------------------------------------
@@ -344,41 +1187,1326 @@ DESIGNER: Junyin Xia
 
 PROGRAMMER: Junyin Xia
 
-INTERFACE: def sendFile(sendSocket,filename):
+INTERFACE: def recvFile(recvSocket,filename,offset=0,compressed=False,digest=None,sparse=False):
     
 ARGUMENTS:
-    socket sendSocket : socket to send file to
-    string filename : file to read & send 
+    socket recvSocket : socket to read file from
+    string filename : file to save
+    int offset : number of bytes already in the partial file to keep, the sender starts from this byte
+    bool compressed : True if a codec was asked for, so the sender will say which codec it used
+    hash digest : hashlib object to hash the bytes that arrive with, when the sender was asked to send
+                  a digest after them. Leave empty for no verification
+    bool sparse : True if a sparse transfer was asked for, so an uncompressed file comes as data regions
 
-RETURNS: void
+RETURNS: bool - True if the whole file was received (and matched the sender's digest), False if the sender
+                disconnected part way, before its digest, or the digest didn't match
 
 NOTES:
     Counterpart to sendFile, reads a file chunk by chunk from a socket and saves it.
     
-    Creates or clears a file locally with filename passed in. Then reads the file size from the socket, and reads the 
-    file chunk by chunk from the socket if it isn't empty.
-
-    (Untested, but in theory, since file is read & saved 1 BUFFER_SIZE chunk at a time, any sized file can be received.)
+    Reads the number of bytes to expect from the socket, cuts the partial file (see partPath) down to offset
+    and preallocates room for the rest, then reads the file from the socket into it with recvToFile.
+    Compressed frames are decompressed 1 frame at a time as they arrive, so the file is never held in memory.
+    Once every byte is in, the partial file is renamed over filename. 
+    
+    If the sender disconnects part way, the partial file is cut back to the bytes that arrived and kept, so
+    the next GET/SEND of the same file can resume from where this one stopped instead of starting from byte 0.
+
+    With a digest, the bytes are hashed from the receive buffer before they're written, and compared with the
+    digest the sender sends after them (see checkDigest). Only this transfer's bytes are covered, not the part
+    of a resumed file that was already here. A file that doesn't match is removed, partial file and all, since
+    resuming from bad bytes would only keep them. A transfer that breaks before the digest arrives isn't
+    verified, so the partial file is cut back to offset, what was there before this run. Keeping the whole
+    file would make the resume start at its end and check only an empty run. So after a False return, a
+    partial file is left behind only if the transfer broke.
+
+    A sparse file isn't preallocated, its data regions are written where they go and the gaps between them
+    are left as holes (see _recvSparse). The digest covers the holes as the zeros they read back as.
+
+    On the server, a complete file that passed verification is handed to WRITE_BEHIND.commit just before
+    it's renamed into place, and to WRITE_BEHIND.placed after, which sync it & ./files to disk if the
+    durability policy says so (see writebehind.py). A file that's discarded is never synced.
 ----------------------------------------------------------------------------------------------
 """
-def recvFile(recvSocket,filename):
+def recvFile(recvSocket,filename,offset=0,compressed=False,digest=None,sparse=False):
     filesize=int(readDataPacket(recvSocket))
+    codec=readDataPacket(recvSocket) if compressed else 'none'
+    sparse = sparse and codec not in CODECS
+    if offset:
+        log('Resuming from byte', offset, 'bytes left:', filesize)
+    else:
+        log('Sender\'s file size: ',filesize)
+
+    partName = partPath(filename)
+    fd = os.open(partName, os.O_RDWR | os.O_CREAT, 0o644)
+    bytes_read = 0
+    try:
+        os.ftruncate(fd, offset)
+        if not sparse:
+            preallocate(fd, offset, filesize)
+        if codec in CODECS:
+            with open(fd, 'wb', closefd=False) as file:
+                file.seek(offset)
+                bytes_read = _recvCompressed(recvSocket, file, filesize, codec, digest)
+        elif sparse:
+            bytes_read = _recvSparse(recvSocket, fd, offset, filesize, digest)
+        else:
+            bytes_read = recvToFile(recvSocket, fd, offset, filesize, digest)
+        if bytes_read == filesize:
+            verified = checkDigest(recvSocket, digest) if digest is not None else True
+            if verified and WRITE_BEHIND is not None:
+                WRITE_BEHIND.commit(fd)
+    finally:
+        # cut off the preallocated tail, so the partial file's size is what arrived & resume starts there
+        if bytes_read < filesize:
+            os.ftruncate(fd, offset + bytes_read)
+        os.close(fd)
+    if bytes_read < filesize:
+        log('recvFile socket disconnected while reading!', offset + bytes_read, 'bytes kept, transfer again to resume')
+        return False
+    if verified is None:
+        # this run's bytes can't be verified, so they're dropped & the resume sends them again with a digest
+        os.truncate(partName, offset)
+        log('recvFile got no digest after the file!', offset, 'bytes kept, transfer again to resume')
+        return False
+    if not verified:
+        os.remove(partName)
+        log('File failed verification, discarded:', filename)
+        return False
+    os.replace(partName, './files/'+filename)
+    if WRITE_BEHIND is not None:
+        WRITE_BEHIND.placed('./files/'+filename)
+    log('File saved: /files/'+filename)
+    return True
 
-    # create or clear file
-    with open('./files/'+filename,'w') as file:
-        file.write('')
-        
-    print('Sender\'s file size: ',filesize)
-    if filesize == 0:
-        return
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvToFile
 
-    with open('./files/'+filename,'ab') as file:
-        bytes_read = 0
-        while bytes_read < filesize:
-            chunk = recvSocket.recv(BUFFER_SIZE)
-            if not chunk:
-                print('recvFile socket disconnected while reading!')
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvToFile(recvSocket, fd, offset, count, digest=None):
+    
+ARGUMENTS:
+    socket recvSocket : socket to read from
+    int fd : file descriptor opened for writing, or reading & writing to allow a mapped receive
+    int offset : where in the file the bytes go
+    int count : number of bytes to read
+    hash digest : hashlib object to feed each chunk to before it's written, None for no hashing
+
+RETURNS: int - bytes written, short if the sender disconnected part way
+
+NOTES:
+    The receive loop of every file transfer. Reads with recv_into into the thread's reused buffer
+    (see recvBuffer) and writes each chunk out with pwrite, so no bytes object is created per chunk and
+    the file position never needs a seek. Several threads can write different ranges of 1 fd at once.
+    The chunk size comes from the connection (see chunkSize).
+
+    A big range runs as a pipeline (see pipeline.py): a thread fills a ring of buffers from the socket,
+    another hashes them, and this thread writes them, so the socket is read while the disk writes.
+
+    With RECV_MMAP set, a preallocated range is received straight into a mapping of the file instead
+    (see _recvMapped), as long as fd can be mapped. Otherwise with WRITE_BEHIND set (the server), the writes
+    go thru its queue & writer threads (see writebehind.py).
+----------------------------------------------------------------------------------------------
+"""
+def recvToFile(recvSocket, fd, offset, count, digest=None):
+    if RECV_MMAP and count >= RECV_CHUNK:
+        bytes_read = _recvMapped(recvSocket, fd, offset, count, digest)
+        if bytes_read is not None:
+            return bytes_read
+    if WRITE_BEHIND is not None and count >= RECV_CHUNK:
+        bytes_read = WRITE_BEHIND.receive(recvSocket, fd, offset, count, digest)
+        if bytes_read is not None:
+            return bytes_read
+    threaded = pipeline.shouldThread(count)
+    stages = [_hashing(digest)] if digest is not None else []
+    size = chunkSize(recvSocket)
+    ring = pipeline.bufferRing(min(size, count), len(stages)) if threaded else [recvBuffer(size)]
+    bytes_read = 0
+    def write(chunk):
+        nonlocal bytes_read
+        written = 0
+        while written < len(chunk):
+            written += os.pwrite(fd, chunk[written:], offset + bytes_read + written)
+        bytes_read += written
+    pipeline.runPipeline(_recvChunks(recvSocket, count, itertools.cycle(ring)), stages, write, threaded)
+    return bytes_read
+
+# yields up to count bytes from the socket, each in the next buffer of ring, ends early if the sender disconnects
+def _recvChunks(recvSocket, count, ring):
+    while count > 0:
+        view = next(ring)
+        received = recvSocket.recv_into(view, min(len(view), count))
+        if not received:
+            return
+        count -= received
+        yield view[:received]
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _recvMapped
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _recvMapped(recvSocket, fd, offset, count, digest=None):
+    
+ARGUMENTS:
+    socket recvSocket : socket to read from
+    int fd : file descriptor opened for reading & writing, of a file already preallocated past the range
+    int offset : where in the file the bytes go
+    int count : number of bytes to read
+    hash digest : hashlib object to feed the bytes to as they land, None for no hashing
+
+RETURNS: int - bytes received, short if the sender disconnected part way. None if the range can't be
+         mapped, before anything was read, so the caller can receive it the usual way
+
+NOTES:
+    recv_into writes each chunk straight into the file's pages thru a shared mapping, so there's no
+    receive buffer to copy out of and no write syscall per chunk. The file is mapped MMAP_WINDOW bytes
+    at a time, to keep a huge file from taking that much address space.
+
+    Only a range inside the file is mapped, so the file's size still only ever says what the caller made
+    it (see preallocate). A sparse receive, which doesn't preallocate, writes the usual way. The range is
+    also reserved with posix_fallocate, since preallocate may have only extended the file: a store into a
+    mapped page the filesystem has no room for kills the process with SIGBUS instead of raising, so a
+    range that can't be reserved (a full disk, or a platform without it) isn't mapped.
+
+    Dirty pages are written back by the kernel whenever it likes, like after a pwrite, unless MMAP_FLUSH
+    is set, then every MMAP_FLUSH bytes received are msync'd before more are read.
+----------------------------------------------------------------------------------------------
+"""
+def _recvMapped(recvSocket, fd, offset, count, digest=None):
+    end = offset + count
+    if os.fstat(fd).st_size < end:
+        return None
+    try:
+        os.posix_fallocate(fd, offset, count)
+    except (AttributeError, OSError):
+        return None
+    bytes_read = 0
+    while bytes_read < count:
+        position = offset + bytes_read
+        start = position - position % mmap.ALLOCATIONGRANULARITY
+        length = min(MMAP_WINDOW, end - start)
+        try:
+            mapping = mmap.mmap(fd, length, offset=start)
+        except (OSError, ValueError):
+            if bytes_read:
+                raise
+            return None
+        with mapping:
+            received = _recvWindow(recvSocket, mapping, position - start, digest)
+        bytes_read += received
+        if start + length > position + received:
+            break
+    return bytes_read
+
+# receives into mapping from done to its end, msyncing every MMAP_FLUSH bytes, returns bytes received
+def _recvWindow(recvSocket, mapping, done, digest):
+    first = done
+    flushed = done - done % mmap.PAGESIZE
+    with memoryview(mapping) as view:
+        while done < len(view):
+            received = recvSocket.recv_into(view[done:])
+            if not received:
+                break
+            if digest is not None:
+                digest.update(view[done:done + received])
+            done += received
+            if MMAP_FLUSH and done - flushed >= MMAP_FLUSH:
+                mapping.flush(flushed, done - flushed)
+                flushed = done - done % mmap.PAGESIZE
+    if MMAP_FLUSH and done > flushed:
+        mapping.flush(flushed, done - flushed)
+    return done - first
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendDigest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendDigest(sendSocket, digest):
+    
+ARGUMENTS:
+    socket sendSocket : socket the file bytes were sent on
+    hash digest : hashlib object that was fed every byte sent, or a hex digest that's already known
+
+RETURNS: void
+
+NOTES:
+    Sends the trailer of a verified transfer, the hex digest as a data packet.
+----------------------------------------------------------------------------------------------
+"""
+def sendDigest(sendSocket, digest):
+    sendDataPacket(sendSocket, digest if isinstance(digest, str) else digest.hexdigest())
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION checkDigest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def checkDigest(recvSocket, digest):
+    
+ARGUMENTS:
+    socket recvSocket : socket the file bytes were read from
+    hash digest : hashlib object that was fed every byte received
+
+RETURNS: bool - True if the sender's trailer matches digest, False if it doesn't,
+                None if the connection ended (or the trailer was garbled) before a whole trailer arrived
+
+NOTES:
+    Counterpart to sendDigest. It's only called when the sender was asked for verify=1, and every sender
+    that's asked sends the trailer, so a missing 1 means the transfer broke right after the last file byte.
+    That's not verified, so callers treat None like a broken transfer: the bytes are kept to resume from,
+    but the file isn't saved.
+----------------------------------------------------------------------------------------------
+"""
+def checkDigest(recvSocket, digest):
+    try:
+        expected = readDataPacket(recvSocket)
+    except RuntimeError:
+        log('Sender sent no digest, transfer not verified')
+        return None
+    if expected != digest.hexdigest():
+        log('Digest mismatch, sender sent', expected, 'received bytes hash to', digest.hexdigest())
+        return False
+    return True
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvBuffer
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvBuffer(size=RECV_CHUNK):
+    
+ARGUMENTS: int size : bytes needed
+
+RETURNS: memoryview - size byte view of a buffer that belongs to the calling thread
+
+NOTES:
+    Each thread gets 1 buffer the first time it receives a file, and keeps reusing it for every
+    file after that, so a busy receiver doesn't allocate or free anything per chunk.
+    The buffer only grows, when a connection asks for a bigger chunk than it's had so far.
+----------------------------------------------------------------------------------------------
+"""
+def recvBuffer(size=RECV_CHUNK):
+    view = getattr(recvBuffers, 'view', None)
+    if view is None or len(view) < size:
+        view = recvBuffers.view = memoryview(bytearray(size))
+    return view[:size]
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION setBufferSize
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def setBufferSize(size):
+    
+ARGUMENTS:
+    int size : bytes per read when receiving or copying file data
+
+RETURNS: void
+
+NOTES:
+    Sets CHUNK_SIZE, so every transfer uses size instead of a chunk picked from the connection (see chunkSize).
+----------------------------------------------------------------------------------------------
+"""
+def setBufferSize(size):
+    global CHUNK_SIZE
+    CHUNK_SIZE = size
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION preallocate
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def preallocate(fd, offset, count):
+    
+ARGUMENTS:
+    int fd : file descriptor opened for writing
+    int offset : start of the range that will be written
+    int count : size of the range that will be written
+
+RETURNS: void
+
+NOTES:
+    Reserves disk space for a file that's about to be received, with posix_fallocate where the
+    platform & filesystem have it, so the writes that follow don't fragment the file or fail half
+    way on a full disk. Otherwise the file is just extended to its final size.
+----------------------------------------------------------------------------------------------
+"""
+def preallocate(fd, offset, count):
+    if count == 0:
+        return
+    try:
+        os.posix_fallocate(fd, offset, count)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, offset + count)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION chooseCodec
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def chooseCodec(file, offset, count, requested):
+    
+ARGUMENTS:
+    file file : file object opened in binary mode
+    int offset : start of the range that will be sent
+    int count : size of the range that will be sent
+    string requested : codec the receiver asked for
+
+RETURNS: string - requested codec, or 'none' if compression isn't worth it
+
+NOTES:
+    Test compresses SAMPLE_COUNT samples spread evenly over the range with fast zlib. Already compressed
+    data (archives, media) doesn't shrink, and compressing it only costs cpu, so it's sent raw instead.
+    Unknown codecs & empty ranges also get 'none'.
+----------------------------------------------------------------------------------------------
+"""
+def chooseCodec(file, offset, count, requested):
+    if requested not in CODECS or count == 0:
+        return 'none'
+    sampled = 0
+    compressedSize = 0
+    step = max(count // SAMPLE_COUNT, 1)
+    for start in range(offset, offset + count, step)[:SAMPLE_COUNT]:
+        file.seek(start)
+        sample = file.read(min(SAMPLE_SIZE, offset + count - start))
+        sampled += len(sample)
+        compressedSize += len(zlib.compress(sample, 1))
+    if compressedSize >= sampled * MIN_RATIO:
+        return 'none'
+    return requested
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _sendCompressed
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _sendCompressed(sendSocket, file, offset, count, codec, digest=None):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send file to
+    file file : file object opened in binary mode
+    int offset : start of the range to send
+    int count : size of the range to send
+    string codec : one of CODECS
+    hash digest : hashlib object to feed the uncompressed bytes to, None for no hashing
+
+RETURNS: int - compressed bytes sent
+
+THROWS
+    RuntimeError if the file ends before count bytes were read
+
+NOTES:
+    Reads COMPRESS_CHUNK bytes at a time through a streaming compressor, and sends whatever it 
+    produces as frames
+        [length][compressed bytes]
+        4 bytes  N bytes
+    followed by a 0 length frame once the compressor is flushed.
+
+    A big range runs as a pipeline (see pipeline.py), reading, hashing & compressing on threads of their
+    own while the frames go out, so a slow codec no longer leaves the socket idle between chunks.
+----------------------------------------------------------------------------------------------
+"""
+def _sendCompressed(sendSocket, file, offset, count, codec, digest=None):
+    compressor = zlib.compressobj(ZLIB_LEVEL) if codec == 'zlib' else lzma.LZMACompressor(preset=LZMA_PRESET)
+    threaded = pipeline.shouldThread(count)
+    stages = ([_hashing(digest)] if digest is not None else []) + [compressor.compress]
+    ring = pipeline.bufferRing(COMPRESS_CHUNK, len(stages), threaded)
+    wireBytes = 0
+    def send(data):
+        nonlocal wireBytes
+        wireBytes += _sendFrame(sendSocket, data)
+    pipeline.runPipeline(_readChunks(file, offset, count, itertools.cycle(ring)), stages, send, threaded)
+    wireBytes += _sendFrame(sendSocket, compressor.flush())
+    sendSocket.sendall(FRAME_LEN.pack(0))
+    return wireBytes
+
+def _sendFrame(sendSocket, data):
+    # compressors often hold data back, nothing to send yet
+    if data:
+        sendSocket.sendall(FRAME_LEN.pack(len(data)))
+        sendSocket.sendall(data)
+    return len(data)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _recvCompressed
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _recvCompressed(recvSocket, file, count, codec, digest=None):
+    
+ARGUMENTS:
+    socket recvSocket : socket to read frames from
+    file file : file to write the decompressed bytes to
+    int count : decompressed bytes the sender said it will send
+    string codec : one of CODECS
+    hash digest : hashlib object to feed the decompressed bytes to, None for no hashing
+
+RETURNS: int - decompressed bytes written, short if the sender disconnected part way
+
+NOTES:
+    Counterpart to _sendCompressed. Each frame is decompressed as soon as it arrives, with output
+    capped at COMPRESS_CHUNK per call, so even a frame of highly compressed zeros never blows up in memory.
+    For a big file the frames are read on a thread of their own (see pipeline.py) while this 1
+    decompresses & writes the frames before them.
+----------------------------------------------------------------------------------------------
+"""
+def _recvCompressed(recvSocket, file, count, codec, digest=None):
+    isZlib = codec == 'zlib'
+    decompressor = zlib.decompressobj() if isZlib else lzma.LZMADecompressor()
+    bytes_written = 0
+    def write(frame):
+        nonlocal bytes_written
+        data = decompressor.decompress(frame, COMPRESS_CHUNK)
+        while True:
+            file.write(data)
+            bytes_written += len(data)
+            if digest is not None:
+                digest.update(data)
+            if isZlib:
+                if not decompressor.unconsumed_tail and len(data) < COMPRESS_CHUNK:
+                    break
+                data = decompressor.decompress(decompressor.unconsumed_tail, COMPRESS_CHUNK)
+            else:
+                if decompressor.needs_input or decompressor.eof:
+                    break
+                data = decompressor.decompress(b'', COMPRESS_CHUNK)
+    try:
+        pipeline.runPipeline(_recvFrames(recvSocket), [], write, pipeline.shouldThread(count))
+        if isZlib:
+            data = decompressor.flush()
+            file.write(data)
+            bytes_written += len(data)
+            if digest is not None:
+                digest.update(data)
+    except RuntimeError:
+        pass
+    return bytes_written
+
+# yields the compressed frames up to the 0 length 1 that ends them
+def _recvFrames(recvSocket):
+    while True:
+        frameLen = FRAME_LEN.unpack(recvBytes(recvSocket, FRAME_LEN.size))[0]
+        if frameLen == 0:
+            return
+        yield recvBytes(recvSocket, frameLen)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION dataExtents
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def dataExtents(fd, offset, count):
+    
+ARGUMENTS:
+    int fd : file descriptor of the file
+    int offset : start of the range to look at
+    int count : length of the range
+
+RETURNS: generator - yields (start, length) of each data region that overlaps the range, clipped to it
+
+NOTES:
+    Walks the file with lseek SEEK_DATA to the next byte of data and SEEK_HOLE to the end of it, so only
+    the extent map is read, never the holes. SEEK_DATA failing with ENXIO means there's only hole left.
+    Where the platform or filesystem can't tell holes apart, the whole range is 1 data region.
+----------------------------------------------------------------------------------------------
+"""
+def dataExtents(fd, offset, count):
+    end = offset + count
+    if not hasattr(os, 'SEEK_DATA'):
+        if count:
+            yield (offset, count)
+        return
+    position = offset
+    while position < end:
+        try:
+            start = os.lseek(fd, position, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return
+            if position != offset:
+                raise
+            yield (offset, count)
+            return
+        if start >= end:
+            return
+        stop = min(os.lseek(fd, start, os.SEEK_HOLE), end)
+        yield (start, stop - start)
+        position = stop
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _sendSparse
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _sendSparse(sendSocket, file, offset, count, digest=None):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send to
+    file file : file object opened in binary mode
+    int offset : position in file of the range to send
+    int count : length of the range
+    hash digest : hashlib object to feed the range to, holes as zeros, None for no hashing
+
+RETURNS: int - data bytes sent, the rest of count was holes
+
+NOTES:
+    Each data region of the range goes out as
+        [data packet: 'start length', start relative to offset][length raw bytes thru sendFileRange]
+    and an empty data packet ends the range. The receiver knows the range size from packet1 already,
+    so a hole at the end needs nothing sent.
+----------------------------------------------------------------------------------------------
+"""
+def _sendSparse(sendSocket, file, offset, count, digest=None):
+    sent = 0
+    position = offset
+    for start, length in dataExtents(file.fileno(), offset, count):
+        if digest is not None:
+            _hashZeros(digest, start - position)
+        sendDataPacket(sendSocket, '%d %d' % (start - offset, length))
+        sent += sendFileRange(sendSocket, file, start, length, digest)
+        position = start + length
+    if digest is not None:
+        _hashZeros(digest, offset + count - position)
+    sendDataPacket(sendSocket, '')
+    return sent
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _recvSparse
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _recvSparse(recvSocket, fd, offset, count, digest=None):
+    
+ARGUMENTS:
+    socket recvSocket : socket to read from
+    int fd : file descriptor of the partial file, already cut to offset
+    int offset : where in the file the range starts
+    int count : length of the range
+    hash digest : hashlib object to feed the range to, holes as zeros, None for no hashing
+
+RETURNS: int - bytes of the range in place, holes included, short if the sender disconnected part way
+
+THROWS
+    RuntimeError if a data region is out of order or outside the range
+
+NOTES:
+    Counterpart to _sendSparse. Each data region is written at its place with recvToFile, which
+    skips over the gap since the last 1, and the file is extended to its full size at the end, so
+    the filesystem leaves every gap as a hole instead of writing zeros.
+----------------------------------------------------------------------------------------------
+"""
+def _recvSparse(recvSocket, fd, offset, count, digest=None):
+    done = 0
+    while True:
+        try:
+            extent = readDataPacket(recvSocket)
+        except RuntimeError:
+            return done
+        if not extent:
+            break
+        start, length = map(int, extent.split())
+        if start < done or start + length > count:
+            raise RuntimeError('recvFile data region out of range: ' + extent)
+        if digest is not None:
+            _hashZeros(digest, start - done)
+        received = recvToFile(recvSocket, fd, offset + start, length, digest)
+        done = start + received
+        if received < length:
+            return done
+    if digest is not None:
+        _hashZeros(digest, count - done)
+    os.ftruncate(fd, offset + count)
+    return count
+
+# feeds count zero bytes to digest, what a hole reads back as
+def _hashZeros(digest, count):
+    zeros = memoryview(bytes(min(count, RECV_CHUNK)))
+    while count > 0:
+        digest.update(zeros[:count])
+        count -= len(zeros)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION partPath
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def partPath(filename):
+    
+ARGUMENTS:
+    string filename : file being received
+
+RETURNS: string - path of the partial file a transfer of filename is written to
+
+NOTES:
+    Files are received into ./files/.<filename>.part and only renamed to their real name once
+    complete, so a broken transfer never looks like a whole file. Being a dot file, it's left out of 
+    file listings.
+----------------------------------------------------------------------------------------------
+"""
+def partPath(filename):
+    return './files/.' + filename + '.part'
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION partialSize
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def partialSize(filename):
+    
+ARGUMENTS:
+    string filename : file being received
+
+RETURNS: int - bytes already received by an earlier broken transfer of filename, 0 if there was none
+
+NOTES:
+    This is the offset to ask the sender to resume from.
+----------------------------------------------------------------------------------------------
+"""
+def partialSize(filename):
+    try:
+        return os.path.getsize(partPath(filename))
+    except OSError:
+        return 0
+
+# names being received, filename -> [lock, threads holding or waiting for it], dropped once nobody is
+_receiving = {}
+_receivingLock = threading.Lock()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION lockName
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def lockName(filename, blocking=True):
+    
+ARGUMENTS:
+    string filename : file about to be received
+    bool blocking : False to return right away if another receive of filename holds it
+
+RETURNS: bool - True if the lock was taken, release it with unlockName
+
+NOTES:
+    Every receive of a name writes the same partial file (see partPath), so 2 at once would write over
+    each other's bytes, truncate each other, and rename the mix into place. The server runs clients at
+    the same time, so it holds this for the whole receive of a name, and a 2nd upload of the same name
+    waits for the 1st to finish, then resumes from or replaces what it left.
+----------------------------------------------------------------------------------------------
+"""
+def lockName(filename, blocking=True):
+    with _receivingLock:
+        entry = _receiving.setdefault(filename, [threading.Lock(), 0])
+        entry[1] += 1
+    if entry[0].acquire(blocking):
+        return True
+    _releaseEntry(filename, entry)
+    return False
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION unlockName
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def unlockName(filename):
+    
+ARGUMENTS:
+    string filename : file a lockName call took the lock of
+
+RETURNS: void
+----------------------------------------------------------------------------------------------
+"""
+def unlockName(filename):
+    entry = _receiving[filename]
+    entry[0].release()
+    _releaseEntry(filename, entry)
+
+# 1 less thread using a name's lock, forgets the name once none are
+def _releaseEntry(filename, entry):
+    with _receivingLock:
+        entry[1] -= 1
+        if not entry[1]:
+            del _receiving[filename]
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION listFiles
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def listFiles():
+    
+ARGUMENTS: void
+
+RETURNS: list - names in ./files that can be transferred
+
+NOTES:
+    Same as os.listdir('./files'), minus dot files (partial transfers).
+----------------------------------------------------------------------------------------------
+"""
+def listFiles():
+    return [name for name in os.listdir('./files') if not name.startswith('.')]
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION isPattern
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def isPattern(name):
+    
+ARGUMENTS:
+    string name : filename or glob pattern
+
+RETURNS: bool - True if name has any GLOB_CHARS in it
+----------------------------------------------------------------------------------------------
+"""
+def isPattern(name):
+    return any(char in name for char in GLOB_CHARS)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION matchFiles
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def matchFiles(patterns, available=None):
+    
+ARGUMENTS:
+    list patterns : filenames and/or glob patterns, eg ['a.txt', '*.log']
+    list available : names of the files to match against, leave empty to list ./files
+
+RETURNS: list - names in ./files matching any pattern, in pattern order, each name once
+
+NOTES:
+    Plain names match only themselves, patterns are matched against listFiles with fnmatch, so
+    dot files (partial transfers, the blob store) are never picked up by a pattern.
+----------------------------------------------------------------------------------------------
+"""
+def matchFiles(patterns, available=None):
+    if available is None:
+        available = sorted(name for name in listFiles() if os.path.isfile('./files/' + name))
+    availableSet = set(available)
+    matched = {}
+    for pattern in patterns:
+        if isPattern(pattern):
+            matched.update(dict.fromkeys(fnmatch.filter(available, pattern)))
+        elif pattern in availableSet:
+            matched[pattern] = None
+    return list(matched)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendNameList
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendNameList(sendSocket, names):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send names to
+    list names : filenames or patterns to send
+
+RETURNS: void
+
+NOTES:
+    Sends each name as a data packet, then an empty data packet to end the list.
+    Sent on the data channel rather than in the cmd packet, so a list of any length fits.
+----------------------------------------------------------------------------------------------
+"""
+def sendNameList(sendSocket, names):
+    for name in names:
+        sendDataPacket(sendSocket, name)
+    sendDataPacket(sendSocket, '')
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION readNameList
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def readNameList(readSocket):
+    
+ARGUMENTS:
+    socket readSocket : socket to read from
+
+RETURNS: list - names read up to the empty data packet
+
+NOTES:
+    Counterpart to sendNameList.
+----------------------------------------------------------------------------------------------
+"""
+def readNameList(readSocket):
+    names = []
+    name = readDataPacket(readSocket)
+    while name:
+        names.append(name)
+        name = readDataPacket(readSocket)
+    return names
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendFiles
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendFiles(sendSocket, names, codec=None, verify=False, sparse=False):
+    
+ARGUMENTS:
+    socket sendSocket : socket to send the files to
+    list names : files in ./files to send
+    string codec : compression the receiver asked for, leave empty for plain transfers
+    bool verify : send each file's sha256 after it (see sendFile)
+    bool sparse : send each file as its data regions (see sendFile)
+
+RETURNS: int - number of files sent
+
+NOTES:
+    Streams a batch of files back to back on 1 connection, each 1 as
+        [filename data packet][file exactly as sendFile sends it]
+    followed by an empty data packet once every file is sent. No reply is waited for between
+    files, so a batch of small files costs 1 round trip instead of 1 per file.
+----------------------------------------------------------------------------------------------
+"""
+def sendFiles(sendSocket, names, codec=None, verify=False, sparse=False):
+    for name in names:
+        # corked until sendFile is done, so the name goes out with the file's first bytes
+        setCork(sendSocket, True)
+        sendDataPacket(sendSocket, name)
+        sendFile(sendSocket, name, 0, None, codec, hashlib.sha256() if verify else None, sparse)
+    sendDataPacket(sendSocket, '')
+    return len(names)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvFiles
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvFiles(recvSocket, compressed=False, verify=False, sparse=False):
+    
+ARGUMENTS:
+    socket recvSocket : socket to read the files from
+    bool compressed : True if the receiver asked for compression, so each file comes with a codec packet
+    bool verify : True if the receiver asked for verification, so each file is followed by its sha256
+    bool sparse : True if the receiver asked for sparse transfers, so each file comes as its data regions
+
+RETURNS: list - names of the files saved
+
+THROWS
+    RuntimeError if the sender sends a name that isn't a plain filename
+
+NOTES:
+    Counterpart to sendFiles, saves each file with recvFile until the empty name packet.
+    Names with a path in them are refused, so a batch can't write outside ./files.
+    If the sender disconnects part way, the files saved so far are kept and the broken 1
+    is left as a partial file, same as a broken GET/SEND.
+    A file that fails verification arrived whole, so it's discarded and the rest of the batch carries on.
+    Each file is received under its name's lock (see lockName), so it can't mix with another upload of it.
+----------------------------------------------------------------------------------------------
+"""
+def recvFiles(recvSocket, compressed=False, verify=False, sparse=False):
+    saved = []
+    name = readDataPacket(recvSocket)
+    while name:
+        if os.path.basename(name) != name or name.startswith('.'):
+            raise RuntimeError('recvFiles refused filename: ' + name)
+        lockName(name)
+        try:
+            if recvFile(recvSocket, name, 0, compressed, hashlib.sha256() if verify else None, sparse):
+                saved.append(name)
+            elif os.path.exists(partPath(name)):
                 break
-            file.write(chunk)
-            bytes_read += len(chunk)
-    print('File saved: /files/'+filename)
+        finally:
+            unlockName(name)
+        name = readDataPacket(recvSocket)
+    return saved
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION fileDigest
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def fileDigest(path):
+    
+ARGUMENTS:
+    string path : file to hash
+
+RETURNS: string - hex sha256 of the file's content
+
+NOTES:
+    Reads the file into 1 reused buffer, COMPRESS_CHUNK bytes at a time.
+----------------------------------------------------------------------------------------------
+"""
+def fileDigest(path):
+    digest = hashlib.sha256()
+    buffer = bytearray(COMPRESS_CHUNK)
+    view = memoryview(buffer)
+    with open(path, 'rb') as file:
+        while True:
+            bytes_read = file.readinto(buffer)
+            if not bytes_read:
+                break
+            digest.update(view[:bytes_read])
+    return digest.hexdigest()
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION resolveStreamCount
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def resolveStreamCount(requested, filesize):
+    
+ARGUMENTS:
+    int requested : number of streams asked for, 0 to auto-tune
+    int filesize : size of file to transfer
+
+RETURNS: int - number of data connections to split the file across, 1 to MAX_STREAMS
+
+NOTES:
+    Auto-tuning gives each stream about PARALLEL_RANGE_SIZE bytes, so small files stay on 1 connection
+    and big files get more. A file is never split into more ranges than it has bytes.
+----------------------------------------------------------------------------------------------
+"""
+def resolveStreamCount(requested, filesize):
+    if requested <= 0:
+        requested = -(-filesize // PARALLEL_RANGE_SIZE)
+    return max(1, min(requested, MAX_STREAMS, filesize))
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION planRanges
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def planRanges(filesize, count):
+    
+ARGUMENTS:
+    int filesize : size of file to split
+    int count : number of ranges
+
+RETURNS: list - count (offset, length) tuples covering the whole file, in order
+
+NOTES:
+    Splits a file into count contiguous ranges, sizes differ by at most 1 byte.
+----------------------------------------------------------------------------------------------
+"""
+def planRanges(filesize, count):
+    ranges = []
+    offset = 0
+    for i in range(count):
+        length = filesize // count + (1 if i < filesize % count else 0)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION sendFileParallel
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def sendFileParallel(sendSockets, filename, verify=False):
+    
+ARGUMENTS:
+    list sendSockets : connected data channel sockets, 1 per stream
+    string filename : file to read & send 
+    bool verify : send each range's sha256 after it
+
+RETURNS: void
+
+THROWS
+    RuntimeError if any stream fails
+
+NOTES:
+    Splits a file into 1 range per socket, and sends all ranges at the same time, 1 thread per socket.
+    Each socket carries
+        packet1 - [size of range str][offset length as str]
+                    3 bytes             N bytes
+    then the raw range bytes (see sendFileRange), and with verify the range's digest (see sendDigest).
+----------------------------------------------------------------------------------------------
+"""
+def sendFileParallel(sendSockets, filename, verify=False):
+    filesize = os.path.getsize('./files/'+filename)
+    ranges = planRanges(filesize, len(sendSockets))
+    _runStreams(_sendRange, [(sock, filename, offset, length, verify) for sock, (offset, length) in zip(sendSockets, ranges)])
+    log('File sent, bytes', filesize, 'over', len(sendSockets), 'streams')
+
+def _sendRange(sendSocket, filename, offset, length, verify):
+    digest = hashlib.sha256() if verify else None
+    sendDataPacket(sendSocket, '%d %d' % (offset, length))
+    with open('./files/'+filename, 'rb') as file:
+        sendFileRange(sendSocket, file, offset, length, digest)
+    if digest is not None:
+        sendDigest(sendSocket, digest)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION recvFileParallel
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def recvFileParallel(recvSockets, filename, filesize, verify=False):
+    
+ARGUMENTS:
+    list recvSockets : connected data channel sockets, 1 per stream
+    string filename : file to save
+    int filesize : total size of the file being received
+    bool verify : check each range against the digest the sender sends after it
+
+RETURNS: list - (bytes, seconds) for each stream
+
+THROWS
+    RuntimeError if any stream disconnects before its range is complete, its range fails verification, or
+                 the sender sends a range that isn't 1 of the file's
+
+NOTES:
+    Counterpart to sendFileParallel. Creates the partial file at its full size up front (posix_fallocate where the 
+    platform has it), then reads every stream at the same time, 1 thread per socket. Each thread
+    writes its range straight to its offset with pwrite, so streams never wait on each other.
+    Prints the throughput of each stream and of the whole transfer.
+
+    The partial file is renamed to filename once all ranges are in and verified, synced around the rename
+    like recvFile's. A preallocated partial file can't be resumed from (its size says nothing about what
+    arrived), so it's removed if any stream fails.
+
+    The ranges come from the sender, and a gap left by a missing or repeated 1 would be renamed into place
+    as preallocated zeros, which each range's own digest can't catch. So each stream's range has to be
+    1 of planRanges(filesize, streams) that no other stream has claimed yet. The streams aren't matched
+    to ranges by position, the extra connections can be accepted in any order.
+----------------------------------------------------------------------------------------------
+"""
+def recvFileParallel(recvSockets, filename, filesize, verify=False):
+    log('Sender\'s file size: ',filesize, 'streams:', len(recvSockets))
+    partName = partPath(filename)
+    fd = os.open(partName, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        preallocate(fd, 0, filesize)
+
+        start = time.monotonic()
+        planned = planRanges(filesize, len(recvSockets))
+        claimLock = threading.Lock()
+        stats = _runStreams(_recvRange, [(sock, fd, verify, planned, claimLock) for sock in recvSockets])
+        elapsed = time.monotonic() - start
+        if WRITE_BEHIND is not None:
+            WRITE_BEHIND.commit(fd)
+    except:
+        os.close(fd)
+        os.remove(partName)
+        raise
+    os.close(fd)
+    os.replace(partName, './files/'+filename)
+    if WRITE_BEHIND is not None:
+        WRITE_BEHIND.placed('./files/'+filename)
+
+    for i, (bytes_read, seconds) in enumerate(stats):
+        log('  stream %d: %d bytes, %.2f MB/s' % (i, bytes_read, bytes_read / max(seconds, 1e-9) / 1e6))
+    log('File saved: /files/'+filename, '%.2f MB/s total' % (filesize / max(elapsed, 1e-9) / 1e6))
+    return stats
+
+def _recvRange(recvSocket, fd, verify, planned, claimLock):
+    digest = hashlib.sha256() if verify else None
+    offset, length = map(int, readDataPacket(recvSocket).split())
+    # each planned range is taken by exactly 1 stream, so together they cover the file once
+    with claimLock:
+        if (offset, length) not in planned:
+            raise RuntimeError('recvFileParallel got range %d %d, not 1 of the file\'s' % (offset, length))
+        planned.remove((offset, length))
+    start = time.monotonic()
+    bytes_read = recvToFile(recvSocket, fd, offset, length, digest)
+    if bytes_read < length:
+        raise RuntimeError('recvFileParallel socket disconnected while reading!')
+    if digest is not None:
+        verified = checkDigest(recvSocket, digest)
+        if verified is None:
+            raise RuntimeError('recvFileParallel range at byte %d came without its digest' % offset)
+        if not verified:
+            raise RuntimeError('recvFileParallel range at byte %d failed verification' % offset)
+    return (bytes_read, time.monotonic() - start)
+
+"""
+----------------------------------------------------------------------------------------------
+FUNCTION _runStreams
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: def _runStreams(func, argsList):
+    
+ARGUMENTS:
+    function func : function to run for each stream
+    list argsList : argument tuple for each call of func, each tuple starts with the stream's socket
+
+RETURNS: list - return value of each call, in the same order as argsList
+
+THROWS
+    RuntimeError if any call raised
+
+NOTES:
+    Runs func once per stream, each on its own thread, and waits for all of them.
+    If 1 stream fails the others can't finish the file anyway, so all sockets are shut down
+    to wake up any thread still blocked on them.
+----------------------------------------------------------------------------------------------
+"""
+def _runStreams(func, argsList):
+    results = [None] * len(argsList)
+    errors = []
+
+    def run(i, args):
+        try:
+            results[i] = func(*args)
+        except Exception as e:
+            errors.append(e)
+            for otherArgs in argsList:
+                try:
+                    otherArgs[0].shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(argsList)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise RuntimeError('parallel transfer failed: ' + str(errors[0]))
+    return results
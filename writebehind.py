@@ -0,0 +1,381 @@
+import collections
+import configparser
+import os
+import threading
+import time
+
+"""
+------------------------------------------------------------------------------------------------------
+SOURCE FILE: writebehind.py - write-behind queue between the server's data channels & its disk
+
+PROGRAM: Tcp File Transfer Client Server
+
+DATE: Oct 18, 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+CLASSES:
+    WriteBehind(void)
+
+GLOBAL CONSTANTS:
+    int WRITER_THREADS=2 : threads writing queued blocks to disk, 0 writes every block in line like the client
+    int QUEUE_BYTES=67108864 : most received bytes waiting to be written, for all uploads together (64mb)
+    int BLOCK_SIZE=262144 : bytes per queued block
+    tuple DURABILITY=('none','close','periodic') : policies for when received files are synced to disk
+    float SYNC_INTERVAL=1.0 : seconds between fdatasyncs of a file being written, with periodic durability
+    WriteBehind writeBehind : the server's queue
+
+NOTES:
+    Without it, the thread receiving an upload also writes it, so a disk that stalls (a busy raid, a full
+    page cache being flushed) stalls the socket read too, and the client's upload with it. With it, the
+    receiving thread only fills a block from the socket, hashes it and queues it, and writer threads do the
+    pwrites. The socket keeps being read as long as there's room in the queue, so a slow moment of the disk
+    costs nothing until QUEUE_BYTES of uploads are waiting on it. Past that, receivers wait for room, so
+    memory stays bounded and tcp slows the clients down.
+
+    A receive returns once its own blocks are all written, so the file is complete when it's checked and
+    renamed into place, same as before.
+
+    Durability, when the bytes of a received file are forced to disk:
+        none - left to the kernel's write back, like any write (the default)
+        close - fsync once the file is complete & verified, before it's renamed over its name, and fsync
+                ./files after the rename, so a file that's under its name after a crash is whole and a
+                file that was saved is still under its name
+        periodic - fdatasync every SYNC_INTERVAL seconds while a file is being written, so a crash loses at
+                   most that much of a running upload, and once more when it's complete, so an upload
+                   shorter than that or the tail of a longer 1 is on disk too. Only what came in since the
+                   last sync is left to wait for at the end
+
+    Set in the config file's [writes] section (see WriteBehind.loadConfig), read on startup, eg
+        [writes]
+        threads = 4
+        queue_bytes = 268435456
+        durability = close
+    The queue's depth, stalls & syncs are in the server's metrics as 'writes'.
+-------------------------------------------------------------------------------------------------------
+"""
+
+WRITER_THREADS=2
+QUEUE_BYTES=67108864
+BLOCK_SIZE=262144
+DURABILITY=('none','close','periodic')
+SYNC_INTERVAL=1.0
+
+# fdatasync skips the metadata fsync writes, platforms without it (macos) get fsync
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+# the blocks of 1 receive that are queued or being written, & the first error writing them
+class _Pending:
+    def __init__(self, fd):
+        self.fd = fd
+        self.outstanding = 0
+        self.error = None
+        self.synced = time.monotonic()
+
+"""
+----------------------------------------------------------------------------------------------
+CLASS WriteBehind
+
+DATE: Oct 18 2026
+
+DESIGNER: agent
+
+PROGRAMMER: agent
+
+INTERFACE: class WriteBehind():
+
+NOTES:
+    Blocks come from a pool of QUEUE_BYTES / BLOCK_SIZE buffers, allocated as they're first needed & reused
+    after, so a busy server doesn't allocate per block and the pool is the queue's bound. 1 condition guards
+    the queue, the pool & the counters. Safe to use from several threads.
+----------------------------------------------------------------------------------------------
+"""
+class WriteBehind:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.blocks = collections.deque()
+        self.free = []
+        self.allocated = 0
+        self.threads = []
+        self.queuedBytes = 0
+        self.peakBytes = 0
+        self.writes = 0
+        self.writtenBytes = 0
+        self.writeSeconds = 0.0
+        self.syncs = 0
+        self.stalls = 0
+        self.stallSeconds = 0.0
+        self.errors = 0
+        self.configure()
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION configure
+
+    INTERFACE: def configure(self, threads=WRITER_THREADS, queueBytes=QUEUE_BYTES, durability='none', syncInterval=SYNC_INTERVAL):
+
+    ARGUMENTS:
+        int threads : writer threads, 0 to write in line
+        int queueBytes : most bytes queued at once, at least 1 block
+        string durability : one of DURABILITY
+        float syncInterval : seconds between syncs with periodic durability
+
+    RETURNS: void
+
+    THROWS
+        ValueError if a setting is out of range
+
+    NOTES:
+        Writer threads are started when first needed. Meant to be called before the server starts taking
+        uploads, the pool & threads don't shrink.
+    ----------------------------------------------------------------------------------------------
+    """
+    def configure(self, threads=WRITER_THREADS, queueBytes=QUEUE_BYTES, durability='none', syncInterval=SYNC_INTERVAL):
+        if threads < 0 or queueBytes < BLOCK_SIZE or syncInterval <= 0:
+            raise ValueError('writes needs threads >= 0, queue_bytes >= %d and sync_interval > 0' % BLOCK_SIZE)
+        if durability not in DURABILITY:
+            raise ValueError('durability must be one of ' + ', '.join(DURABILITY))
+        with self.cond:
+            self.threadCount = threads
+            self.capacity = queueBytes // BLOCK_SIZE
+            self.durability = durability
+            self.syncInterval = syncInterval
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION loadConfig
+
+    INTERFACE: def loadConfig(self, path):
+
+    ARGUMENTS:
+        string path : config file to read the [writes] section of
+
+    RETURNS: bool - True if the file was read
+
+    THROWS
+        ValueError if a setting isn't valid
+
+    NOTES:
+        Sets the queue to what's in the file, settings that aren't there keep their defaults.
+            [writes]
+            threads = <writer threads>          ; 0 to write in line
+            queue_bytes = <bytes>
+            durability = none | close | periodic
+            sync_interval = <seconds>
+    ----------------------------------------------------------------------------------------------
+    """
+    def loadConfig(self, path):
+        config = configparser.ConfigParser()
+        if not os.path.isfile(path):
+            self.configure()
+            return False
+        config.read(path)
+        section = config['writes'] if config.has_section('writes') else {}
+        self.configure(int(section.get('threads', WRITER_THREADS)), int(section.get('queue_bytes', QUEUE_BYTES)),
+                       section.get('durability', 'none'), float(section.get('sync_interval', SYNC_INTERVAL)))
+        return True
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION receive
+
+    INTERFACE: def receive(self, recvSocket, fd, offset, count, digest=None):
+
+    ARGUMENTS:
+        socket recvSocket : socket to read from
+        int fd : file descriptor opened for writing
+        int offset : where in the file the bytes go
+        int count : number of bytes to read
+        hash digest : hashlib object to feed the bytes to in the order they arrive, None for no hashing
+
+    RETURNS: int - bytes received & written, short if the sender disconnected part way.
+                   None if there are no writer threads, before anything was read, to write in line instead
+
+    THROWS
+        OSError if a block couldn't be written, once the blocks already queued are done
+
+    NOTES:
+        Counterpart to utils.recvToFile, which hands its big receives here on the server. Fills a block from
+        the socket at a time, so a block is only short at the end. Waits for every block it queued before
+        returning, even when it raises, so the caller can close fd right after.
+    ----------------------------------------------------------------------------------------------
+    """
+    def receive(self, recvSocket, fd, offset, count, digest=None):
+        if not self.threadCount:
+            return None
+        pending = _Pending(fd)
+        bytes_read = 0
+        try:
+            while bytes_read < count and pending.error is None:
+                buffer = self._take()
+                view = memoryview(buffer)[:min(BLOCK_SIZE, count - bytes_read)]
+                filled = 0
+                try:
+                    while filled < len(view):
+                        received = recvSocket.recv_into(view[filled:])
+                        if not received:
+                            break
+                        filled += received
+                except:
+                    self._give(buffer, 0)
+                    raise
+                if not filled:
+                    self._give(buffer, 0)
+                    break
+                if digest is not None:
+                    digest.update(view[:filled])
+                self._put(pending, buffer, offset + bytes_read, filled)
+                bytes_read += filled
+                if filled < len(view):
+                    break
+        finally:
+            with self.cond:
+                while pending.outstanding:
+                    self.cond.wait()
+        if pending.error is not None:
+            raise pending.error
+        return bytes_read
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION commit
+
+    INTERFACE: def commit(self, fd):
+
+    ARGUMENTS:
+        int fd : file descriptor of a received file that's complete & verified, before it's renamed into place
+
+    RETURNS: void
+
+    NOTES:
+        Syncs the file with close durability, and the bytes written since its last sync with periodic.
+        Nothing to do with none.
+    ----------------------------------------------------------------------------------------------
+    """
+    def commit(self, fd):
+        if self.durability == 'none':
+            return
+        if self.durability == 'close':
+            os.fsync(fd)
+        else:
+            _datasync(fd)
+        with self.cond:
+            self.syncs += 1
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION placed
+
+    INTERFACE: def placed(self, path):
+
+    ARGUMENTS:
+        string path : name a committed file was just renamed to
+
+    RETURNS: void
+
+    NOTES:
+        With close durability, fsyncs the directory path is in, so the rename itself survives a crash.
+        Without it the file's bytes can be on disk while its directory entry still names the old file.
+    ----------------------------------------------------------------------------------------------
+    """
+    def placed(self, path):
+        if self.durability != 'close':
+            return
+        fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self.cond:
+            self.syncs += 1
+
+    """
+    ----------------------------------------------------------------------------------------------
+    FUNCTION stats
+
+    INTERFACE: def stats(self):
+
+    RETURNS: dict - queue depth now & at its peak, blocks & bytes written, time spent writing, syncs,
+                    how often & how long receivers waited for room, for the metrics (see metrics.Metrics.addSource)
+    ----------------------------------------------------------------------------------------------
+    """
+    def stats(self):
+        with self.cond:
+            return {'threads': self.threadCount, 'queued_blocks': len(self.blocks), 'queued_bytes': self.queuedBytes,
+                    'peak_bytes': self.peakBytes, 'max_bytes': self.capacity * BLOCK_SIZE,
+                    'writes_total': self.writes, 'bytes_total': self.writtenBytes,
+                    'write_seconds_total': round(self.writeSeconds, 6), 'syncs_total': self.syncs,
+                    'stalls_total': self.stalls, 'stall_seconds_total': round(self.stallSeconds, 6),
+                    'errors_total': self.errors}
+
+    # a free block from the pool, waits for a writer to hand 1 back when the queue is full
+    def _take(self):
+        with self.cond:
+            if not self.free and self.allocated >= self.capacity:
+                self.stalls += 1
+                start = time.monotonic()
+                while not self.free:
+                    self.cond.wait()
+                self.stallSeconds += time.monotonic() - start
+            if self.free:
+                return self.free.pop()
+            self.allocated += 1
+        return bytearray(BLOCK_SIZE)
+
+    # hands a block back to the pool, length is what it had queued
+    def _give(self, buffer, length):
+        with self.cond:
+            self.free.append(buffer)
+            self.queuedBytes -= length
+            self.cond.notify_all()
+
+    # queues length bytes of buffer for position in pending's file, starting a writer if there aren't enough
+    def _put(self, pending, buffer, position, length):
+        with self.cond:
+            self.blocks.append((pending, buffer, position, length))
+            pending.outstanding += 1
+            self.queuedBytes += length
+            self.peakBytes = max(self.peakBytes, self.queuedBytes)
+            if len(self.threads) < self.threadCount:
+                thread = threading.Thread(target=self._write, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.cond.notify_all()
+
+    # writer thread, writes queued blocks forever
+    def _write(self):
+        while True:
+            with self.cond:
+                while not self.blocks:
+                    self.cond.wait()
+                pending, buffer, position, length = self.blocks.popleft()
+            start = time.monotonic()
+            synced = False
+            try:
+                if pending.error is None:
+                    view = memoryview(buffer)[:length]
+                    written = 0
+                    while written < length:
+                        written += os.pwrite(pending.fd, view[written:], position + written)
+                    if self.durability == 'periodic' and start - pending.synced >= self.syncInterval:
+                        pending.synced = start
+                        _datasync(pending.fd)
+                        synced = True
+            except OSError as e:
+                pending.error = pending.error or e
+            with self.cond:
+                if pending.error is None:
+                    self.writes += 1
+                    self.writtenBytes += length
+                    self.syncs += synced
+                else:
+                    self.errors += 1
+                self.writeSeconds += time.monotonic() - start
+                pending.outstanding -= 1
+                self.free.append(buffer)
+                self.queuedBytes -= length
+                self.cond.notify_all()
+
+writeBehind = WriteBehind()